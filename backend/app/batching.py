@@ -0,0 +1,106 @@
+"""batching.py
+
+Dynamic micro-batching for the API hot path.
+
+Requests that arrive within a short window (or until `max_batch_size` items are
+queued) are grouped and handed to a synchronous `handler` in one call on a
+worker thread, so the event loop is never blocked by the encoder and the model
+runs one forward pass per batch instead of one per request.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+
+class MicroBatcher:
+    """
+    Collect items submitted from coroutines and process them in batches.
+
+    Args:
+        handler: sync function taking a list of items and returning a list of
+            results of the same length (in the same order).
+        max_batch_size: flush as soon as this many items are queued.
+        max_wait_ms: flush at most this long after the first item of a batch arrived.
+    """
+
+    def __init__(self, handler: Callable[[List[Any]], List[Any]], max_batch_size: int = 32,
+                 max_wait_ms: float = 2.0):
+        self.handler = handler
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # a single worker keeps batches ordered; the model parallelises internally
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="encode-batcher")
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # fail anything still waiting so callers don't hang
+        while self._queue is not None and not self._queue.empty():
+            _, fut = self._queue.get_nowait()
+            if not fut.done():
+                fut.set_exception(RuntimeError("Batcher stopped"))
+
+    async def submit(self, item: Any) -> Any:
+        if not self.running:
+            raise RuntimeError("Batcher is not running; call start() first")
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, fut))
+        return await fut
+
+    async def _collect(self) -> list:
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            # drain whatever is already queued without waiting
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            items = [item for item, _ in batch]
+            try:
+                results = await loop.run_in_executor(self._executor, self.handler, items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"Batch handler returned {len(results)} results for {len(items)} items")
+            except asyncio.CancelledError:
+                for _, fut in batch:
+                    fut.cancel()
+                raise
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            for (_, fut), res in zip(batch, results):
+                # caller may have gone away (e.g. client disconnect)
+                if not fut.done():
+                    fut.set_result(res)
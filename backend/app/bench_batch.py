@@ -0,0 +1,63 @@
+"""bench_batch.py
+
+Throughput of POST /recommend/batch (NDJSON) versus the per-query POST /recommend
+loop used by generate_predictions.py. Runs the app in-process through FastAPI's
+TestClient; caches are disabled so both modes do the full encode + search work.
+
+Usage (from backend/app):
+    python bench_batch.py --input ../../data/test.csv --repeat 20
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import pandas as pd
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def per_query(client, queries, k):
+    n = 0
+    for q in queries:
+        r = client.post("/recommend", json={"query": q, "k": k})
+        r.raise_for_status()
+        n += len(r.json()["recommendations"])
+    return n
+
+
+def batched(client, queries, k, batch_size):
+    n = 0
+    for start in range(0, len(queries), batch_size):
+        with client.stream("POST", "/recommend/batch", json={"queries": queries[start:start + batch_size], "k": k}) as r:
+            r.raise_for_status()
+            for line in r.iter_lines():
+                if line:
+                    n += len(json.loads(line)["recommendations"])
+    return n
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", type=str, default="../../data/test.csv", help="CSV with a Query column")
+    parser.add_argument("--repeat", type=int, default=10, help="tile the query list this many times")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--with-cache", action="store_true", help="keep the embedding/response caches enabled")
+    args = parser.parse_args()
+
+    from app import main
+    if not args.with_cache:
+        main.EMBEDDING_CACHE.maxsize = 0
+        main.RESPONSE_CACHE.maxsize = 0
+    queries = pd.read_csv(args.input)["Query"].astype(str).tolist() * args.repeat
+    with TestClient(main.app) as client:
+        per_query(client, queries[:4], args.k)  # warm-up
+        for name, fn in (("per-query", lambda: per_query(client, queries, args.k)),
+                         ("batch/ndjson", lambda: batched(client, queries, args.k, args.batch_size))):
+            t0 = time.perf_counter()
+            n_recs = fn()
+            wall = time.perf_counter() - t0
+            print(f"{name:<13} queries={len(queries):<6} recs={n_recs:<7} "
+                  f"time={wall:7.2f}s  qps={len(queries) / wall:8.1f}")
@@ -0,0 +1,152 @@
+"""bench_catalogs.py
+
+Multi-catalog serving (catalogs.py): builds --catalogs synthetic catalog shards from an
+existing model_store (rows resampled + jittered up to --rows each, no encoder needed),
+then drives POST /recommend through FastAPI's TestClient with an LRU budget that holds
+--resident of them:
+- first-use (load) vs warm request latency per catalog
+- a skewed (Zipf) mix over all catalogs: hit / load counts, evictions, latency
+- fan-out over --fanout catalogs ("catalogs": [...]) vs a single catalog
+and prints the per-catalog load latency, eviction count and resident size from GET /catalogs.
+Response / embedding caches are disabled so every request encodes and searches.
+
+Usage (from backend/app):
+    python bench_catalogs.py --catalogs 8 --rows 50000 --resident 3 --requests 400
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+import faiss
+from index_backends import build_faiss_index
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def make_catalogs(model_dir, root, n_catalogs, rows, seed=0):
+    emb = np.load(os.path.join(model_dir, "embeddings.npy")).astype("float32")
+    meta = pd.read_csv(os.path.join(model_dir, "metadata.csv"))
+    with open(os.path.join(model_dir, "manifest.json")) as f:
+        model_name = json.load(f).get("model_name")
+    rng = np.random.default_rng(seed)
+    for c in range(n_catalogs):
+        pick = rng.integers(0, len(emb), rows)
+        X = emb[pick] + 0.05 * rng.normal(size=(rows, emb.shape[1])).astype("float32")
+        X /= np.linalg.norm(X, axis=1, keepdims=True)
+        out = os.path.join(root, f"cat{c}")
+        os.makedirs(out, exist_ok=True)
+        m = meta.iloc[pick].reset_index(drop=True)
+        m["url"] = m["url"].astype(str) + f"#cat{c}-" + pd.Series(range(rows)).astype(str)
+        m.to_csv(os.path.join(out, "metadata.csv"), index=False)
+        np.save(os.path.join(out, "embeddings.npy"), X)
+        index, desc = build_faiss_index(X, "flat")
+        faiss.write_index(index, os.path.join(out, "faiss.index"))
+        with open(os.path.join(out, "manifest.json"), "w") as f:
+            json.dump({"version": f"cat{c}", "model_name": model_name, "index": desc, "rows": rows}, f)
+
+
+def post(client, query, k, **body):
+    t0 = time.perf_counter()
+    r = client.post("/recommend", json=dict(body, query=query, k=k))
+    r.raise_for_status()
+    return (time.perf_counter() - t0) * 1000
+
+
+def pct(values):
+    v = np.asarray(values)
+    return f"p50={np.percentile(v, 50):8.2f}ms p95={np.percentile(v, 95):8.2f}ms (n={len(v)})"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model-dir", type=str, default="model_store")
+    parser.add_argument("--catalogs", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=50000, help="rows per catalog")
+    parser.add_argument("--resident", type=float, default=3, help="memory budget, in catalogs")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--fanout", type=int, default=3)
+    parser.add_argument("--zipf", type=float, default=1.2, help="skew of the catalog mix")
+    parser.add_argument("--queries", type=str, default=os.path.join("..", "..", "data", "test.csv"))
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="catalogs-")
+    try:
+        t0 = time.perf_counter()
+        make_catalogs(args.model_dir, root, args.catalogs, args.rows)
+        print(f"built {args.catalogs} catalogs x {args.rows} rows in {root} ({time.perf_counter() - t0:.1f}s)")
+        os.environ.update(RECOMMEND_CATALOG_ROOT=root, RECOMMEND_RESPONSE_CACHE_SIZE="0",
+                          RECOMMEND_EMBEDDING_CACHE_SIZE="0", RECOMMEND_QUERY_STORE="off")
+        if os.path.isdir(args.model_dir):
+            os.environ.setdefault("RECOMMEND_MODEL_STORE", os.path.abspath(args.model_dir))
+        from fastapi.testclient import TestClient
+        from app import main
+
+        queries = pd.read_csv(args.queries)["Query"].astype(str).tolist()
+        ids = [f"cat{c}" for c in range(args.catalogs)]
+        with TestClient(main.app) as client:
+            post(client, queries[0], args.k)  # encoder warm-up on the default catalog
+            # size one catalog, then budget for `resident` of them
+            main.CATALOGS.get(ids[0])
+            one = main.CATALOGS.stats()["catalogs"][ids[0]]["resident_bytes"]
+            main.CATALOGS.evict(ids[0])
+            main.CATALOGS.budget_bytes = int(args.resident * one)
+            print(f"~{one / 2**20:.1f} MB per catalog, budget {main.CATALOGS.budget_bytes / 2**20:.1f} MB "
+                  f"({args.resident:g} catalogs)")
+
+            cold, warm = [], []
+            for i, cid in enumerate(ids[:max(1, int(args.resident))]):
+                cold.append(post(client, queries[i % len(queries)], args.k, catalog=cid))
+                warm.extend(post(client, q, args.k, catalog=cid) for q in queries)
+            print(f"first request (loads catalog) {pct(cold)}")
+            print(f"warm request                  {pct(warm)}")
+
+            rng = np.random.default_rng(1)
+            weights = 1.0 / np.arange(1, args.catalogs + 1) ** args.zipf
+            mix = rng.choice(args.catalogs, args.requests, p=weights / weights.sum())
+            before = main.CATALOGS.stats()["catalogs"]
+            loads_before = sum(s["loads"] for s in before.values())
+            lat_hit, lat_load = [], []
+            for i, c in enumerate(mix):
+                resident = ids[c] in main.CATALOGS.stats()["loaded"]
+                (lat_hit if resident else lat_load).append(post(client, queries[i % len(queries)], args.k,
+                                                                 catalog=ids[c]))
+            stats = main.CATALOGS.stats()
+            loads = sum(s["loads"] for s in stats["catalogs"].values()) - loads_before
+            print(f"\nzipf({args.zipf}) mix over {args.catalogs} catalogs, {args.requests} requests: "
+                  f"{len(lat_hit)} resident, {loads} loads")
+            print(f"  resident catalog  {pct(lat_hit)}")
+            if lat_load:
+                print(f"  load on request   {pct(lat_load)}")
+
+            # the fanned-out catalogs must fit in the budget together, or every request reloads some
+            fan = ids[:args.fanout]
+            main.CATALOGS.budget_bytes = max(main.CATALOGS.budget_bytes, int((len(fan) + 0.5) * one))
+            for cid in fan:
+                main.CATALOGS.get(cid)
+            single = [post(client, q, args.k, catalog=fan[0]) for q in queries * 3]
+            fanned = [post(client, q, args.k, catalogs=fan) for q in queries * 3]
+            print(f"\nsingle catalog          {pct(single)}")
+            print(f"fan-out over {len(fan)} catalogs {pct(fanned)}")
+
+            stats = client.get("/catalogs").json()
+            print(f"\nresident {stats['resident_bytes'] / 2**20:.1f} / {stats['budget_bytes'] / 2**20:.1f} MB: "
+                  f"{', '.join(stats['loaded'])}")
+            print(f"{'catalog':<8} {'loads':>6} {'hits':>6} {'evict':>6} {'last load ms':>13} "
+                  f"{'mean load ms':>13} {'resident MB':>12} {'RSS +MB':>8}")
+            for cid in ids:
+                s = stats["catalogs"].get(cid)
+                if not s:
+                    continue
+                mean = s["total_load_seconds"] / s["loads"] * 1000 if s["loads"] else 0
+                rss = f"{s['rss_delta_bytes'] / 2**20:8.1f}" if s["rss_delta_bytes"] is not None else f"{'-':>8}"
+                print(f"{cid:<8} {s['loads']:>6} {s['hits']:>6} {s['evictions']:>6} "
+                      f"{(s['last_load_seconds'] or 0) * 1000:13.1f} {mean:13.1f} "
+                      f"{s['resident_bytes'] / 2**20:12.1f} {rss}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
@@ -0,0 +1,77 @@
+"""bench_client.py
+
+Throughput of the async client (recommend_client.py, generate_predictions.py --async)
+versus the serial one-request-at-a-time POST /recommend loop, over the test.csv
+queries repeated --repeat times. Against a running server with --url (start it with
+RECOMMEND_RESPONSE_CACHE_SIZE=0 RECOMMEND_EMBEDDING_CACHE_SIZE=0 RECOMMEND_QUERY_STORE=off
+so every request encodes and searches), otherwise in-process: serial through FastAPI's
+TestClient, async through the same app over ASGI, caches and query store disabled.
+
+Usage (from backend/app):
+    python bench_client.py --concurrency 1,4,16,64 --repeat 20
+    python bench_client.py --url http://localhost:8000 --concurrency 8,32
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import requests
+from recommend_client import RecommendClient
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def serial(post, queries, k):
+    latencies = []
+    t0 = time.perf_counter()
+    for q in queries:
+        t1 = time.perf_counter()
+        r = post("/recommend", json={"query": q, "k": k})
+        r.raise_for_status()
+        latencies.append(time.perf_counter() - t1)
+    return latencies, time.perf_counter() - t0
+
+
+def report(name, latencies, wall, baseline=None):
+    lat = np.asarray(latencies) * 1000
+    qps = len(lat) / wall
+    speedup = f"{qps / baseline:6.2f}x" if baseline else f"{'':>7}"
+    print(f"{name:<14} {qps:9.1f} {speedup} {np.percentile(lat, 50):8.1f} {np.percentile(lat, 95):8.1f} "
+          f"{np.percentile(lat, 99):8.1f}")
+    return qps
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", type=str, default=os.path.join("..", "..", "data", "test.csv"))
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--concurrency", type=str, default="1,4,16,64")
+    parser.add_argument("--url", type=str, help="running server; default is in-process")
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    queries = pd.read_csv(args.input)["Query"].astype(str).tolist() * args.repeat
+    print(f"{len(queries)} requests ({args.input} x {args.repeat}), {'server ' + args.url if args.url else 'in-process'}")
+    print(f"{'mode':<14} {'qps':>9} {'speedup':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    if args.url:
+        app = None
+        base = serial(lambda path, json: requests.post(args.url + path, json=json, timeout=30), queries, args.k)
+    else:
+        os.environ.setdefault("RECOMMEND_RESPONSE_CACHE_SIZE", "0")
+        os.environ.setdefault("RECOMMEND_EMBEDDING_CACHE_SIZE", "0")
+        os.environ.setdefault("RECOMMEND_QUERY_STORE", "off")
+        from fastapi.testclient import TestClient
+        from app.main import app
+        with TestClient(app) as client:
+            serial(client.post, queries[:10], args.k)  # warm-up
+            base = serial(client.post, queries, args.k)
+    baseline = report("serial", *base)
+    for c in (int(x) for x in args.concurrency.split(",")):
+        with RecommendClient(args.url or "", concurrency=c, app=app) as client:
+            client.fetch(queries[:2 * c], k=args.k)  # warm-up (+ app startup in-process)
+            client.latencies.clear()
+            client.elapsed = 0.0
+            client.fetch(queries, k=args.k)
+            report(f"async c={c}", client.latencies, client.elapsed, baseline)
@@ -0,0 +1,113 @@
+"""bench_encoders.py
+
+Compares query encoder backends (encoders.py: torch, torch-int8, onnx, onnx-int8)
+on the train.csv queries:
+- parity with the torch model: cosine similarity of the query embeddings and the
+  top-k overlap of the FAISS results they retrieve from model_store
+- single-query latency (p50/p95/p99) and batched throughput
+
+Exits with status 1 if a backend falls below --min-cosine or --min-overlap.
+
+Usage (from backend/app):
+    python bench_encoders.py --threads 4
+    python bench_encoders.py --backends torch,onnx-int8 --output bench_encoders.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from encoders import ENCODER_BACKENDS, ONNX_DIR, load_encoder
+from index_backends import load_index
+from snapshots import resolve_current
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+
+def encode(model, texts, batch_size=32):
+    return model.encode(texts, batch_size=batch_size, show_progress_bar=False,
+                        convert_to_numpy=True, normalize_embeddings=True).astype("float32")
+
+
+def latency(model, queries, repeat):
+    lat = []
+    for _ in range(repeat):
+        for q in queries:
+            t0 = time.perf_counter()
+            encode(model, [q])
+            lat.append(time.perf_counter() - t0)
+    lat = np.asarray(lat) * 1000
+    return {f"p{p}": float(np.percentile(lat, p)) for p in (50, 95, 99)}
+
+
+def throughput(model, queries, batch_size, min_texts=512):
+    texts = (queries * (min_texts // len(queries) + 1))[:max(min_texts, len(queries))]
+    t0 = time.perf_counter()
+    encode(model, texts, batch_size)
+    return len(texts) / (time.perf_counter() - t0)
+
+
+def topk_overlap(index, ref, emb, k):
+    _, a = index.search(ref, k)
+    _, b = index.search(emb, k)
+    return float(np.mean([len(set(x) & set(y)) / k for x, y in zip(a, b)]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", type=str, default=MODEL_NAME)
+    parser.add_argument("--backends", type=str, default=",".join(ENCODER_BACKENDS))
+    parser.add_argument("--threads", type=int, help="intra-op threads for every backend")
+    parser.add_argument("--queries", type=str, default=os.path.join("..", "..", "data", "train.csv"),
+                        help="CSV with a Query column")
+    parser.add_argument("--model-dir", type=str, default="model_store", help="index used for the top-k overlap")
+    parser.add_argument("--onnx-dir", type=str, default=ONNX_DIR, help="where ONNX exports are created/reused")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeat", type=int, default=5, help="passes over the queries for latency")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="parity threshold on the minimum cosine")
+    parser.add_argument("--min-overlap", type=float, default=0.9, help="parity threshold on mean top-k overlap")
+    parser.add_argument("--output", type=str, help="write the results as JSON")
+    args = parser.parse_args()
+
+    queries = list(dict.fromkeys(pd.read_csv(args.queries)["Query"].dropna().astype(str)))
+    index, _ = load_index(resolve_current(args.model_dir))
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    print(f"{len(queries)} queries, model {args.model}, threads={args.threads or 'default'}, k={args.k}")
+
+    ref = None
+    results = []
+    for backend in ["torch"] + [b for b in backends if b != "torch"]:
+        t0 = time.perf_counter()
+        model = load_encoder(args.model, backend=backend, threads=args.threads, onnx_dir=args.onnx_dir)
+        load_s = time.perf_counter() - t0
+        emb = encode(model, queries, args.batch_size)
+        if ref is None:
+            ref = emb
+        cos = (emb * ref).sum(axis=1)
+        row = {
+            "backend": backend,
+            "load_seconds": load_s,
+            "cosine_mean": float(cos.mean()),
+            "cosine_min": float(cos.min()),
+            "latency_ms": latency(model, queries, args.repeat),
+            "throughput_qps": throughput(model, queries, args.batch_size),
+        }
+        if index.d == emb.shape[1]:
+            row["topk_overlap"] = topk_overlap(index, ref, emb, min(args.k, index.ntotal))
+        row["parity_ok"] = row["cosine_min"] >= args.min_cosine and row.get("topk_overlap", 1.0) >= args.min_overlap
+        if backend in backends:
+            results.append(row)
+            overlap = f"{row['topk_overlap']:.3f}" if "topk_overlap" in row else "n/a"
+            print(f"{backend:<11} load={load_s:6.2f}s  cos mean={row['cosine_mean']:.5f} min={row['cosine_min']:.5f}  "
+                  f"top{args.k} overlap={overlap}  p50={row['latency_ms']['p50']:7.2f}ms  "
+                  f"p95={row['latency_ms']['p95']:7.2f}ms  {row['throughput_qps']:8.1f} q/s (batch {args.batch_size})"
+                  + ("" if row["parity_ok"] else "  PARITY FAIL"))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"model": args.model, "threads": args.threads, "k": args.k, "queries": len(queries),
+                       "thresholds": {"min_cosine": args.min_cosine, "min_overlap": args.min_overlap},
+                       "results": results}, f, indent=2)
+    sys.exit(0 if all(r["parity_ok"] for r in results) else 1)
@@ -0,0 +1,64 @@
+"""bench_filters.py
+
+Latency of filtered search (index_backends.search_filtered) across filter
+selectivities, against unfiltered search, on a synthetic catalog.
+
+Usage (from backend/app):
+    python bench_filters.py --rows 100000 --index flat
+    python bench_filters.py --rows 100000 --index hnsw
+"""
+import time
+import argparse
+import numpy as np
+from index_backends import build_faiss_index, search_filtered
+from embedding_store import Embeddings
+
+
+def timed(fn, queries):
+    lat = []
+    for q in queries:
+        t0 = time.perf_counter()
+        fn(q[None, :])
+        lat.append(time.perf_counter() - t0)
+    lat = np.asarray(lat) * 1000
+    return np.percentile(lat, 50), np.percentile(lat, 99)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--index", type=str, default="flat")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=15)
+    parser.add_argument("--brute-force-max", type=int, default=4096)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(args.rows, args.dim)).astype("float32")
+    X /= np.linalg.norm(X, axis=1, keepdims=True)
+    Q = X[rng.choice(args.rows, args.queries)] + 0.1 * rng.normal(size=(args.queries, args.dim)).astype("float32")
+    Q = (Q / np.linalg.norm(Q, axis=1, keepdims=True)).astype("float32")
+    index, desc = build_faiss_index(X, args.index)
+    emb = Embeddings(X)
+    print(f"{desc}, {args.rows} rows, k={args.k}")
+
+    p50, p99 = timed(lambda q: index.search(q, args.k), Q)
+    print(f"{'unfiltered':<18} p50={p50:7.3f}ms  p99={p99:7.3f}ms")
+    for selectivity in (1.0, 0.5, 0.1, 0.01, 0.001, 0.0001):
+        mask = rng.random(args.rows) < selectivity
+        allowed = np.flatnonzero(mask)
+        bitmap = np.packbits(mask, bitorder="little")
+        found = []
+
+        def run(q):
+            D, I = search_filtered(index, q, args.k, allowed, bitmap, embeddings=emb,
+                                   brute_force_max=args.brute_force_max)
+            found.append(I)
+
+        p50, p99 = timed(run, Q)
+        I = np.concatenate(found)
+        assert np.isin(I[I >= 0], allowed).all()
+        filled = (I >= 0).sum(axis=1).mean()
+        print(f"{selectivity:>8.2%} ({allowed.size:>7} rows) p50={p50:7.3f}ms  p99={p99:7.3f}ms  "
+              f"results/query={filled:.1f}")
@@ -0,0 +1,112 @@
+"""bench_lexical.py
+
+Lexical fast path + hybrid retrieval (lexical_index.py, RECOMMEND_RETRIEVAL=hybrid) versus
+dense-only, through POST /recommend (FastAPI TestClient, response / embedding caches and
+query store off).
+
+Traffic is a mix of short keyword queries (by default derived from the catalog's
+assessment names: their first one or two terms, e.g. "Core Java", "Automata") and the
+long natural-language queries of --queries, with --keyword-share of requests being keywords.
+Reports:
+- the fraction of requests answered from the lexical index without encoding
+- latency per request class in both modes, and the mean latency saved per request
+- Recall@k / MAP@k on --train, dense vs hybrid (same path as bench_retrieval.py)
+
+Usage (from backend/app):
+    python bench_lexical.py --requests 1000 --keyword-share 0.5
+    python bench_lexical.py --keywords my_keyword_queries.txt
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from bench_retrieval import DEFAULT_TRAIN, load_labeled, run_config
+from lexical_index import tokenize
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def catalog_keywords(names):
+    """Distinct 1- and 2-term prefixes of the assessment names."""
+    out = []
+    for name in names:
+        terms = tokenize(name)
+        out.extend(" ".join(terms[:n]) for n in (1, 2) if len(terms) >= n)
+    return list(dict.fromkeys(out))
+
+
+def post(client, query, k):
+    t0 = time.perf_counter()
+    r = client.post("/recommend", json={"query": query, "k": k})
+    r.raise_for_status()
+    return (time.perf_counter() - t0) * 1000
+
+
+def ms(values):
+    v = np.asarray(values)
+    if not len(v):
+        return f"{'-':>8} {'-':>8} {'-':>8}"
+    return f"{v.mean():8.2f} {np.percentile(v, 50):8.2f} {np.percentile(v, 95):8.2f}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=str, default=os.path.join("..", "..", "data", "test.csv"),
+                        help="CSV with a Query column (the long-query share of the traffic)")
+    parser.add_argument("--keywords", type=str, help="one keyword query per line (default: from catalog names)")
+    parser.add_argument("--train", type=str, default=DEFAULT_TRAIN)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--keyword-share", type=float, default=0.5)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    os.environ.update(RECOMMEND_RESPONSE_CACHE_SIZE="0", RECOMMEND_EMBEDDING_CACHE_SIZE="0",
+                      RECOMMEND_QUERY_STORE="off")
+    from fastapi.testclient import TestClient
+    from app import main
+
+    with TestClient(main.app) as client:
+        if main.SNAPSHOT.lexical is None:
+            sys.exit("The model store has no lexical_index.npz; rebuild it with build_index.py")
+        if args.keywords:
+            with open(args.keywords) as f:
+                keywords = [line.strip() for line in f if line.strip()]
+        else:
+            keywords = catalog_keywords(main.SNAPSHOT.metadata.assessment_name)
+        long_queries = pd.read_csv(args.queries)["Query"].dropna().astype(str).tolist()
+        rng = np.random.default_rng(0)
+        is_keyword = rng.random(args.requests) < args.keyword_share
+        traffic = [keywords[rng.integers(len(keywords))] if kw else long_queries[rng.integers(len(long_queries))]
+                   for kw in is_keyword]
+
+        main.RETRIEVAL = "hybrid"
+        fast = [main.lexical_hits([(q, args.k * main.OVERFETCH, None)])[0][0] is not None for q in traffic]
+        print(f"{args.requests} requests: {is_keyword.mean():.0%} keyword queries ({len(keywords)} distinct), "
+              f"rest from {args.queries}")
+        post(client, long_queries[0], args.k)  # encoder warm-up
+        latency = {}
+        for mode in ("dense", "hybrid"):
+            main.RETRIEVAL = mode
+            latency[mode] = np.array([post(client, q, args.k) for q in traffic])
+        fast = np.array(fast)
+        print(f"answered without encoding (hybrid): {fast.mean():.1%} of requests "
+              f"({fast[is_keyword].mean() if is_keyword.any() else 0:.1%} of keyword queries, "
+              f"{fast[~is_keyword].mean() if (~is_keyword).any() else 0:.1%} of long ones)")
+        print(f"\n{'requests':<24} {'mode':<7} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8}")
+        for label, sel in (("all", np.ones_like(fast)), ("lexical fast path", fast), ("encoded", ~fast)):
+            for mode in ("dense", "hybrid"):
+                print(f"{label:<24} {mode:<7} {ms(latency[mode][sel])}")
+        saved = latency["dense"].mean() - latency["hybrid"].mean()
+        per_fast = (latency["dense"][fast] - latency["hybrid"][fast]).mean() if fast.any() else 0.0
+        print(f"\nlatency saved: {saved:.2f}ms per request on average ({saved / latency['dense'].mean():.0%}), "
+              f"{per_fast:.2f}ms per fast-path request")
+
+        labeled = load_labeled(args.train)
+        print(f"\n{len(labeled)} labeled queries from {args.train}:")
+        for mode in ("dense", "hybrid"):
+            main.RETRIEVAL = mode
+            row = run_config(main, labeled, args.k, 1)
+            print(f"  {mode:<7} recall@{args.k}={row['recall_at_k']:.4f}  MAP@{args.k}={row['map_at_k']:.4f}  "
+                  f"without encoding={row['encoder_skipped']:.0%}")
@@ -0,0 +1,94 @@
+"""bench_long_queries.py
+
+Long-query encoding (long_queries.py): truncation vs chunk+pool vs token-budgeted chunking.
+- encode latency against input length (tokens), one query at a time
+- Recall@k of plain top-k retrieval on the train.csv queries for each mode
+
+Usage (from backend/app):
+    python bench_long_queries.py --budgets 256,512 --strip-boilerplate
+    python bench_long_queries.py --encoder-backend onnx --lengths 64,256,1024,4096
+"""
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from encoders import ENCODER_BACKENDS, load_encoder
+from long_queries import LongQueryEncoder
+from index_backends import load_index
+from snapshots import resolve_current
+from bench_retrieval import load_labeled, recall_at_k, normalize_url
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+
+def text_of_length(tokenizer, source, n_tokens):
+    """Prefix of `source` (repeated as needed) that is about n_tokens tokens long."""
+    ids = tokenizer(source, add_special_tokens=False, truncation=False)["input_ids"]
+    ids = (ids * (n_tokens // max(1, len(ids)) + 1))[:n_tokens]
+    return tokenizer.decode(ids)
+
+
+def median_ms(model, text, repeat):
+    lat = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        model.encode([text], batch_size=1, convert_to_numpy=True, normalize_embeddings=True)
+        lat.append(time.perf_counter() - t0)
+    return float(np.median(lat) * 1000)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", type=str, default=MODEL_NAME)
+    parser.add_argument("--encoder-backend", type=str, default="torch", choices=ENCODER_BACKENDS)
+    parser.add_argument("--threads", type=int)
+    parser.add_argument("--model-dir", type=str, default="model_store")
+    parser.add_argument("--train", type=str, default=os.path.join("..", "..", "data", "train.csv"))
+    parser.add_argument("--source", type=str, default=os.path.join("..", "..", "data", "test.csv"),
+                        help="CSV whose longest Query is used to build inputs of each length")
+    parser.add_argument("--lengths", type=str, default="32,128,256,512,1024,2048", help="input lengths in tokens")
+    parser.add_argument("--budgets", type=str, default="512", help="token budgets to compare")
+    parser.add_argument("--overlap", type=int, default=32)
+    parser.add_argument("--strip-boilerplate", action="store_true")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    base = load_encoder(args.model, backend=args.encoder_backend, threads=args.threads)
+    strip = args.strip_boilerplate
+    modes = {"truncate": LongQueryEncoder(base, "truncate", drop_boilerplate=strip) if strip else base,
+             "chunk": LongQueryEncoder(base, "chunk", overlap=args.overlap, drop_boilerplate=strip)}
+    for b in (int(x) for x in args.budgets.split(",")):
+        modes[f"budget{b}"] = LongQueryEncoder(base, "budget", token_budget=b, overlap=args.overlap,
+                                               drop_boilerplate=strip)
+    print(f"encoder {args.model} ({args.encoder_backend}), max_seq_length={base.max_seq_length}, "
+          f"overlap={args.overlap}, strip_boilerplate={strip}")
+
+    source = max(pd.read_csv(args.source)["Query"].dropna().astype(str), key=len)
+    lengths = [int(x) for x in args.lengths.split(",")]
+    print("\nencode latency (median ms) by input length")
+    print(f"{'tokens':>8} " + " ".join(f"{name:>12}" for name in modes))
+    for n in lengths:
+        text = text_of_length(base.tokenizer, source, n)
+        print(f"{n:>8} " + " ".join(f"{median_ms(m, text, args.repeat):12.2f}" for m in modes.values()))
+
+    model_dir = resolve_current(args.model_dir)
+    index, _ = load_index(model_dir)
+    urls = np.array([normalize_url(u) for u in pd.read_csv(os.path.join(model_dir, "metadata.csv"))["url"]])
+    labeled = load_labeled(args.train)
+    queries = [q for q, _ in labeled]
+    n_tokens = [len(base.tokenizer(q, add_special_tokens=False, truncation=False)["input_ids"]) for q in queries]
+    print(f"\nRecall@{args.k} on {len(queries)} train queries "
+          f"({sum(n > base.max_seq_length - 2 for n in n_tokens)} longer than the model window), plain top-k")
+    for name, model in modes.items():
+        t0 = time.perf_counter()
+        emb = model.encode(queries, batch_size=len(queries), convert_to_numpy=True,
+                           normalize_embeddings=True).astype("float32")
+        elapsed = time.perf_counter() - t0
+        if index.d != emb.shape[1]:
+            print(f"  {name:<12} index dim {index.d} != encoder dim {emb.shape[1]}; rebuild model_store with this model")
+            continue
+        _, I = index.search(emb, args.k)
+        recall = np.mean([recall_at_k(list(urls[ids[ids >= 0]]), rel, args.k) for ids, (_, rel) in zip(I, labeled)])
+        print(f"  {name:<12} recall@{args.k}={recall:.4f}  batch encode={elapsed * 1000:8.1f}ms")
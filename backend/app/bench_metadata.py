@@ -0,0 +1,97 @@
+"""bench_metadata.py
+
+Checks that the serving code's result assembly (main.build_recommendations over a
+MetadataStore, default test_type balancing) returns exactly what the previous pandas
+path (iloc/to_dict + balance_by_type + iterrows) returned, then times both per request.
+
+Usage (from backend/app):
+    python bench_metadata.py --trials 2000
+"""
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import pandas as pd
+from utils import balance_by_type
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def pandas_path(metadata, scores, idxs, k):
+    """The /recommend assembly before the columnar store (kept here as the reference)."""
+    results = []
+    for i, sc in zip(idxs, scores):
+        if i < 0:
+            continue
+        row = metadata.iloc[i].to_dict()
+        row['score'] = float(sc)
+        results.append(row)
+    if not results:
+        return []
+    df_res = pd.DataFrame(results)
+    df_balanced = balance_by_type(df_res, k=k)
+    if len(df_balanced) < k:
+        df_res_sorted = df_res.sort_values('score', ascending=False).head(k)
+    else:
+        df_res_sorted = df_balanced
+    return [{"assessment_name": str(r.get("assessment_name", "")), "url": str(r.get("url", "")),
+             "test_type": str(r.get("test_type", "")), "score": float(r.get("score", 0.0))}
+            for _, r in df_res_sorted.iterrows()]
+
+
+def columnar_path(main, snap, scores, idxs, k):
+    """What /recommend runs: main.build_recommendations with the default balance re-ranking."""
+    return main.build_recommendations(scores, idxs, k, snap, rerank=("balance", main.MMR_LAMBDA))
+
+
+def random_catalog(rng, n):
+    types = np.array(["K", "P", "A", "S", None], dtype=object)
+    return pd.DataFrame({
+        "assessment_name": [f"Assessment {i}" for i in range(n)],
+        "url": [f"https://example.com/{i}" for i in range(n)],
+        "description": "",
+        "test_type": rng.choice(types, size=n, p=[0.3, 0.3, 0.1, 0.1, 0.2]),
+    })
+
+
+def random_hits(rng, n_rows, k):
+    n = k * 3
+    idxs = rng.choice(n_rows, size=n, replace=False).astype(np.int64)
+    scores = np.sort(rng.random(n).astype(np.float32))[::-1]
+    if rng.random() < 0.1:
+        idxs[-rng.integers(1, n):] = -1  # FAISS pads with -1 when the index has fewer rows
+    return scores, idxs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--trials", type=int, default=2000)
+    parser.add_argument("--rows", type=int, default=500, help="rows in the synthetic catalog")
+    parser.add_argument("--metadata", type=str, default="model_store/metadata.csv")
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    os.environ.pop("RECOMMEND_MIN_SCORE", None)  # the pandas reference has no score threshold
+    from app import main
+    from app.metadata_store import MetadataStore
+    from app.snapshots import ModelSnapshot
+
+    catalogs = {"synthetic": random_catalog(rng, args.rows), "model_store": pd.read_csv(args.metadata)}
+    for name, df in catalogs.items():
+        snap = ModelSnapshot(version=name, path="", index=None, metadata=MetadataStore(df), embeddings=None)
+        hits = [random_hits(rng, len(df), int(rng.integers(1, 11))) for _ in range(args.trials)]
+        ks = [len(i) // 3 for _, i in hits]
+        for (scores, idxs), k in zip(hits, ks):
+            expected = pandas_path(df, scores, idxs, k)
+            got = columnar_path(main, snap, scores, idxs, k)
+            assert got == expected, f"mismatch on {name}: {got} != {expected}"
+        timings = {}
+        for label, fn in (("pandas", lambda s, i, k: pandas_path(df, s, i, k)),
+                          ("columnar", lambda s, i, k: columnar_path(main, snap, s, i, k))):
+            t0 = time.perf_counter()
+            for (scores, idxs), k in zip(hits, ks):
+                fn(scores, idxs, k)
+            timings[label] = (time.perf_counter() - t0) / len(hits) * 1e6
+        print(f"{name:<12} {args.trials} trials match; per request: pandas={timings['pandas']:.1f}us "
+              f"columnar={timings['columnar']:.1f}us ({timings['pandas'] / timings['columnar']:.0f}x)")
@@ -0,0 +1,93 @@
+"""bench_metrics.py
+
+Overhead of the latency instrumentation in metrics.py: per-call cost of
+stage() / Histogram.observe / Counter.inc (recording on and off, single- and
+multi-threaded), and the resulting per-request cost of /recommend's
+instrumentation next to a FAISS flat search for scale.
+
+Usage (from backend/app):
+    python bench_metrics.py --calls 200000 --threads 4
+"""
+import time
+import argparse
+import threading
+import numpy as np
+import faiss
+import metrics
+from metrics import Registry, stage
+
+# instrumentation per /recommend request (cache miss): stage() around encode, search,
+# balance, metadata, serialize; requests counter; request histogram
+STAGES_PER_REQUEST = 5
+OPS_PER_REQUEST = 2
+
+
+def per_call_ns(fn, calls):
+    t0 = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - t0) / calls * 1e9
+
+
+def threaded_ns(fn, calls, threads):
+    def work():
+        for _ in range(calls):
+            fn()
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    t0 = time.perf_counter()
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+    return (time.perf_counter() - t0) / (calls * threads) * 1e9
+
+
+def with_stage():
+    with stage("bench"):
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200000)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--rows", type=int, default=10000, help="flat index size for the reference search")
+    parser.add_argument("--dim", type=int, default=384)
+    args = parser.parse_args()
+
+    registry = Registry()
+    hist = registry.histogram("bench_seconds", "bench", ("stage",))
+    counter = registry.counter("bench_total", "bench", ("endpoint",))
+    ops = {
+        "empty loop": lambda: None,
+        "stage()": with_stage,
+        "Histogram.observe": lambda: hist.observe(0.0012, ("encode",)),
+        "Counter.inc": lambda: counter.inc(("recommend",)),
+    }
+    results = {}
+    for enabled in (True, False):
+        metrics.set_enabled(enabled)
+        for name, fn in ops.items():
+            ns = per_call_ns(fn, args.calls)
+            results[(name, enabled)] = ns
+            print(f"{name:<18} recording={'on ' if enabled else 'off'}  {ns:8.1f} ns/call")
+    metrics.set_enabled(True)
+    for name in ("stage()", "Histogram.observe"):
+        ns = threaded_ns(ops[name], args.calls // args.threads, args.threads)
+        print(f"{name:<18} {args.threads} threads      {ns:8.1f} ns/call (wall / total calls)")
+
+    base = results[("empty loop", True)]
+    per_request_us = (STAGES_PER_REQUEST * (results[("stage()", True)] - base)
+                      + OPS_PER_REQUEST * (results[("Histogram.observe", True)] - base)) / 1000
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(args.rows, args.dim)).astype("float32")
+    index = faiss.IndexFlatIP(args.dim)
+    index.add(X)
+    q = X[:1].copy()
+    search_us = per_call_ns(lambda: index.search(q, 15), 200) / 1000
+    print(f"\nper /recommend request: ~{per_request_us:.2f} us of instrumentation "
+          f"vs {search_us:.1f} us for one flat search over {args.rows} rows "
+          f"({per_request_us / search_us:.2%} of the search alone, before encoding)")
+    print(f"render of {len(hist.snapshot())} series: "
+          f"{per_call_ns(registry.render, 1000) / 1000:.1f} us per /metrics scrape")
@@ -0,0 +1,84 @@
+"""bench_recommend.py
+
+Load benchmark for POST /recommend: compares the micro-batched encode path with
+the per-request path under concurrent load. Runs the app in-process (no server
+needed) through httpx's ASGI transport, or against a running server with --url.
+In-process, the response / embedding caches and the query store are disabled
+(--with-cache keeps them) so every request encodes and searches.
+
+Usage (from backend/app):
+    python bench_recommend.py --concurrency 32 --requests 512
+    python bench_recommend.py --url http://127.0.0.1:8000 --concurrency 32
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import numpy as np
+import pandas as pd
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_QUERIES = os.path.join("..", "..", "data", "test.csv")
+
+
+def summarize(name, latencies, wall):
+    lat = np.asarray(latencies) * 1000.0
+    print(f"{name:<14} n={len(lat):<6} qps={len(lat) / wall:8.1f}  "
+          f"p50={np.percentile(lat, 50):7.1f}ms  p95={np.percentile(lat, 95):7.1f}ms  "
+          f"p99={np.percentile(lat, 99):7.1f}ms")
+
+
+async def run_load(client, queries, n_requests, concurrency, k):
+    sem = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with sem:
+            t0 = time.perf_counter()
+            r = await client.post("/recommend", json={"query": queries[i % len(queries)], "k": k})
+            r.raise_for_status()
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n_requests)))
+    return latencies, time.perf_counter() - t0
+
+
+async def bench_in_process(queries, args):
+    from app import main
+    if not args.with_cache:
+        main.EMBEDDING_CACHE.maxsize = 0
+        main.RESPONSE_CACHE.maxsize = 0
+        main.QUERY_STORE = None
+    for name, batching in (("per-request", False), ("micro-batched", True)):
+        main.BATCHING_ENABLED = batching
+        async with main.app.router.lifespan_context(main.app):
+            transport = httpx.ASGITransport(app=main.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+                await run_load(client, queries, min(len(queries), 8), 1, args.k)  # warm-up
+                latencies, wall = await run_load(client, queries, args.requests, args.concurrency, args.k)
+        summarize(name, latencies, wall)
+
+
+async def bench_url(queries, args):
+    async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+        latencies, wall = await run_load(client, queries, args.requests, args.concurrency, args.k)
+    summarize(args.url, latencies, wall)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=str, default=DEFAULT_QUERIES, help="CSV with a Query column")
+    parser.add_argument("--url", type=str, help="benchmark a running server instead of the in-process app")
+    parser.add_argument("--requests", type=int, default=512)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--with-cache", action="store_true",
+                        help="keep the embedding/response caches and the query store enabled (in-process)")
+    args = parser.parse_args()
+    queries = pd.read_csv(args.queries)["Query"].astype(str).tolist()
+    print(f"{args.requests} requests, concurrency={args.concurrency}, {len(queries)} distinct queries")
+    asyncio.run(bench_url(queries, args) if args.url else bench_in_process(queries, args))
@@ -0,0 +1,270 @@
+"""bench_retrieval.py
+
+Retrieval quality + latency benchmark on the labeled train set. Queries are
+replayed through the same encode -> search -> balance path as POST /recommend
+(main.retrieve + main.build_recommendations) for every combination of index type,
+retrieval (dense, or hybrid BM25 + dense with the lexical fast path), over-fetch
+factor (candidates = k * overfetch), min_score and re-ranking (balance, mmr at
+each --mmr-lambda, none).
+
+Per configuration it reports Mean Recall@k, MAP@k, per-query latency
+(p50/p95/p99), both end to end (query embedding cache cleared) and for
+search + ranking alone (embedding cached), and the fraction of queries the
+lexical fast path answered without the encoder. Results are written as JSON.
+The query store (query_store.py) is off unless --query-store is given, so end
+to end latency includes encoding; the report records which was used.
+With --baseline the run is compared against an earlier JSON (refused if it
+differs in query store use) and exits with status 1 if recall/MAP drop or p95
+latency grows beyond the thresholds.
+
+Usage (from backend/app):
+    python bench_retrieval.py --output bench_retrieval.json
+    python bench_retrieval.py --index current,flat,hnsw --overfetch 1,2,3,5 --min-score none,0.2,0.3
+    python bench_retrieval.py --overfetch 3,10 --min-score none --rerank balance,mmr --mmr-lambda 0.5,0.7,0.9
+    python bench_retrieval.py --retrieval dense,hybrid --overfetch 3 --min-score none
+    python bench_retrieval.py --baseline bench_retrieval.json --output bench_retrieval_new.json
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import dataclasses
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_TRAIN = os.path.join("..", "..", "data", "train.csv")
+
+
+def normalize_url(url) -> str:
+    return str(url).strip().rstrip("/").lower()
+
+
+def load_labeled(path):
+    """[(query, set of relevant urls)] in first-seen query order."""
+    df = pd.read_csv(path)
+    if not {"Query", "Assessment_url"}.issubset(df.columns):
+        raise ValueError("Train CSV must have 'Query' and 'Assessment_url' columns")
+    df = df.dropna(subset=["Query", "Assessment_url"])
+    grouped = df.groupby(df["Query"].astype(str).str.strip(), sort=False)["Assessment_url"]
+    return [(q, {normalize_url(u) for u in urls}) for q, urls in grouped]
+
+
+def recall_at_k(predicted, relevant, k):
+    return len(set(predicted[:k]) & relevant) / len(relevant)
+
+
+def average_precision_at_k(predicted, relevant, k):
+    hits, total = 0, 0.0
+    for i, url in enumerate(predicted[:k]):
+        if url in relevant and url not in predicted[:i]:
+            hits += 1
+            total += hits / (i + 1)
+    return total / min(k, len(relevant))
+
+
+def percentiles(seconds):
+    ms = np.asarray(seconds) * 1000.0
+    return {f"p{p}": float(np.percentile(ms, p)) for p in (50, 95, 99)}
+
+
+def parse_list(value, cast):
+    return [None if v.strip().lower() == "none" else cast(v) for v in value.split(",") if v.strip()]
+
+
+def snapshot_variants(main, specs, nprobe=None, ef_search=None):
+    """(name, snapshot) per index spec; "current" is the served index, others are rebuilt from embeddings."""
+    from app.index_backends import index_from_embeddings, configure_search
+    base = main.SNAPSHOT
+    for spec in specs:
+        if spec == "current":
+            yield spec, base
+            continue
+        if base.embeddings is None:
+            raise RuntimeError(f"Cannot build a {spec!r} index: the model store has no embeddings.npy")
+        t0 = time.perf_counter()
+        index, desc = index_from_embeddings(base.embeddings, spec)
+        configure_search(index, nprobe=nprobe, ef_search=ef_search)
+        print(f"built {spec} ({desc}) in {time.perf_counter() - t0:.2f}s")
+        yield spec, dataclasses.replace(base, index=index, version=f"{base.version}+{spec}")
+
+
+def run_config(main, labeled, k, repeat):
+    """Quality and latency of the currently configured main.RETRIEVAL / OVERFETCH / MIN_SCORE / RERANK / SNAPSHOT."""
+    recalls, aps, e2e, search, skipped = [], [], [], [], 0
+    for q, relevant in labeled:
+        for _ in range(repeat):
+            main.EMBEDDING_CACHE.clear()
+            t0 = time.perf_counter()
+            scores, idxs, snap, timings = main.retrieve([(q, k * main.OVERFETCH, None)])[0]
+            recs = main.build_recommendations(scores, idxs, k, snap)
+            e2e.append(time.perf_counter() - t0)
+            # embedding now cached: search + ranking only
+            t0 = time.perf_counter()
+            scores, idxs, snap, _ = main.retrieve([(q, k * main.OVERFETCH, None)])[0]
+            main.build_recommendations(scores, idxs, k, snap)
+            search.append(time.perf_counter() - t0)
+        skipped += "search" not in timings  # lexical fast path: no encode, no FAISS search
+        predicted = [normalize_url(rec["url"]) for rec in recs]
+        recalls.append(recall_at_k(predicted, relevant, k))
+        aps.append(average_precision_at_k(predicted, relevant, k))
+    return {
+        "recall_at_k": float(np.mean(recalls)),
+        "map_at_k": float(np.mean(aps)),
+        "encoder_skipped": skipped / len(labeled),
+        "latency_ms": percentiles(e2e),
+        "search_latency_ms": percentiles(search),
+    }
+
+
+def config_key(row):
+    # reports written before the rerank / retrieval axes existed were all balance + dense
+    return (row["index"], row.get("retrieval", "dense"), row["overfetch"], row["min_score"],
+            row.get("rerank", "balance"), row.get("mmr_lambda"))
+
+
+def find_regressions(results, baseline, thresholds):
+    """Configurations that got worse than in `baseline` by more than the thresholds."""
+    before = {config_key(r): r for r in baseline.get("results", [])}
+    out = []
+    for row in results:
+        old = before.get(config_key(row))
+        if old is None:
+            continue
+        problems = []
+        for metric, limit in (("recall_at_k", thresholds["max_recall_drop"]), ("map_at_k", thresholds["max_map_drop"])):
+            if old[metric] - row[metric] > limit:
+                problems.append(f"{metric} {old[metric]:.4f} -> {row[metric]:.4f}")
+        old_p95, new_p95 = old["latency_ms"]["p95"], row["latency_ms"]["p95"]
+        if (new_p95 > old_p95 * (1 + thresholds["max_p95_increase"])
+                and new_p95 - old_p95 > thresholds["min_p95_increase_ms"]):
+            problems.append(f"p95 latency {old_p95:.2f}ms -> {new_p95:.2f}ms")
+        if problems:
+            out.append({"index": row["index"], "retrieval": row["retrieval"], "overfetch": row["overfetch"],
+                        "min_score": row["min_score"],
+                        "rerank": row["rerank"], "mmr_lambda": row["mmr_lambda"], "problems": problems})
+    return out
+
+
+def run(args):
+    from app import main
+    if args.model_store:
+        main.MODEL_STORE = os.path.abspath(args.model_store)
+    if not args.query_store:
+        main.QUERY_STORE = None
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        # reports written before the query store existed never used it
+        used = main.QUERY_STORE is not None
+        if bool(baseline.get("query_store", False)) != used:
+            raise SystemExit(f"{args.baseline} was run {'without' if used else 'with'} the query store, this run "
+                             f"{'with' if used else 'without'}: end to end latencies are not comparable")
+    main.activate_snapshot(main.load_current_snapshot())
+    main.warmup()
+    labeled = load_labeled(args.train)
+    print(f"{len(labeled)} labeled queries from {args.train}, snapshot {main.SNAPSHOT.version}, k={args.k}")
+
+    # encoder alone, for reference
+    encode = []
+    for q, _ in labeled:
+        t0 = time.perf_counter()
+        main.EMBEDDER.encode([q], convert_to_numpy=True, normalize_embeddings=True)
+        encode.append(time.perf_counter() - t0)
+
+    base, defaults = main.SNAPSHOT, (main.OVERFETCH, main.MIN_SCORE, main.RERANK, main.MMR_LAMBDA, main.RETRIEVAL)
+    reranks = [(mode, lam) for mode in (m.strip() for m in args.rerank.split(",") if m.strip())
+               for lam in (parse_list(args.mmr_lambda, float) if mode == "mmr" else [None])]
+    results = []
+    for name, snap in snapshot_variants(main, parse_list(args.index, str), args.nprobe, args.ef_search):
+        main.activate_snapshot(snap)
+        for retrieval in (m.strip() for m in args.retrieval.split(",") if m.strip()):
+            for overfetch in parse_list(args.overfetch, int):
+                for min_score in parse_list(args.min_score, float):
+                    for rerank, lam in reranks:
+                        main.RETRIEVAL, main.OVERFETCH, main.MIN_SCORE = retrieval, overfetch, min_score
+                        main.RERANK, main.MMR_LAMBDA = rerank, lam if lam is not None else defaults[3]
+                        row = {"index": name, "retrieval": retrieval, "overfetch": overfetch,
+                               "min_score": min_score, "rerank": rerank, "mmr_lambda": lam}
+                        row.update(run_config(main, labeled, args.k, args.repeat))
+                        results.append(row)
+                        label = rerank if lam is None else f"{rerank}({lam:g})"
+                        print(f"{name:<8} {retrieval:<6} overfetch={overfetch:<3} min_score={str(min_score):<5} "
+                              f"{label:<10} recall@{args.k}={row['recall_at_k']:.4f}  "
+                              f"MAP@{args.k}={row['map_at_k']:.4f}  p50={row['latency_ms']['p50']:7.2f}ms  "
+                              f"p95={row['latency_ms']['p95']:7.2f}ms  "
+                              f"search p95={row['search_latency_ms']['p95']:6.3f}ms  "
+                              f"no-encode={row['encoder_skipped']:.0%}")
+    main.OVERFETCH, main.MIN_SCORE, main.RERANK, main.MMR_LAMBDA, main.RETRIEVAL = defaults
+    main.activate_snapshot(base)
+
+    thresholds = {
+        "max_recall_drop": args.max_recall_drop,
+        "max_map_drop": args.max_map_drop,
+        "max_p95_increase": args.max_p95_increase,
+        "min_p95_increase_ms": args.min_p95_increase_ms,
+    }
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "train": os.path.abspath(args.train),
+        "snapshot": main.SNAPSHOT.version,
+        "model_name": main.EMBED_MODEL_NAME,
+        "k": args.k,
+        "queries": len(labeled),
+        "repeat": args.repeat,
+        "query_store": main.QUERY_STORE is not None,
+        "serving_defaults": {"index": "current", "overfetch": defaults[0], "min_score": defaults[1],
+                             "rerank": defaults[2], "mmr_lambda": defaults[3], "retrieval": defaults[4]},
+        "encoder_latency_ms": percentiles(encode),
+        "thresholds": thresholds,
+        "results": results,
+        "best": max(results, key=lambda r: (r["recall_at_k"], r["map_at_k"], -r["latency_ms"]["p95"])),
+        "regressions": [],
+    }
+    if baseline is not None:
+        report["baseline"] = os.path.abspath(args.baseline)
+        report["regressions"] = find_regressions(results, baseline, thresholds)
+    report["passed"] = not report["regressions"]
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    best = report["best"]
+    print(f"best: index={best['index']} retrieval={best['retrieval']} overfetch={best['overfetch']} min_score={best['min_score']} "
+          f"rerank={best['rerank']} mmr_lambda={best['mmr_lambda']} recall@{args.k}={best['recall_at_k']:.4f}")
+    for reg in report["regressions"]:
+        print(f"REGRESSION index={reg['index']} retrieval={reg['retrieval']} overfetch={reg['overfetch']} min_score={reg['min_score']} "
+              f"rerank={reg['rerank']} mmr_lambda={reg['mmr_lambda']}: " + "; ".join(reg["problems"]))
+    print(f"Wrote {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--train", type=str, default=DEFAULT_TRAIN, help="CSV with Query and Assessment_url columns")
+    parser.add_argument("--model-store", type=str, help="model_store to serve from (default: the API's)")
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--index", type=str, default="current",
+                        help="comma-separated index specs; 'current' is the served index, others are rebuilt "
+                             "from embeddings.npy (flat, ivf, hnsw, ivfpq, opq, ...)")
+    parser.add_argument("--retrieval", type=str, default="dense", help="comma-separated: dense, hybrid")
+    parser.add_argument("--overfetch", type=str, default="1,2,3,5", help="comma-separated candidate multipliers")
+    parser.add_argument("--min-score", type=str, default="none,0.2,0.3,0.4", help="comma-separated thresholds; none = off")
+    parser.add_argument("--rerank", type=str, default="balance", help="comma-separated: balance, mmr, none")
+    parser.add_argument("--mmr-lambda", type=str, default="0.7", help="comma-separated MMR relevance weights")
+    parser.add_argument("--nprobe", type=int, help="IVF lists to visit for rebuilt IVF/PQ indexes")
+    parser.add_argument("--ef-search", type=int, help="HNSW search depth for rebuilt HNSW indexes")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per query")
+    parser.add_argument("--query-store", action="store_true",
+                        help="keep the query store on (queries it holds skip the encoder in the end to end latency)")
+    parser.add_argument("--output", type=str, default="bench_retrieval.json")
+    parser.add_argument("--baseline", type=str, help="earlier bench_retrieval.json to check for regressions")
+    parser.add_argument("--max-recall-drop", type=float, default=0.0, help="allowed absolute drop in Recall@k")
+    parser.add_argument("--max-map-drop", type=float, default=0.0, help="allowed absolute drop in MAP@k")
+    parser.add_argument("--max-p95-increase", type=float, default=0.25, help="allowed relative p95 latency increase")
+    parser.add_argument("--min-p95-increase-ms", type=float, default=1.0,
+                        help="p95 increases below this many ms are treated as noise")
+    args = parser.parse_args()
+    report = run(args)
+    sys.exit(0 if report["passed"] else 1)
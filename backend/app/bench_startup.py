@@ -0,0 +1,75 @@
+"""bench_startup.py
+
+Startup-time benchmark:
+- wall time of `python <script> --help` for each CLI entry point (import cost before any work)
+- `uvicorn app.main:app`: time until /health/live answers and until /health/ready is 200
+
+Usage (from backend/app):
+    python bench_startup.py --repeat 3
+    RECOMMEND_WARMUP=background python bench_startup.py
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import subprocess
+import statistics
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CLI_SCRIPTS = ["build_index.py", "search_index.py", "generate_predictions_local.py", "generate_predictions.py"]
+
+
+def time_cli(script):
+    t0 = time.perf_counter()
+    subprocess.run([sys.executable, script, "--help"], cwd=HERE, check=True,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - t0
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_uvicorn(timeout=300):
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port)],
+                            cwd=os.path.dirname(HERE), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    live = ready = None
+    try:
+        while time.perf_counter() - t0 < timeout and ready is None:
+            if proc.poll() is not None:
+                raise RuntimeError("uvicorn exited during startup")
+            try:
+                if live is None and requests.get(base + "/health/live", timeout=1).ok:
+                    live = time.perf_counter() - t0
+                if live is not None and requests.get(base + "/health/ready", timeout=1).status_code == 200:
+                    ready = time.perf_counter() - t0
+            except requests.RequestException:
+                pass
+            time.sleep(0.05)
+    finally:
+        proc.terminate()
+        proc.wait()
+    return live, ready
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-server", action="store_true")
+    args = parser.parse_args()
+
+    for script in CLI_SCRIPTS:
+        times = [time_cli(script) for _ in range(args.repeat)]
+        print(f"{script + ' --help':<42} median={statistics.median(times):6.2f}s  min={min(times):6.2f}s")
+    if not args.skip_server:
+        mode = os.environ.get("RECOMMEND_WARMUP", "sync")
+        for _ in range(args.repeat):
+            live, ready = time_uvicorn()
+            print(f"uvicorn app.main:app (warmup={mode:<10})  live={live:6.2f}s  ready={ready:6.2f}s")
@@ -0,0 +1,152 @@
+"""bench_workers.py
+
+Memory and throughput of the API as the worker count grows, for
+- prefork:  python app/serve.py --workers N   (artifacts loaded once, shared copy-on-write)
+- uvicorn:  uvicorn app.main:app --workers N  (every worker loads its own copy)
+Per run: RSS of each worker, total PSS of the process tree (shared pages split
+between the processes that map them, i.e. the real memory cost) and aggregate
+/recommend throughput + latency under concurrent load. Response and embedding
+caches and the query store are disabled so every request encodes and searches.
+
+Usage (from backend/app):
+    python bench_workers.py --workers 1,2,4 --concurrency 32 --requests 1000
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+import numpy as np
+import pandas as pd
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BACKEND = os.path.dirname(HERE)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def descendants(pid):
+    children = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(entry))
+    out, todo = [], [pid]
+    while todo:
+        p = todo.pop()
+        for c in children.get(p, []):
+            out.append(c)
+            todo.append(c)
+    return out
+
+
+def memory_kb(pid):
+    """(rss, pss) in kB for one process."""
+    rss = pss = 0
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            rss = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            pss = next(int(line.split()[1]) for line in f if line.startswith("Pss:"))
+    except (OSError, StopIteration):
+        pass
+    return rss, pss
+
+
+def start(mode, workers, port, cwd):
+    env = dict(os.environ, RECOMMEND_RESPONSE_CACHE_SIZE="0", RECOMMEND_EMBEDDING_CACHE_SIZE="0",
+               RECOMMEND_QUERY_STORE="off",
+               PYTHONPATH=BACKEND + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    if mode == "prefork":
+        cmd = [sys.executable, os.path.join(HERE, "serve.py"), "--workers", str(workers), "--port", str(port),
+               "--host", "127.0.0.1", "--log-level", "warning"]
+    else:
+        cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--workers", str(workers), "--port", str(port),
+               "--host", "127.0.0.1", "--log-level", "warning"]
+    return subprocess.Popen(cmd, cwd=cwd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_ready(proc, base, workers, timeout=600):
+    """Ready once 3 x workers consecutive /health/ready calls succeed (every worker has loaded)."""
+    t0, streak = time.perf_counter(), 0
+    while streak < 3 * workers:
+        if proc.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        if time.perf_counter() - t0 > timeout:
+            raise TimeoutError("server not ready")
+        try:
+            ok = httpx.get(base + "/health/ready", timeout=2).status_code == 200
+        except httpx.HTTPError:
+            ok = False
+        streak = streak + 1 if ok else 0
+        time.sleep(0.02 if ok else 0.2)
+    return time.perf_counter() - t0
+
+
+async def load(base, queries, n_requests, concurrency, k):
+    sem = asyncio.Semaphore(concurrency)
+    latencies = []
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base, timeout=60, limits=limits) as client:
+        async def one(i):
+            async with sem:
+                t0 = time.perf_counter()
+                r = await client.post("/recommend", json={"query": queries[i % len(queries)], "k": k})
+                r.raise_for_status()
+                latencies.append(time.perf_counter() - t0)
+        await asyncio.gather(*(one(i) for i in range(min(n_requests, 4 * concurrency))))  # warm-up
+        latencies.clear()
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(n_requests)))
+    return latencies, time.perf_counter() - t0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=str, default="1,2,4")
+    parser.add_argument("--modes", type=str, default="prefork,uvicorn")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--queries", type=str, default=os.path.join("..", "..", "data", "test.csv"))
+    parser.add_argument("--cwd", type=str, default=BACKEND, help="working directory for the servers")
+    args = parser.parse_args()
+
+    queries = list(dict.fromkeys(pd.read_csv(args.queries)["Query"].dropna().astype(str)))
+    print(f"{len(queries)} distinct queries, concurrency={args.concurrency}, {args.requests} requests per run")
+    print(f"{'mode':<8} {'workers':>7} {'ready s':>8} {'worker RSS MB':>14} {'total PSS MB':>13} "
+          f"{'qps':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for mode in args.modes.split(","):
+        for n in (int(x) for x in args.workers.split(",")):
+            port = free_port()
+            base = f"http://127.0.0.1:{port}"
+            proc = start(mode, n, port, args.cwd)
+            try:
+                ready = wait_ready(proc, base, n)
+                latencies, wall = asyncio.run(load(base, queries, args.requests, args.concurrency, args.k))
+                tree = [proc.pid] + descendants(proc.pid)
+                mem = {pid: memory_kb(pid) for pid in tree}
+                # workers = the processes that serve requests: children of the launcher (uvicorn also
+                # starts a small multiprocessing helper, excluded by picking the n largest)
+                worker_rss = sorted((mem[p][0] for p in tree[1:]), reverse=True)[:n] or [mem[proc.pid][0]]
+                total_pss = sum(pss for _, pss in mem.values())
+                lat = np.asarray(latencies) * 1000
+                print(f"{mode:<8} {n:>7} {ready:8.1f} {np.mean(worker_rss) / 1024:14.1f} {total_pss / 1024:13.1f} "
+                      f"{len(lat) / wall:8.1f} {np.percentile(lat, 50):8.1f} {np.percentile(lat, 95):8.1f}")
+            finally:
+                proc.terminate()
+                try:
+                    proc.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
@@ -7,89 +7,298 @@ Outputs:
  - model_store/embeddings.npy
  - model_store/faiss.index
  - model_store/metadata.csv
+ - model_store/embedding_cache.npz (content-hashed embeddings reused by --incremental)
+
+--index selects the FAISS backend (flat, ivf, hnsw, ivfpq, opq or auto; see
+index_backends.py) and --report writes model_store/index_report.json comparing
+its recall@k, p50/p99 latency and memory against exact search.
+
+--embedding-dtype stores embeddings.npy as float32, float16 or int8 (+ per-dimension
+scales in embeddings_scale.npy); --no-index-file skips faiss.index, and loaders rebuild
+the index from the memory-mapped embeddings instead of keeping both copies (flat and hnsw
+only: indexes that need training are rejected, see index_backends.py).
+manifest.json records the model name, index type, embedding storage and, per artifact, its
+size / mtime (checked on load) and sha256 (checked by python snapshots.py model_store).
+
+--snapshot writes a new versioned snapshot (model_store/snapshots/<version>/) and then
+points model_store/CURRENT at it, so a running API can hot-reload it (see snapshots.py).
+Rebuilding an existing store (and every --incremental build) always does: the artifacts are
+renamed into place one by one, so writing them over a live unversioned store would let a
+reader (or a crash) see old and new files mixed. Only a new, empty store is written flat.
+
+--neighbors M (default 32, 0 = off) precomputes each row's M nearest catalog rows with the
+built index and writes them as neighbors.npy / neighbor_sims.npy (see neighbor_graph.py);
+the API's MMR re-ranking reads pairwise similarities from them.
+
+A BM25 inverted index over assessment_name + description is written as lexical_index.npz
+(see lexical_index.py) for the API's lexical fast path / hybrid retrieval; --no-lexical skips it.
+
+--encoder-backend picks the document encoder (torch, torch-int8, onnx, onnx-int8; see
+encoders.py); cached embeddings are keyed per backend, and manifest.json records it.
+
+With --incremental only catalog rows whose (model, text) hash is not in the cache
+are encoded; removed rows drop out of the index and the cache.
 """
 import os
+import json
+import time
+import hashlib
 import argparse
 import pandas as pd
 import numpy as np
-# Compatibility shim: newer versions of huggingface_hub renamed `cached_download` -> `hf_hub_download`.
-# Some versions of `sentence_transformers` still import `cached_download`. If the installed
-# `huggingface_hub` lacks `cached_download`, alias it to `hf_hub_download` so the import succeeds.
-try:
-    import huggingface_hub as _hf_hub
-    if not hasattr(_hf_hub, "cached_download") and hasattr(_hf_hub, "hf_hub_download"):
-        _hf_hub.cached_download = _hf_hub.hf_hub_download
-except Exception:
-    # If huggingface_hub isn't available or aliasing fails, we'll let the original import raise an error
-    pass
-
-from sentence_transformers import SentenceTransformer
 import faiss
 from utils import load_catalog
-from tqdm import tqdm
-import requests
-from bs4 import BeautifulSoup
+from encoders import ENCODER_BACKENDS, load_encoder
+from urllib.parse import urljoin
+from index_backends import INDEX_SPECS, build_faiss_index, evaluate_index, needs_training
+from embedding_store import EMBEDDING_DTYPES, quantize_embeddings, scale_path
+from lexical_index import LEXICAL_FILE, LexicalIndex
+from neighbor_graph import NEIGHBORS_FILE, NEIGHBOR_SIMS_FILE, build_neighbor_graph
+from snapshots import SNAPSHOT_DIR, MANIFEST_FILE, CURRENT_FILE, artifact_checksums, artifact_stats, new_version, set_current
+# sentence_transformers (torch), bs4 and the crawler are imported only on the code paths that use them
 
 MODEL_NAME = "all-MiniLM-L6-v2"  # small, fast; good default
+EMBEDDING_CACHE_FILE = "embedding_cache.npz"
 
-def crawl_shl_catalog(out_csv="catalog.csv", base_url="https://www.shl.com/solutions/products/product-catalog/"):
+def crawl_shl_catalog(out_csv="catalog.csv", base_url="https://www.shl.com/solutions/products/product-catalog/",
+                      cache_dir="page_cache", max_workers=8):
     """
     Very simple crawler that tries to get links under the product catalog main page.
+    Product pages are fetched concurrently through crawler.Crawler (pooled connections,
+    per-host rate limit, retries, conditional-GET page cache in `cache_dir`).
     NOTE: This is a best-effort helper. For robustness, manually collect catalog rows or
     export the catalog to CSV and use Option A.
     """
-    resp = requests.get(base_url, timeout=20)
-    if resp.status_code != 200:
-        raise RuntimeError(f"Unable to fetch {base_url}: {resp.status_code}")
-    soup = BeautifulSoup(resp.text, "html.parser")
-    # try to extract hrefs that look like product pages
-    anchors = soup.find_all("a", href=True)
-    product_links = set()
-    for a in anchors:
-        href = a['href']
-        if "/solutions/products/product-catalog/" in href and href != base_url:
-            product_links.add(href if href.startswith("http") else "https://www.shl.com" + href)
-    rows = []
-    for link in product_links:
-        try:
-            r = requests.get(link, timeout=10)
-            s = BeautifulSoup(r.text, "html.parser")
-            title = s.find("h1").get_text(strip=True) if s.find("h1") else a.get_text(strip=True)
+    from bs4 import BeautifulSoup
+    from crawler import Crawler
+    with Crawler(max_workers=max_workers, cache_dir=cache_dir) as crawler:
+        page = crawler.fetch(base_url)
+        if not page.ok:
+            raise RuntimeError(f"Unable to fetch {base_url}: {page.status or page.error}")
+        soup = BeautifulSoup(page.text, "html.parser")
+        # try to extract hrefs that look like product pages (link -> anchor text)
+        anchors = soup.find_all("a", href=True)
+        product_links = {}
+        for a in anchors:
+            link = urljoin(base_url, a['href'])
+            if "/solutions/products/product-catalog/" in link and link != base_url:
+                product_links.setdefault(link, a.get_text(strip=True))
+        rows = []
+        for link, p in zip(product_links, crawler.fetch_all(list(product_links))):
+            if not p.ok:
+                continue
+            s = BeautifulSoup(p.text, "html.parser")
+            title = s.find("h1").get_text(strip=True) if s.find("h1") else product_links[link]
             desc = ""
-            p = s.find("p")
-            if p:
-                desc = p.get_text(strip=True)
+            para = s.find("p")
+            if para:
+                desc = para.get_text(strip=True)
             # We attempt to find Test Type text in page - fallback empty
             test_type = ""
             rows.append({"assessment_name": title, "url": link, "description": desc, "test_type": test_type})
-        except Exception:
-            continue
+        print(f"Crawl: {crawler.stats['fetched']} fetched, {crawler.stats['not_modified']} unchanged (cached), "
+              f"{crawler.stats['errors']} errors")
     df = pd.DataFrame(rows)
     df.to_csv(out_csv, index=False)
     print(f"Wrote {len(df)} rows to {out_csv}")
     return out_csv
 
-def build_index(catalog_csv, out_dir="model_store", model_name=MODEL_NAME, use_crawl=False):
+def text_key(model_name, text):
+    """Cache key for one catalog row: hash of (model name, encoded text)."""
+    return hashlib.sha256(f"{model_name}\x1f{text}".encode("utf-8")).hexdigest()
+
+def load_embedding_cache(path):
+    """{key: embedding} from a previous build (empty if missing or unreadable)."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with np.load(path) as z:
+            return dict(zip(z["keys"].astype(str), z["embeddings"]))
+    except Exception as e:
+        print(f"Ignoring unreadable embedding cache {path}: {e}")
+        return {}
+
+def atomic_write(path, write):
+    """Write via a temp file in the same folder + os.replace so readers never see a partial file."""
+    tmp = path + ".tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+def save_npy(path, arr):
+    with open(path, "wb") as f:
+        np.save(f, arr)
+
+def save_json(path, obj):
+    with open(path, "w") as f:
+        json.dump(obj, f, indent=2)
+
+def save_npz(path, **arrays):
+    with open(path, "wb") as f:
+        np.savez(f, **arrays)
+
+def encode_with_cache(texts, model_name, cache, batch_size=64, backend="torch", threads=None):
+    """
+    Embeddings for `texts`, reusing cached vectors and encoding only new/changed texts (deduplicated, batched).
+    Returns (embeddings, keys, n_reused, n_encoded).
+    """
+    # other backends give slightly different vectors, so they get their own cache keys
+    cache_name = model_name if backend == "torch" else f"{model_name}@{backend}"
+    keys = [text_key(cache_name, t) for t in texts]
+    missing = list(dict.fromkeys(key for key in keys if key not in cache))
+    if missing:
+        key_text = dict(zip(keys, texts))
+        model = load_encoder(model_name, backend=backend, threads=threads)
+        new = model.encode([key_text[key] for key in missing], batch_size=batch_size,
+                           show_progress_bar=len(missing) > batch_size,
+                           convert_to_numpy=True, normalize_embeddings=True)
+        cache.update(zip(missing, new.astype('float32')))
+    embeddings = np.stack([cache[key] for key in keys]).astype('float32')
+    missing = set(missing)
+    n_encoded = sum(1 for key in keys if key in missing)
+    return embeddings, keys, len(keys) - n_encoded, n_encoded
+
+def prune_snapshots(out_dir, keep=3):
+    """Delete all but the newest `keep` snapshots (never the one CURRENT points at)."""
+    import shutil
+    root = os.path.join(out_dir, SNAPSHOT_DIR)
+    with open(os.path.join(out_dir, "CURRENT")) as f:
+        current = f.read().strip()
+    versions = sorted(v for v in os.listdir(root) if os.path.isdir(os.path.join(root, v)))
+    for v in versions[:max(0, len(versions) - max(1, keep))]:
+        if v != current:
+            shutil.rmtree(os.path.join(root, v), ignore_errors=True)
+
+def index_report(index, desc, embeddings, k=10, n_queries=1000, seed=0):
+    """Compare `index` with exact search, using a sample of catalog vectors as queries."""
+    rng = np.random.default_rng(seed)
+    sample = embeddings[rng.choice(len(embeddings), size=min(n_queries, len(embeddings)), replace=False)]
+    exact = faiss.IndexFlatIP(embeddings.shape[1])
+    exact.add(embeddings)
+    k = min(k, len(embeddings))
+    return {
+        "rows": int(len(embeddings)),
+        "index": desc,
+        "queries": int(len(sample)),
+        "exact": evaluate_index(exact, exact, sample, k=k),
+        "candidate": evaluate_index(index, exact, sample, k=k),
+    }
+
+def build_index(catalog_csv, out_dir="model_store", model_name=MODEL_NAME, use_crawl=False, incremental=False,
+                crawl_url=None, index_spec="flat", report=False, embedding_dtype="float32", write_index_file=True,
+                snapshot=False, keep_snapshots=3, encoder_backend="torch", encoder_threads=None, neighbors=32,
+                lexical=True):
+    t0 = time.perf_counter()
     os.makedirs(out_dir, exist_ok=True)
+    # the whole artifact set switches at once through CURRENT; see the module docstring
+    live = any(os.path.exists(os.path.join(out_dir, name)) for name in (CURRENT_FILE, MANIFEST_FILE, "metadata.csv"))
+    if (live or incremental) and not snapshot:
+        print(f"{out_dir} {'is in use' if live else 'is built incrementally'}: writing a snapshot and switching CURRENT")
+        snapshot = True
+    version = new_version() if snapshot else None
+    target_dir = os.path.join(out_dir, SNAPSHOT_DIR, version) if snapshot else out_dir
     if use_crawl:
-        catalog_csv = crawl_shl_catalog(out_csv=catalog_csv)
+        crawl_kwargs = {"base_url": crawl_url} if crawl_url else {}
+        catalog_csv = crawl_shl_catalog(out_csv=catalog_csv, **crawl_kwargs)
     df = load_catalog(catalog_csv)
     texts = (df["assessment_name"].fillna("") + ". " + df["description"].fillna("")).tolist()
-    model = SentenceTransformer(model_name)
-    embeddings = model.encode(texts, show_progress_bar=True, convert_to_numpy=True, normalize_embeddings=True)
+    cache_path = os.path.join(out_dir, EMBEDDING_CACHE_FILE)
+    cache = load_embedding_cache(cache_path) if incremental else {}
+    embeddings, keys, n_reused, n_encoded = encode_with_cache(texts, model_name, cache, backend=encoder_backend,
+                                                             threads=encoder_threads)
     # build FAISS index
-    dim = embeddings.shape[1]
-    index = faiss.IndexFlatIP(dim)  # cosine by normalizing
-    index.add(embeddings.astype('float32'))
-    faiss.write_index(index, os.path.join(out_dir, "faiss.index"))
-    np.save(os.path.join(out_dir, "embeddings.npy"), embeddings)
-    df.to_csv(os.path.join(out_dir, "metadata.csv"), index=False)
-    print("Index built and saved to", out_dir)
+    index, desc = build_faiss_index(embeddings, index_spec)
+    print(f"Index: {desc} ({index_spec})")
+    if not write_index_file and needs_training(desc, embeddings.shape[1]):
+        raise ValueError(f"--no-index-file needs an index that loads without training (flat, hnsw); {desc} "
+                         "would be re-trained on every load")
+    # a snapshot folder is never reused: another build must not overwrite it
+    os.makedirs(target_dir, exist_ok=not snapshot)
+    index_path = os.path.join(target_dir, "faiss.index")
+    emb_path = os.path.join(target_dir, "embeddings.npy")
+    stored, scale = quantize_embeddings(embeddings, embedding_dtype)
+    atomic_write(os.path.join(target_dir, "metadata.csv"), lambda p: df.to_csv(p, index=False))
+    atomic_write(emb_path, lambda p: save_npy(p, stored))
+    if scale is not None:
+        atomic_write(scale_path(emb_path), lambda p: save_npy(p, scale))
+    elif os.path.exists(scale_path(emb_path)):
+        os.remove(scale_path(emb_path))
+    if write_index_file:
+        atomic_write(index_path, lambda p: faiss.write_index(index, p))
+    elif os.path.exists(index_path):
+        # loaders rebuild the index from embeddings.npy
+        os.remove(index_path)
+    graph_paths = [os.path.join(target_dir, name) for name in (NEIGHBORS_FILE, NEIGHBOR_SIMS_FILE)]
+    if neighbors > 0 and len(embeddings) > 1:
+        t1 = time.perf_counter()
+        nbr_ids, nbr_sims = build_neighbor_graph(index, embeddings, m=neighbors)
+        atomic_write(graph_paths[0], lambda p: save_npy(p, nbr_ids))
+        atomic_write(graph_paths[1], lambda p: save_npy(p, nbr_sims))
+        print(f"Neighbor graph: top-{nbr_ids.shape[1]} per row in {time.perf_counter() - t1:.1f}s")
+    else:
+        for path in graph_paths:
+            if os.path.exists(path):
+                os.remove(path)
+    lexical_path = os.path.join(target_dir, LEXICAL_FILE)
+    if lexical:
+        lex = LexicalIndex.build(df["assessment_name"].fillna(""), df["description"])
+        atomic_write(lexical_path, lex.save)
+        print(f"Lexical index: {len(lex.terms)} terms, {len(lex.docs)} postings ({lex.nbytes / 1e6:.2f}MB)")
+    elif os.path.exists(lexical_path):
+        os.remove(lexical_path)
+    # manifest goes last: it is what readers verify the other files against
+    manifest = {"version": version or new_version(), "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "model_name": model_name, "encoder_backend": encoder_backend, "index": desc, "index_spec": index_spec, "index_file": write_index_file,
+                "embedding_dtype": embedding_dtype, "rows": int(len(embeddings)), "dim": int(embeddings.shape[1]),
+                "neighbors": int(min(neighbors, len(embeddings) - 1)) if neighbors > 0 and len(embeddings) > 1 else 0,
+                "lexical_index": lexical, "checksums": artifact_checksums(target_dir),
+                "artifacts": artifact_stats(target_dir)}
+    atomic_write(os.path.join(target_dir, MANIFEST_FILE), lambda p: save_json(p, manifest))
+    if snapshot:
+        set_current(out_dir, version)
+        prune_snapshots(out_dir, keep=keep_snapshots)
+    # keep only rows still in the catalog so removed rows don't linger in the cache
+    atomic_write(cache_path, lambda p: save_npz(p, keys=np.array(keys, dtype="S64"), embeddings=embeddings))
+    print(f"Rows: {len(keys)} (reused {n_reused}, encoded {n_encoded}) in {time.perf_counter() - t0:.1f}s")
+    print("Index built and saved to", target_dir)
+    if report:
+        rep = index_report(index, desc, embeddings)
+        atomic_write(os.path.join(target_dir, "index_report.json"), lambda p: save_json(p, rep))
+        for name in ("exact", "candidate"):
+            r = rep[name]
+            print(f"  {name:<9} recall@{r['k']}={r['recall_at_k']:.3f}  p50={r['p50_ms']:.3f}ms  "
+                  f"p99={r['p99_ms']:.3f}ms  memory={r['memory_bytes'] / 1e6:.1f}MB")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--catalog", type=str, default="../../data/catalog.csv", help="path to catalog.csv")
     parser.add_argument("--out", type=str, default="model_store", help="output folder")
     parser.add_argument("--crawl", action="store_true", help="try crawling SHL catalog (best-effort)")
+    parser.add_argument("--crawl-url", type=str, help="catalog start page for --crawl (default: SHL product catalog)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="reuse cached embeddings and only encode new/changed catalog rows")
+    parser.add_argument("--index", type=str, default="flat",
+                        help=f"index backend: one of {', '.join(INDEX_SPECS)} or a faiss.index_factory string")
+    parser.add_argument("--report", action="store_true",
+                        help="write index_report.json (recall@k vs exact search, p50/p99 latency, memory)")
+    parser.add_argument("--embedding-dtype", type=str, default="float32", choices=EMBEDDING_DTYPES,
+                        help="storage precision of embeddings.npy (int8 also writes embeddings_scale.npy)")
+    parser.add_argument("--no-index-file", action="store_true",
+                        help="don't write faiss.index; loaders rebuild it from the mmapped embeddings.npy "
+                             "(flat / hnsw only)")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="write a new versioned snapshot under <out>/snapshots and make it CURRENT")
+    parser.add_argument("--keep-snapshots", type=int, default=3, help="snapshots to keep with --snapshot")
+    parser.add_argument("--encoder-backend", type=str, default="torch", choices=ENCODER_BACKENDS,
+                        help="document encoder backend (see encoders.py)")
+    parser.add_argument("--encoder-threads", type=int, help="intra-op threads for the encoder")
+    parser.add_argument("--neighbors", type=int, default=32,
+                        help="neighbors per row in the MMR similarity graph (0 = don't build it)")
+    parser.add_argument("--no-lexical", action="store_true",
+                        help="don't write the BM25 index used for lexical / hybrid retrieval")
     args = parser.parse_args()
-    build_index(args.catalog, out_dir=args.out, use_crawl=args.crawl)
+    build_index(args.catalog, out_dir=args.out, use_crawl=args.crawl, incremental=args.incremental,
+                crawl_url=args.crawl_url, index_spec=args.index, report=args.report,
+                embedding_dtype=args.embedding_dtype, write_index_file=not args.no_index_file,
+                snapshot=args.snapshot, keep_snapshots=args.keep_snapshots,
+                encoder_backend=args.encoder_backend, encoder_threads=args.encoder_threads,
+                neighbors=args.neighbors, lexical=not args.no_lexical)
@@ -0,0 +1,95 @@
+"""cache.py
+
+Small thread-safe caches used by the API:
+- LRUCache: bounded LRU with optional TTL and hit/miss counters.
+- normalize_query: canonical cache key for query text.
+- artifact_fingerprint: cheap change detector for model_store files, used to
+  invalidate cached embeddings/responses when the index is rebuilt.
+"""
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, Optional, Tuple
+
+
+def normalize_query(q: str) -> str:
+    """Collapse whitespace and lowercase (the MiniLM tokenizer is uncased)."""
+    return " ".join(str(q).split()).lower()
+
+
+def artifact_fingerprint(paths: Iterable[str]) -> Tuple:
+    """(path, mtime_ns, size) for each existing path; changes whenever a file is rewritten."""
+    fp = []
+    for p in paths:
+        try:
+            st = os.stat(p)
+        except OSError:
+            fp.append((p, None, None))
+            continue
+        fp.append((p, st.st_mtime_ns, st.st_size))
+    return tuple(fp)
+
+
+class LRUCache:
+    """
+    Bounded LRU cache with an optional time-to-live.
+
+    Args:
+        maxsize: maximum number of entries; least recently used entries are evicted first.
+        ttl: seconds an entry stays valid (None or <= 0 disables expiry).
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: Optional[float] = None):
+        self.maxsize = max(0, int(maxsize))
+        self.ttl = ttl if ttl and ttl > 0 else None
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            value, expires = entry
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        if self.maxsize == 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits / total) if total else 0.0,
+        }
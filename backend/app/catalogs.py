@@ -0,0 +1,228 @@
+"""catalogs.py
+
+Several catalogs served from one API process, loaded on demand.
+
+A catalog id is `<name>` or `<name>@<version>`:
+- <name> is a folder under the catalog root (RECOMMEND_CATALOG_ROOT), itself a model_store
+  built by build_index.py (unversioned, or snapshots/ + CURRENT)
+- @<version> pins one snapshot of it instead of the one CURRENT points at
+Each catalog's index, embeddings and metadata are loaded on first use (one load at a time
+per catalog; concurrent first requests wait for it) and kept in an LRU bounded by an
+estimated resident size: when the loaded catalogs exceed the budget, the least recently
+used are dropped (requests still using one keep their reference until they finish).
+The query encoder is not part of a catalog: every catalog shares the API's one embedder,
+and load_snapshot rejects catalogs built with a different model.
+
+Per catalog the registry reports loads, hits, evictions, last load latency, resident size
+(estimate used for the budget) and the RSS growth measured while loading.
+"""
+import os
+import re
+import sys
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+try:
+    from .snapshots import load_snapshot, resolve_current, rss_bytes
+except ImportError:  # imported from a script run inside backend/app
+    from snapshots import load_snapshot, resolve_current, rss_bytes
+
+# names and versions are single path components that can't start with "." (no ".", "..", hidden folders)
+CATALOG_ID = re.compile(r"^([A-Za-z0-9_][A-Za-z0-9_.-]*)(?:@([A-Za-z0-9_][A-Za-z0-9_.-]*))?$")
+
+
+def snapshot_nbytes(snap) -> int:
+    """Estimated resident bytes of a loaded snapshot: index + in-RAM embeddings / graph + lexical index + metadata."""
+    index_path = os.path.join(snap.path, "faiss.index")
+    if os.path.exists(index_path):
+        total = os.path.getsize(index_path)
+    else:  # rebuilt from embeddings.npy at load time
+        total = snap.index.ntotal * snap.index.d * 4
+    emb = snap.embeddings
+    if emb is not None and not isinstance(emb.data, np.memmap):
+        total += emb.nbytes  # memory-mapped embeddings live in the (reclaimable) page cache
+    meta = snap.metadata
+    for col in (meta.assessment_name, meta.url, meta.test_type):
+        total += col.nbytes + sum(sys.getsizeof(s) for s in col)
+    total += meta.test_type_codes.nbytes
+    total += meta.filters.nbytes
+    if snap.neighbors is not None and not isinstance(snap.neighbors.ids, np.memmap):
+        total += snap.neighbors.nbytes
+    if snap.lexical is not None:
+        total += snap.lexical.nbytes
+    return int(total)
+
+
+class CatalogEntry:
+    __slots__ = ("snapshot", "nbytes", "rss_delta", "loaded_at", "lock")
+
+    def __init__(self):
+        self.snapshot = None
+        self.nbytes = 0
+        self.rss_delta = 0
+        self.loaded_at = 0.0
+        self.lock = threading.Lock()
+
+
+class CatalogRegistry:
+    """
+    Lazily loaded, LRU-evicted catalogs.
+
+    Args:
+        root: folder holding one model_store per catalog name.
+        budget_bytes: evict least recently used catalogs while the loaded ones exceed this
+            (the catalog just loaded is always kept, even if it alone is over budget).
+        loader: fn(path) -> ModelSnapshot (defaults to snapshots.load_snapshot).
+    """
+
+    def __init__(self, root: str, budget_bytes: int, loader=None):
+        self.root = root
+        self.budget_bytes = max(0, int(budget_bytes))
+        self.loader = loader or load_snapshot
+        self._entries = OrderedDict()  # catalog id -> CatalogEntry, least recently used first
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _stat(self, catalog_id):
+        return self._stats.setdefault(catalog_id, {"loads": 0, "hits": 0, "evictions": 0,
+                                                   "last_load_seconds": None, "total_load_seconds": 0.0})
+
+    def path(self, catalog_id: str) -> str:
+        """Snapshot folder for a catalog id; FileNotFoundError / ValueError for unknown or malformed ids."""
+        m = CATALOG_ID.match(catalog_id or "")
+        if not m:
+            raise ValueError(f"Invalid catalog id: {catalog_id!r}")
+        name, version = m.groups()
+        root = os.path.abspath(self.root)
+        store = os.path.abspath(os.path.join(root, name))
+        if os.path.dirname(store) != root:
+            raise ValueError(f"Invalid catalog id: {catalog_id!r}")
+        if not os.path.isdir(store):
+            raise FileNotFoundError(f"Unknown catalog: {name!r}")
+        # messages name the catalog only; the folder layout stays server-side
+        try:
+            return resolve_current(store, version)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Unknown version of catalog {name!r}: {version or 'CURRENT'!r}") from None
+
+    def available(self):
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(d for d in os.listdir(self.root)
+                      if CATALOG_ID.match(d) and os.path.isdir(os.path.join(self.root, d)))
+
+    def get(self, catalog_id: str, load: bool = True):
+        """
+        The catalog's snapshot, loading it (and evicting others) if it is not resident.
+        With load=False returns None instead of loading (a cheap check for the event loop).
+        """
+        with self._lock:
+            entry = self._entries.get(catalog_id)
+            if entry is not None and entry.snapshot is not None:
+                self._entries.move_to_end(catalog_id)
+                self._stat(catalog_id)["hits"] += 1
+                return entry.snapshot
+            if not load:
+                return None
+            if entry is None:
+                entry = self._entries[catalog_id] = CatalogEntry()
+        with entry.lock:
+            if entry.snapshot is not None:  # loaded by a concurrent request meanwhile
+                with self._lock:
+                    self._stat(catalog_id)["hits"] += 1
+                return entry.snapshot
+            path = None
+            try:
+                path = self.path(catalog_id)
+                rss_before = rss_bytes()
+                t0 = time.perf_counter()
+                snap = self.loader(path)
+                elapsed = time.perf_counter() - t0
+            except Exception as e:
+                with self._lock:
+                    if self._entries.get(catalog_id) is entry and entry.snapshot is None:
+                        del self._entries[catalog_id]
+                # load errors reach API clients: name the catalog, not its folder
+                if path and isinstance(e, (FileNotFoundError, ValueError)) and path in str(e):
+                    raise type(e)(str(e).replace(path, catalog_id)) from e
+                raise
+            entry.rss_delta = max(0, rss_bytes() - rss_before)
+            entry.nbytes = snapshot_nbytes(snap)
+            entry.loaded_at = time.time()
+            entry.snapshot = snap
+            with self._lock:
+                stat = self._stat(catalog_id)
+                stat["loads"] += 1
+                stat["last_load_seconds"] = elapsed
+                stat["total_load_seconds"] += elapsed
+                self._entries[catalog_id] = entry
+                self._entries.move_to_end(catalog_id)
+                self._evict(keep=catalog_id)
+            return snap
+
+    def _evict(self, keep: str):
+        resident = sum(e.nbytes for e in self._entries.values() if e.snapshot is not None)
+        for catalog_id in list(self._entries):
+            if resident <= self.budget_bytes:
+                break
+            entry = self._entries[catalog_id]
+            if catalog_id == keep or entry.snapshot is None:
+                continue
+            del self._entries[catalog_id]
+            resident -= entry.nbytes
+            self._stat(catalog_id)["evictions"] += 1
+
+    def evict(self, catalog_id: str) -> bool:
+        """Drop one catalog (it reloads on next use, e.g. after a rebuild). False if it wasn't loaded."""
+        with self._lock:
+            entry = self._entries.pop(catalog_id, None)
+            if entry is None or entry.snapshot is None:
+                return False
+            self._stat(catalog_id)["evictions"] += 1
+            return True
+
+    def stats(self) -> dict:
+        with self._lock:
+            resident = {cid: e for cid, e in self._entries.items() if e.snapshot is not None}
+            catalogs = {}
+            for cid, stat in self._stats.items():
+                entry = resident.get(cid)
+                catalogs[cid] = dict(stat, resident=entry is not None,
+                                     version=entry.snapshot.version if entry else None,
+                                     rows=len(entry.snapshot.metadata) if entry else None,
+                                     resident_bytes=entry.nbytes if entry else 0,
+                                     rss_delta_bytes=entry.rss_delta if entry else None,
+                                     loaded_at=entry.loaded_at if entry else None)
+            return {
+                "root": self.root,
+                "budget_bytes": self.budget_bytes,
+                "resident_bytes": sum(e.nbytes for e in resident.values()),
+                "loaded": list(resident),
+                "catalogs": catalogs,
+            }
+
+
+def merge_topk(per_catalog, k: int, by_rank: bool = False):
+    """
+    Top-k over several catalogs' recommendation lists [(catalog id, recs)], by score (all
+    catalogs share the embedder, so cosine scores are comparable), or with by_rank (scores that
+    aren't comparable across catalogs, e.g. BM25 / RRF) by position: every catalog's first
+    result, then every second one, ... A url found in several catalogs is kept once, from the
+    best one; each merged record gets a "catalog" field.
+    """
+    if len(per_catalog) == 1:
+        return per_catalog[0][1]
+    hits = sorted(((-rank if by_rank else rec["score"], i, cid, rec)
+                   for i, (cid, recs) in enumerate(per_catalog) for rank, rec in enumerate(recs)),
+                  key=lambda h: (-h[0], h[1]))
+    merged, seen = [], set()
+    for _, _, cid, rec in hits:
+        if rec["url"] in seen:
+            continue
+        seen.add(rec["url"])
+        merged.append(dict(rec, catalog=cid))
+        if len(merged) == k:
+            break
+    return merged
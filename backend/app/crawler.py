@@ -0,0 +1,162 @@
+"""crawler.py
+
+Shared page fetcher for the catalog scripts (build_index.py, generate_catalog_from_train.py).
+
+- bounded concurrency (thread pool) over one pooled keep-alive requests.Session
+- per-host rate limiting (minimum interval between requests to the same host)
+- retry with exponential backoff on connection errors, 429 and 5xx
+- optional on-disk page cache: stored ETag / Last-Modified are sent back as
+  If-None-Match / If-Modified-Since and a 304 reuses the cached body
+
+Usage:
+    crawler = Crawler(cache_dir="page_cache", max_workers=8, per_host_rate=4)
+    pages = crawler.fetch_all(urls)   # same order as urls
+"""
+import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+@dataclass
+class Page:
+    url: str
+    status: Optional[int]
+    text: str = ""
+    from_cache: bool = False
+    error: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return self.status == 200
+
+
+class HostRateLimiter:
+    """Allow at most `rate` requests per second to each host (0 disables)."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._next = {}
+        self._lock = threading.Lock()
+
+    def wait(self, host: str):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next.get(host, now))
+            self._next[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class PageCache:
+    """One JSON file per URL holding the body and its validators."""
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.cache_dir, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".json")
+
+    def get(self, url: str) -> Optional[dict]:
+        try:
+            with open(self._path(url), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, url: str, resp: requests.Response):
+        entry = {
+            "url": url,
+            "etag": resp.headers.get("ETag"),
+            "last_modified": resp.headers.get("Last-Modified"),
+            "text": resp.text,
+        }
+        # nothing to revalidate with -> not worth caching
+        if not entry["etag"] and not entry["last_modified"]:
+            return
+        path = self._path(url)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f)
+        os.replace(tmp, path)
+
+
+class Crawler:
+    """
+    Args:
+        max_workers: concurrent fetches in fetch_all (also the connection pool size).
+        per_host_rate: max requests per second per host (0 = unlimited).
+        retries / backoff: urllib3 retry policy (sleep backoff * 2**attempt between tries).
+        cache_dir: folder for the conditional-GET page cache (None disables caching).
+        timeout: per-request timeout in seconds.
+    """
+
+    def __init__(self, max_workers: int = 8, per_host_rate: float = 4.0, retries: int = 3,
+                 backoff: float = 0.5, cache_dir: Optional[str] = None, timeout: float = 10):
+        self.max_workers = max(1, int(max_workers))
+        self.timeout = timeout
+        self.session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=(429, 500, 502, 503, 504),
+                      allowed_methods=frozenset(["GET"]), respect_retry_after_header=True, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.max_workers, max_retries=retry)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.limiter = HostRateLimiter(per_host_rate)
+        self.cache = PageCache(cache_dir) if cache_dir else None
+        self.stats = {"fetched": 0, "not_modified": 0, "errors": 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def fetch(self, url: str) -> Page:
+        cached = self.cache.get(url) if self.cache else None
+        headers = {}
+        if cached:
+            if cached.get("etag"):
+                headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                headers["If-Modified-Since"] = cached["last_modified"]
+        self.limiter.wait(urlsplit(url).netloc)
+        try:
+            resp = self.session.get(url, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            self._count("errors")
+            return Page(url, None, error=str(e))
+        if resp.status_code == 304 and cached:
+            self._count("not_modified")
+            return Page(url, 200, cached["text"], from_cache=True)
+        if resp.status_code == 200:
+            self._count("fetched")
+            if self.cache:
+                self.cache.put(url, resp)
+        else:
+            self._count("errors")
+        return Page(url, resp.status_code, resp.text)
+
+    def fetch_all(self, urls: List[str]) -> List[Page]:
+        """Fetch concurrently; results are in the same order as `urls`."""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return list(pool.map(self.fetch, urls))
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
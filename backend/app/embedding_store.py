@@ -0,0 +1,80 @@
+"""embedding_store.py
+
+On-disk catalog embeddings (model_store/embeddings.npy).
+
+- stored as float32, float16, or int8 with per-dimension scale factors
+  (embeddings_scale.npy, x ~= q * scale)
+- loaded memory-mapped by default, so worker processes share the page cache
+  instead of each holding a private copy
+- read back as float32 only for the rows/blocks actually needed
+"""
+import os
+import numpy as np
+from typing import Iterator, Optional, Tuple
+
+EMBEDDING_DTYPES = ("float32", "float16", "int8")
+
+
+def scale_path(path: str) -> str:
+    root, ext = os.path.splitext(path)
+    return f"{root}_scale{ext}"
+
+
+def quantize_embeddings(embeddings: np.ndarray, dtype: str = "float32") -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """(stored array, scale or None) for the requested storage dtype."""
+    if dtype not in EMBEDDING_DTYPES:
+        raise ValueError(f"embedding dtype must be one of {EMBEDDING_DTYPES}, got {dtype!r}")
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    if dtype != "int8":
+        return embeddings.astype(dtype), None
+    # symmetric per-dimension scale so each column uses the full int8 range
+    scale = np.abs(embeddings).max(axis=0) / 127.0
+    scale[scale == 0] = 1.0
+    q = np.clip(np.rint(embeddings / scale), -127, 127).astype(np.int8)
+    return q, scale.astype(np.float32)
+
+
+class Embeddings:
+    """Read-only (possibly memory-mapped, possibly quantized) embedding matrix."""
+
+    def __init__(self, data: np.ndarray, scale: Optional[np.ndarray] = None):
+        self.data = data
+        self.scale = scale
+
+    @property
+    def shape(self):
+        return self.data.shape
+
+    @property
+    def dtype(self):
+        return self.data.dtype
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.data.nbytes + (self.scale.nbytes if self.scale is not None else 0))
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def rows(self, ids) -> np.ndarray:
+        """float32 copy of the selected rows (slice or index array)."""
+        block = np.asarray(self.data[ids], dtype=np.float32)
+        if self.scale is not None:
+            block *= self.scale
+        return block
+
+    def iter_chunks(self, chunk_size: int = 65536) -> Iterator[np.ndarray]:
+        for start in range(0, len(self), chunk_size):
+            yield self.rows(slice(start, start + chunk_size))
+
+
+def load_embeddings(path: str, mmap: bool = True) -> Embeddings:
+    mode = "r" if mmap else None
+    data = np.load(path, mmap_mode=mode)
+    scale = None
+    if data.dtype == np.int8:
+        sp = scale_path(path)
+        if not os.path.exists(sp):
+            raise FileNotFoundError(f"int8 embeddings at {path} need their scale factors at {sp}")
+        scale = np.load(sp)
+    return Embeddings(data, scale)
@@ -0,0 +1,204 @@
+"""encoders.py
+
+Query/document encoder loading.
+
+sentence_transformers (and torch behind it) takes seconds to import, so it is
+only imported when an encoder is actually built. LazyEncoder defers that to
+first use and is safe to share between threads.
+
+Backends (load_encoder(..., backend=...)):
+  torch       SentenceTransformer as-is (PyTorch)
+  torch-int8  same model with nn.Linear layers dynamically quantized to int8 (PyTorch)
+  onnx        transformer exported to ONNX and run with onnxruntime (tokenizer + pooling in numpy)
+  onnx-int8   the ONNX export with dynamically int8-quantized weights
+ONNX exports are created on first use under ONNX_DIR/<model> and reused afterwards.
+All backends expose SentenceTransformer.encode's signature for the arguments this repo uses.
+"""
+import os
+import json
+import threading
+import numpy as np
+
+ENCODER_BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+ONNX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "onnx_models")
+ONNX_CONFIG = "encoder.json"
+
+
+def load_sentence_transformer(model_name: str):
+    # Compatibility shim: newer versions of huggingface_hub renamed `cached_download` -> `hf_hub_download`.
+    # Some versions of `sentence_transformers` still import `cached_download`. If the installed
+    # `huggingface_hub` lacks `cached_download`, alias it to `hf_hub_download` so the import succeeds.
+    try:
+        import huggingface_hub as _hf_hub
+        if not hasattr(_hf_hub, "cached_download") and hasattr(_hf_hub, "hf_hub_download"):
+            _hf_hub.cached_download = _hf_hub.hf_hub_download
+    except Exception:
+        # If huggingface_hub isn't available or aliasing fails, we'll let the original import raise an error
+        pass
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+
+def onnx_model_dir(model_name: str, onnx_dir: str = ONNX_DIR) -> str:
+    return os.path.join(onnx_dir, model_name.strip("/").replace("/", "__"))
+
+
+def _pooling_mode(pooling) -> str:
+    if hasattr(pooling, "get_pooling_mode_str"):  # sentence-transformers 2.x
+        mode = pooling.get_pooling_mode_str()
+    else:
+        mode = getattr(pooling, "pooling_mode", "mean")
+    if mode not in ("mean", "cls", "max"):
+        raise ValueError(f"ONNX backend does not implement {mode!r} pooling")
+    return mode
+
+
+def export_onnx(model_name: str, onnx_dir: str = ONNX_DIR, quantize: bool = False) -> str:
+    """
+    Export the model's transformer to <onnx_dir>/<model>/model.onnx (+ tokenizer and pooling
+    config), and with quantize=True also model_int8.onnx. Existing files are reused.
+    Returns the path of the requested .onnx file.
+    """
+    folder = onnx_model_dir(model_name, onnx_dir)
+    fp32_path = os.path.join(folder, "model.onnx")
+    int8_path = os.path.join(folder, "model_int8.onnx")
+    if not os.path.exists(fp32_path):
+        import torch
+        st = load_sentence_transformer(model_name)
+        transformer, pooling = st[0], st[1]
+        tokenizer = transformer.tokenizer
+        sample = tokenizer(["export sample"], return_tensors="pt")
+        input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+
+        class _Wrapper(torch.nn.Module):
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
+
+            def forward(self, *inputs):
+                return self.model(**dict(zip(input_names, inputs)))[0]
+
+        os.makedirs(folder, exist_ok=True)
+        tmp = fp32_path + ".tmp"
+        dynamic = {0: "batch", 1: "sequence"}
+        with torch.no_grad():
+            # dynamo=False: the TorchScript exporter handles dynamic batch/sequence axes for BERT-style models
+            torch.onnx.export(_Wrapper(transformer.auto_model.eval()), tuple(sample[n] for n in input_names), tmp,
+                              input_names=input_names, output_names=["token_embeddings"],
+                              dynamic_axes={n: dynamic for n in input_names + ["token_embeddings"]},
+                              opset_version=17, dynamo=False)
+        tokenizer.save_pretrained(folder)
+        with open(os.path.join(folder, ONNX_CONFIG), "w") as f:
+            json.dump({"model_name": model_name, "max_seq_length": int(st.max_seq_length),
+                       "pooling": _pooling_mode(pooling), "inputs": input_names,
+                       "normalize": any(type(m).__name__ == "Normalize" for m in st)}, f, indent=2)
+        os.replace(tmp, fp32_path)
+    if not quantize:
+        return fp32_path
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        tmp = int8_path + ".tmp"
+        quantize_dynamic(fp32_path, tmp, weight_type=QuantType.QInt8)
+        os.replace(tmp, int8_path)
+    return int8_path
+
+
+class OnnxEncoder:
+    """onnxruntime session over an export_onnx() folder, with SentenceTransformer-style encode()."""
+
+    def __init__(self, model_path: str, threads: int = None):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        folder = os.path.dirname(model_path)
+        with open(os.path.join(folder, ONNX_CONFIG)) as f:
+            self.config = json.load(f)
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.tokenizer = AutoTokenizer.from_pretrained(folder)
+        self.max_seq_length = self.config["max_seq_length"]
+
+    def _pool(self, tokens: np.ndarray, mask: np.ndarray) -> np.ndarray:
+        mode = self.config["pooling"]
+        if mode == "cls":
+            return tokens[:, 0]
+        mask = mask[:, :, None].astype(tokens.dtype)
+        if mode == "max":
+            return np.where(mask > 0, tokens, -1e9).max(axis=1)
+        return (tokens * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def encode(self, sentences, batch_size: int = 32, show_progress_bar: bool = False,
+               convert_to_numpy: bool = True, normalize_embeddings: bool = False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        # length-sorted batches keep padding (and wasted compute) small, like SentenceTransformer.encode
+        order = np.argsort([-len(t) for t in texts], kind="stable")
+        out = [None] * len(texts)
+        for start in range(0, len(texts), batch_size):
+            rows = order[start:start + batch_size]
+            enc = self.tokenizer([texts[i] for i in rows], padding=True, truncation=True,
+                                 max_length=self.max_seq_length, return_tensors="np")
+            feeds = {name: enc[name].astype(np.int64) for name in self.config["inputs"]}
+            tokens = self.session.run(None, feeds)[0]
+            emb = self._pool(tokens, enc["attention_mask"])
+            for i, e in zip(rows, emb):
+                out[i] = e
+        emb = np.stack(out).astype(np.float32)
+        if normalize_embeddings or self.config.get("normalize"):
+            emb /= np.clip(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12, None)
+        return emb[0] if single else emb
+
+
+def set_torch_threads(threads: int = None):
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+
+
+def torch_threads() -> int:
+    import torch
+    return torch.get_num_threads()
+
+
+def load_encoder(model_name: str, backend: str = "torch", threads: int = None, onnx_dir: str = ONNX_DIR):
+    """Encoder for `model_name` on the given backend (see module docstring); threads caps intra-op threads."""
+    if backend not in ENCODER_BACKENDS:
+        raise ValueError(f"Unknown encoder backend {backend!r}; expected one of {', '.join(ENCODER_BACKENDS)}")
+    if backend.startswith("onnx"):
+        return OnnxEncoder(export_onnx(model_name, onnx_dir, quantize=backend == "onnx-int8"), threads=threads)
+    set_torch_threads(threads)
+    model = load_sentence_transformer(model_name)
+    if backend == "torch-int8":
+        import torch
+        model = torch.quantization.quantize_dynamic(model.eval(), {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+class LazyEncoder:
+    """Builds the encoder on first get()/encode(); concurrent first calls load it once."""
+
+    def __init__(self, model_name: str, loader=load_sentence_transformer):
+        self.model_name = model_name
+        self._loader = loader
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def get(self, **load_kwargs):
+        """The encoder; load_kwargs are passed to the loader if this call loads it."""
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._loader(self.model_name, **load_kwargs)
+        return self._model
+
+    def encode(self, *args, **kwargs):
+        return self.get().encode(*args, **kwargs)
@@ -0,0 +1,119 @@
+"""filters.py
+
+Structured filters over catalog rows, evaluated as precomputed bitmaps so they can
+be pushed into the FAISS search (ID selector) instead of post-filtering hits.
+
+Supported constraints (combined with AND; values within one list are OR-ed):
+  test_type      row matches if any of its test_type codes ("K", "P", "K,P", ...) is listed
+  max_duration   numeric duration column <= value (rows without a duration never match)
+  attributes     {column: [values]} exact, case-insensitive match on one of the categorical
+                 ATTRIBUTE_COLUMNS the catalog has (values are coded once at load time)
+"""
+import re
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from .cache import LRUCache
+except ImportError:  # imported from a script run inside backend/app
+    from cache import LRUCache
+
+DURATION_COLUMNS = ("duration", "duration_minutes", "assessment_length")
+# Columns "attributes" may filter on. Free-text / per-row columns (url, description, name) are
+# excluded: every distinct value would be a new mask.
+ATTRIBUTE_COLUMNS = ("remote_testing", "adaptive_irt", "job_levels", "languages", "test_type")
+
+
+def _norm(v) -> str:
+    return "" if v is None or (isinstance(v, float) and np.isnan(v)) else str(v).strip().lower()
+
+
+def filters_key(test_type: Optional[List[str]] = None, max_duration: Optional[float] = None,
+                attributes: Optional[Dict[str, List[str]]] = None) -> Optional[Tuple]:
+    """Canonical, hashable form of a filter (None when nothing is constrained)."""
+    parts = []
+    if test_type:
+        parts.append(("test_type", tuple(sorted({_norm(t) for t in test_type}))))
+    if max_duration is not None:
+        parts.append(("max_duration", float(max_duration)))
+    for col, values in sorted((attributes or {}).items()):
+        if values:
+            parts.append(("attr", col, tuple(sorted({_norm(v) for v in values}))))
+    return tuple(parts) or None
+
+
+class FilterIndex:
+    """Per-attribute boolean masks over catalog row ids (row i == FAISS id i)."""
+
+    def __init__(self, df: pd.DataFrame, cache_size: int = 256):
+        self.size = len(df)
+        self._value_masks = {}
+        # attributes: per column, one int code per row and value -> code
+        self._attr_codes = {}
+        for col in ATTRIBUTE_COLUMNS:
+            if col in df.columns:
+                codes, values = pd.factorize(df[col].map(_norm))
+                self._attr_codes[col] = (codes.astype(np.int32), {v: i for i, v in enumerate(values)})
+        self._allowed = LRUCache(cache_size)
+        # test_type: one mask per code, precomputed
+        if "test_type" in df.columns:
+            tokens = [set(t for t in re.split(r"[,;/\s]+", _norm(v)) if t) for v in df["test_type"].tolist()]
+            for code in set().union(*tokens) if tokens else ():
+                self._value_masks[("test_type", code)] = np.fromiter((code in t for t in tokens), bool, self.size)
+        # duration: sorted once so a max_duration mask is a prefix of the order
+        self.duration_column = next((c for c in DURATION_COLUMNS if c in df.columns), None)
+        if self.duration_column:
+            durations = pd.to_numeric(df[self.duration_column], errors="coerce").to_numpy(dtype=float)
+            known = np.flatnonzero(~np.isnan(durations))
+            order = known[np.argsort(durations[known], kind="stable")]
+            self._duration_order = order
+            self._duration_sorted = durations[order]
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the test_type masks, the attribute codes and the duration order."""
+        total = sum(m.nbytes for m in self._value_masks.values())
+        total += sum(codes.nbytes for codes, _ in self._attr_codes.values())
+        if self.duration_column:
+            total += self._duration_order.nbytes + self._duration_sorted.nbytes
+        return int(total)
+
+    def _attr_mask(self, col: str, values) -> np.ndarray:
+        """Rows whose `col` is any of `values`; built per call (allowed() memoizes whole filters)."""
+        if col not in self._attr_codes:
+            raise ValueError(f"Unknown filter attribute: {col!r}; filterable: {', '.join(sorted(self._attr_codes)) or 'none'}")
+        codes, lookup = self._attr_codes[col]
+        wanted = [lookup[v] for v in values if v in lookup]
+        return np.isin(codes, wanted) if wanted else np.zeros(self.size, dtype=bool)
+
+    def mask(self, key: Tuple) -> np.ndarray:
+        mask = np.ones(self.size, dtype=bool)
+        for part in key:
+            if part[0] == "test_type":
+                any_of = np.zeros(self.size, dtype=bool)
+                for code in part[1]:
+                    m = self._value_masks.get(("test_type", code))
+                    if m is not None:
+                        any_of |= m
+                mask &= any_of
+            elif part[0] == "max_duration":
+                if not self.duration_column:
+                    raise ValueError("Catalog has no duration column to filter on")
+                m = np.zeros(self.size, dtype=bool)
+                m[self._duration_order[:np.searchsorted(self._duration_sorted, part[1], side="right")]] = True
+                mask &= m
+            else:
+                _, col, values = part
+                mask &= self._attr_mask(col, values)
+        return mask
+
+    def allowed(self, key: Tuple):
+        """(sorted allowed row ids, little-endian packed bitmap for faiss.IDSelectorBitmap), memoized per filter."""
+        hit = self._allowed.get(key)
+        if hit is not None:
+            return hit
+        mask = self.mask(key)
+        hit = (np.flatnonzero(mask), np.packbits(mask, bitorder="little"))
+        self._allowed.put(key, hit)
+        return hit
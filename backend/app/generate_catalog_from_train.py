@@ -6,30 +6,43 @@ Reads `../../data/train.csv`, extracts unique `Assessment_url` values and
 attempts to fetch the page title to use as `assessment_name`. Falls back to
 using the URL as the name when network/title extraction fails.
 
+Pages are fetched concurrently through crawler.Crawler, with a conditional-GET
+page cache in `page_cache/` so re-runs skip unchanged pages.
+
 Usage: run this from `backend/app` (it uses paths relative to this folder):
     python generate_catalog_from_train.py
 """
 import os
 import pandas as pd
-import requests
 from bs4 import BeautifulSoup
+from crawler import Crawler
 
 
 TRAIN_PATH = os.path.join("..", "..", "data", "train.csv")
 OUT_PATH = os.path.join("..", "..", "data", "catalog.csv")
+CACHE_DIR = "page_cache"
+
+
+def title_from_html(html: str):
+    s = BeautifulSoup(html, "html.parser")
+    h1 = s.find("h1")
+    if h1 and h1.get_text(strip=True):
+        return h1.get_text(strip=True)
+    title = s.title.string if s.title and s.title.string else None
+    if title:
+        return title.strip()
+    return None
 
 
-def fetch_title(url: str) -> str:
+def fetch_title(url: str, crawler: Crawler = None) -> str:
     try:
-        r = requests.get(url, timeout=8)
-        if r.status_code == 200:
-            s = BeautifulSoup(r.text, "html.parser")
-            h1 = s.find("h1")
-            if h1 and h1.get_text(strip=True):
-                return h1.get_text(strip=True)
-            title = s.title.string if s.title and s.title.string else None
-            if title:
-                return title.strip()
+        if crawler is None:
+            with Crawler(max_workers=1, timeout=8) as c:
+                page = c.fetch(url)
+        else:
+            page = crawler.fetch(url)
+        if page.ok:
+            return title_from_html(page.text) or url
     except Exception:
         pass
     return url
@@ -43,9 +56,12 @@ def main():
         raise ValueError("train.csv must contain an 'Assessment_url' column")
     urls = df["Assessment_url"].dropna().unique().tolist()
     rows = []
-    for u in urls:
-        name = fetch_title(u)
-        rows.append({"assessment_name": name, "url": u, "description": "", "test_type": ""})
+    with Crawler(max_workers=8, cache_dir=CACHE_DIR, timeout=8) as crawler:
+        for u, page in zip(urls, crawler.fetch_all(urls)):
+            name = (title_from_html(page.text) if page.ok else None) or u
+            rows.append({"assessment_name": name, "url": u, "description": "", "test_type": ""})
+        print(f"Fetched {crawler.stats['fetched']}, unchanged (cached) {crawler.stats['not_modified']}, "
+              f"errors {crawler.stats['errors']}")
     out_df = pd.DataFrame(rows)
     out_dir = os.path.dirname(OUT_PATH)
     os.makedirs(out_dir, exist_ok=True)
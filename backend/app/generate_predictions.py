@@ -6,20 +6,35 @@ Query,Assessment_url
 Query 1,Recommendation 1 (URL)
 Query 1,Recommendation 2 (URL)
 ...
+
+With --batch, queries are sent to POST /recommend/batch in chunks of --batch-size
+and the NDJSON response is consumed line by line instead of one request per query.
+
+The input is read --chunk-size rows at a time and each chunk's rows are appended to
+the output as soon as it completes, with progress checkpointed in <output>.ckpt;
+rerun with --resume to continue an interrupted run.
+
+With --async, up to --concurrency requests to POST /recommend are in flight at once
+over pooled keep-alive connections, with jittered retries on timeouts, connection
+errors and 429/502/503/504 (recommend_client.py); --in-process serves them from
+app.main in this process instead of a running server. A throughput / latency summary is printed at the end.
 """
+import os
+import sys
 import argparse
-import pandas as pd
 import requests
 import json
+from prediction_stream import PredictionWriter, prefetch, read_query_chunks
+from recommend_client import RecommendClient
 
-API_URL = "http://localhost:8000/recommend"
+BASE_URL = "http://localhost:8000"
+API_URL = BASE_URL + "/recommend"
+BATCH_API_URL = API_URL + "/batch"
 
-def generate(input_csv, output_csv, k=5):
-    df = pd.read_csv(input_csv)
-    if 'Query' not in df.columns:
-        raise ValueError("Input CSV must have a 'Query' column")
+def query_rows(queries, k=5):
+    """One POST /recommend per query; returns the (query, url) output rows."""
     rows = []
-    for q in df['Query'].astype(str).tolist():
+    for q in queries:
         payload = {"query": q, "k": k}
         r = requests.post(API_URL, json=payload, timeout=30)
         if r.status_code != 200:
@@ -28,15 +43,90 @@ def generate(input_csv, output_csv, k=5):
         data = r.json()
         recs = data.get("recommendations", [])
         for rec in recs:
-            rows.append({"Query": q, "Assessment_url": rec.get("url","")})
-    out_df = pd.DataFrame(rows)
-    out_df.to_csv(output_csv, index=False)
+            rows.append((q, rec.get("url","")))
+    return rows
+
+def batch_rows(session, queries, k=5, batch_size=256):
+    """POST /recommend/batch in batch_size slices, consuming the NDJSON response line by line."""
+    rows = []
+    for start in range(0, len(queries), batch_size):
+        chunk = queries[start:start + batch_size]
+        r = session.post(BATCH_API_URL, json={"queries": chunk, "k": k}, timeout=300, stream=True)
+        if r.status_code != 200:
+            print("Warning: batch request failed:", r.status_code, r.text)
+            continue
+        for q, line in zip(chunk, (l for l in r.iter_lines() if l)):
+            data = json.loads(line)
+            if data.get("error"):
+                print("Warning: request failed for query:", q, data["error"])
+            for rec in data.get("recommendations", []):
+                rows.append((q, rec.get("url","")))
+    return rows
+
+def async_rows(client, queries, k=5):
+    """Concurrent POST /recommend through a RecommendClient; rows stay in input order."""
+    return [(q, rec.get("url","")) for q, recs in zip(queries, client.fetch(queries, k=k)) for rec in recs]
+
+def stream(input_csv, output_csv, fetch, chunk_size=1000, resume=False, prefetch_depth=1):
+    """
+    Reads input_csv chunk_size rows at a time, maps each chunk to output rows with fetch(queries)
+    and appends them to output_csv, checkpointing after every chunk (prediction_stream.py).
+    With prefetch_depth > 0 the next chunks are parsed and fetched on a background thread
+    while the current one is written.
+    """
+    writer = PredictionWriter(output_csv, input_csv, resume=resume)
+    if writer.resumed:
+        print(f"Resuming after {writer.rows_done} input rows ({writer.rows_written} output rows)")
+    chunks = read_query_chunks(input_csv, chunk_size, skip_rows=writer.rows_done)
+    with writer:
+        for queries, rows in prefetch(((c, fetch(c)) for c in chunks), prefetch_depth):
+            writer.write_chunk(rows, len(queries))
+            print(f"  {writer.rows_done} queries done, {writer.rows_written} rows written", flush=True)
     print("Wrote predictions to", output_csv)
 
+def generate(input_csv, output_csv, k=5, chunk_size=1000, resume=False, prefetch_depth=1):
+    stream(input_csv, output_csv, lambda queries: query_rows(queries, k=k),
+           chunk_size=chunk_size, resume=resume, prefetch_depth=prefetch_depth)
+
+def generate_batch(input_csv, output_csv, k=5, batch_size=256, chunk_size=1000, resume=False, prefetch_depth=1):
+    with requests.Session() as session:
+        stream(input_csv, output_csv, lambda queries: batch_rows(session, queries, k=k, batch_size=batch_size),
+               chunk_size=chunk_size, resume=resume, prefetch_depth=prefetch_depth)
+
+def generate_async(input_csv, output_csv, k=5, concurrency=16, retries=3, in_process=False,
+                   chunk_size=1000, resume=False, prefetch_depth=1):
+    app = None
+    if in_process:
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        from app.main import app
+    with RecommendClient(BASE_URL, concurrency=concurrency, retries=retries, app=app) as client:
+        stream(input_csv, output_csv, lambda queries: async_rows(client, queries, k=k),
+               chunk_size=chunk_size, resume=resume, prefetch_depth=prefetch_depth)
+        print(client.summary())
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--input", type=str, default="../../data/Gen_AI_Dataset.csv", help="test CSV with Query column")
     parser.add_argument("--output", type=str, default="../../data/predictions.csv", help="output csv as required in Appendix 3")
     parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--batch", action="store_true", help="use POST /recommend/batch (NDJSON) instead of one request per query")
+    parser.add_argument("--batch-size", type=int, default=256, help="queries per /recommend/batch request")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="concurrent POST /recommend requests over pooled keep-alive connections")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight with --async")
+    parser.add_argument("--retries", type=int, default=3, help="retries per query on timeouts / 429 / 502-504 with --async")
+    parser.add_argument("--in-process", action="store_true",
+                        help="with --async, call app.main in this process (ASGI, like TestClient) instead of the server")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="input rows read and checkpointed per step")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted run from <output>.ckpt")
+    parser.add_argument("--prefetch", type=int, default=1,
+                        help="chunks read and requested ahead on a background thread (0 = no overlap)")
     args = parser.parse_args()
-    generate(args.input, args.output, k=args.k)
+    opts = dict(chunk_size=args.chunk_size, resume=args.resume, prefetch_depth=args.prefetch)
+    if args.use_async:
+        generate_async(args.input, args.output, k=args.k, concurrency=args.concurrency, retries=args.retries,
+                       in_process=args.in_process, **opts)
+    elif args.batch:
+        generate_batch(args.input, args.output, k=args.k, batch_size=args.batch_size, **opts)
+    else:
+        generate(args.input, args.output, k=args.k, **opts)
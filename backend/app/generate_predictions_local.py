@@ -7,68 +7,132 @@ unlabeled test set prior to submission.
 
 Usage (from backend/app):
     python generate_predictions_local.py --input ../../data/test.csv --output ../../data/predictions.csv -k 5
+    add --timings / --metrics-out run.prom for per-stage latency (encode/search/metadata/serialize)
+
+The input is streamed --chunk-size rows at a time and results are appended as each
+chunk finishes; after an interruption, rerun with --resume to continue from the last
+completed chunk.
+
+Queries precomputed in the query store (query_store.py fill) are not re-encoded; when every
+query is stored the encoder isn't loaded at all. --no-query-store encodes everything.
 """
 import argparse
 import pandas as pd
 import os
+import time
 import numpy as np
-from sentence_transformers import SentenceTransformer
-import faiss
+from encoders import ENCODER_BACKENDS
+from long_queries import LONG_QUERY_MODES
+from index_backends import load_index as load_vectors
+from snapshots import resolve_current
+from metrics import REGISTRY, stage, stage_summary
+from prediction_stream import PredictionWriter, prefetch, read_query_chunks
+from query_store import QUERY_STORE_DIR, stored_encoder
 
 MODEL_NAME = "all-MiniLM-L6-v2"
 
-def load_index(model_dir="model_store"):
-    idx = faiss.read_index(os.path.join(model_dir, "faiss.index"))
-    embs = np.load(os.path.join(model_dir, "embeddings.npy"))
+def load_index(model_dir="model_store", nprobe=None, ef_search=None, mmap=True):
+    model_dir = resolve_current(model_dir)
+    idx, embs = load_vectors(model_dir, mmap=mmap, nprobe=nprobe, ef_search=ef_search)
     meta = pd.read_csv(os.path.join(model_dir, "metadata.csv"))
     return idx, embs, meta
 
-def search_topk(query, index, metadata, model, k=5, min_score=0.2):
-    q_emb = model.encode([query], show_progress_bar=False, normalize_embeddings=True)[0]
-    D, I = index.search(q_emb.reshape(1, -1).astype('float32'), k*2)
-    rows = []
-    for score, idx in zip(D[0], I[0]):
-        if idx < 0:
-            continue
-        if score < min_score:
-            continue
-        row = metadata.iloc[idx]
-        rows.append({
-            "assessment_name": str(row.get("assessment_name","")),
-            "url": str(row.get("url","")),
-            "score": float(score)
-        })
-        if len(rows) >= k:
-            break
-    return rows
+def search_matrix(index, q_embs, k=5, min_score=0.2):
+    """
+    Top-k search for a matrix of query embeddings: one index.search over all rows.
+    Returns (I, keep) where keep[r, c] marks the hits to emit for row r: the first k
+    with score >= min_score, or, if a row has none, the plain top k.
+    """
+    D, I = index.search(q_embs, k*2)
+    valid = I >= 0
+    passed = valid & (D >= min_score)
+    keep = passed & (np.cumsum(passed, axis=1) <= k)
+    # rows with no hit above the threshold fall back to the top k regardless of score
+    fallback = valid & (np.arange(I.shape[1]) < k)
+    keep = np.where(passed.any(axis=1, keepdims=True), keep, fallback)
+    return I, keep
+
+def generate(input_csv, output_csv, k=5, min_score=0.2, batch_size=256, nprobe=None, ef_search=None,
+             timings=False, metrics_out=None, encoder_backend="torch", encoder_threads=None,
+             long_query_mode="truncate", token_budget=512, strip_boilerplate=False,
+             chunk_size=10000, resume=False, prefetch_depth=2, query_store=QUERY_STORE_DIR):
+    """
+    Streams input_csv chunk_size rows at a time: encode -> search -> append to output_csv,
+    checkpointing after every chunk (see prediction_stream.py). With prefetch_depth > 0, CSV
+    parsing and encoding each run on their own thread, up to prefetch_depth chunks ahead of
+    search + write, so the three stages overlap; memory stays bounded by the chunk size.
+    """
+    index, embs, metadata = load_index(nprobe=nprobe, ef_search=ef_search)
+    model = stored_encoder(MODEL_NAME, backend=encoder_backend, threads=encoder_threads, store_dir=query_store,
+                           long_query_mode=long_query_mode, token_budget=token_budget,
+                           strip_boilerplate=strip_boilerplate)
+    meta_urls = metadata['url'].to_numpy()
+    writer = PredictionWriter(output_csv, input_csv, resume=resume)
+    if writer.resumed:
+        print(f"Resuming after {writer.rows_done} input rows ({writer.rows_written} output rows)")
+
+    def encoded(chunks):
+        for chunk in chunks:
+            queries = np.asarray(chunk, dtype=object)
+            # encode each distinct query of the chunk once
+            codes, uniques = pd.factorize(queries)
+            with stage("encode"):
+                q_embs = model.encode(list(uniques), batch_size=batch_size, show_progress_bar=False,
+                                      convert_to_numpy=True, normalize_embeddings=True).astype('float32')
+            yield queries, codes, q_embs
 
-def generate(input_csv, output_csv, k=5):
-    index, embs, metadata = load_index()
-    model = SentenceTransformer(MODEL_NAME)
-    df = pd.read_csv(input_csv)
-    if 'Query' not in df.columns:
-        raise ValueError("Input CSV must have a 'Query' column")
-    out_rows = []
-    for q in df['Query'].astype(str).tolist():
-        recs = search_topk(q, index, metadata, model, k=k)
-        if not recs:
-            # if no results due to score threshold, fall back to taking top k regardless
-            D, I = index.search(model.encode([q], normalize_embeddings=True).astype('float32'), k)
-            for idx in I[0]:
-                if idx < 0:
-                    continue
-                out_rows.append({"Query": q, "Assessment_url": metadata.iloc[idx]['url']})
-        else:
-            for r in recs:
-                out_rows.append({"Query": q, "Assessment_url": r['url']})
-    out_df = pd.DataFrame(out_rows)
-    out_df.to_csv(output_csv, index=False)
-    print(f"Wrote {len(out_rows)} rows to {output_csv}")
+    t0 = time.perf_counter()
+    n_queries = n_unique = 0
+    chunks = prefetch(read_query_chunks(input_csv, chunk_size, skip_rows=writer.rows_done), prefetch_depth)
+    with writer:
+        for queries, codes, q_embs in prefetch(encoded(chunks), prefetch_depth):
+            with stage("search"):
+                I, keep = search_matrix(index, q_embs, k=k, min_score=min_score)
+            with stage("metadata"):
+                # expand back to input rows; np.nonzero walks row-major so query order and rank order are kept
+                rows, cols = np.nonzero(keep[codes])
+                urls = meta_urls[I[codes[rows], cols]]
+            with stage("serialize"):
+                writer.write_chunk(zip(queries[rows], urls), len(queries))
+            n_queries += len(queries)
+            n_unique += len(q_embs)
+            print(f"  {writer.rows_done} input rows done, {writer.rows_written} rows written", flush=True)
+    elapsed = time.perf_counter() - t0
+    print(f"Wrote {writer.rows_written} rows to {output_csv}")
+    print(f"{n_queries} queries ({n_unique} unique per chunk) in {elapsed:.2f}s -> "
+          f"{n_queries / max(elapsed, 1e-9):.1f} queries/s")
+    if timings:
+        print("Stage latency (one observation per chunk and stage):\n" + stage_summary())
+    if metrics_out:
+        REGISTRY.write(metrics_out)
 
 if __name__ == '__main__':
     p = argparse.ArgumentParser()
     p.add_argument('--input', type=str, default='../../data/test.csv')
     p.add_argument('--output', type=str, default='../../data/predictions.csv')
     p.add_argument('-k', type=int, default=5)
+    p.add_argument('--min-score', type=float, default=0.2, help='score threshold; queries with no hit above it fall back to plain top-k')
+    p.add_argument('--batch-size', type=int, default=256, help='encoder batch size')
+    p.add_argument('--nprobe', type=int, help='IVF lists to visit (IVF/PQ indexes)')
+    p.add_argument('--ef-search', type=int, help='HNSW search depth (HNSW indexes)')
+    p.add_argument('--timings', action='store_true', help='print per-stage latency (encode/search/metadata/serialize)')
+    p.add_argument('--metrics-out', type=str, help='write stage histograms in Prometheus text format')
+    p.add_argument('--encoder-backend', type=str, default='torch', choices=ENCODER_BACKENDS, help='query encoder backend')
+    p.add_argument('--encoder-threads', type=int, help='intra-op threads for the encoder')
+    p.add_argument('--long-query-mode', type=str, default='truncate', choices=LONG_QUERY_MODES,
+                   help='queries over the model max length: truncate, chunk+pool, or chunk up to --token-budget')
+    p.add_argument('--token-budget', type=int, default=512, help='max tokens encoded per query in budget mode')
+    p.add_argument('--strip-boilerplate', action='store_true', help='drop benefits/EEO/company-blurb text from queries')
+    p.add_argument('--chunk-size', type=int, default=10000, help='input rows read, encoded and written per step')
+    p.add_argument('--resume', action='store_true', help='continue an interrupted run from <output>.ckpt')
+    p.add_argument('--prefetch', type=int, default=2,
+                   help='chunks parsed/encoded ahead on background threads (0 = no overlap)')
+    p.add_argument('--query-store', type=str, default=QUERY_STORE_DIR, help='precomputed query embeddings')
+    p.add_argument('--no-query-store', action='store_true', help='encode every query')
     args = p.parse_args()
-    generate(args.input, args.output, k=args.k)
+    generate(args.input, args.output, k=args.k, min_score=args.min_score, batch_size=args.batch_size,
+             nprobe=args.nprobe, ef_search=args.ef_search, timings=args.timings, metrics_out=args.metrics_out,
+             encoder_backend=args.encoder_backend, encoder_threads=args.encoder_threads,
+             long_query_mode=args.long_query_mode, token_budget=args.token_budget,
+             strip_boilerplate=args.strip_boilerplate, chunk_size=args.chunk_size, resume=args.resume,
+             prefetch_depth=args.prefetch, query_store=None if args.no_query_store else args.query_store)
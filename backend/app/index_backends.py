@@ -0,0 +1,226 @@
+"""index_backends.py
+
+FAISS index construction for the model store.
+
+Index specs (build_index.py --index):
+  flat   exact inner-product search (IndexFlatIP)
+  ivf    IVF-flat, nlist ~ 4*sqrt(n)             search param: nprobe
+  hnsw   HNSW graph (M=32)                        search param: efSearch
+  ivfpq  IVF + product quantization (compressed)  search param: nprobe
+  opq    OPQ rotation + IVF-PQ (compressed)       search param: nprobe
+  auto   picks one of the above from the row count
+Any other string is passed to faiss.index_factory as-is (e.g. "IVF256,SQ8").
+All indexes use the inner-product metric on normalized vectors (cosine).
+
+load_index() reads model_store/faiss.index, or rebuilds the index from the
+(memory-mapped) embeddings.npy when the build skipped writing faiss.index. Only
+indexes that need no training (flat, hnsw) can be rebuilt that way: ivf / ivfpq /
+opq would re-run k-means / PQ training on every load and differ from the index
+the build measured, so their faiss.index is always written.
+"""
+import os
+import json
+import time
+import numpy as np
+import faiss
+from typing import Optional
+
+try:
+    from .embedding_store import load_embeddings
+except ImportError:  # imported from a script run inside backend/app
+    from embedding_store import load_embeddings
+
+INDEX_SPECS = ("auto", "flat", "ivf", "hnsw", "ivfpq", "opq")
+
+# row-count thresholds for --index auto
+AUTO_FLAT_MAX_ROWS = 20000
+AUTO_HNSW_MAX_ROWS = 500000
+
+
+def resolve_spec(spec: str, n_rows: int) -> str:
+    if spec != "auto":
+        return spec
+    if n_rows <= AUTO_FLAT_MAX_ROWS:
+        return "flat"
+    if n_rows <= AUTO_HNSW_MAX_ROWS:
+        return "hnsw"
+    return "opq"
+
+
+def _pq_m(dim: int) -> int:
+    """Number of PQ sub-quantizers: ~8 dims each, must divide dim."""
+    for m in (dim // 8, 64, 48, 32, 16, 8, 4, 2, 1):
+        if m and dim % m == 0:
+            return m
+    return 1
+
+
+def factory_string(spec: str, dim: int, n_rows: int) -> str:
+    """faiss.index_factory description for a (resolved) spec."""
+    # IVF needs ~39 training points per centroid; keep nlist within what the catalog can train
+    nlist = int(max(1, min(4 * np.sqrt(max(n_rows, 1)), n_rows // 39 or 1)))
+    m = _pq_m(dim)
+    # 8-bit PQ codebooks need >= 256 training points; shrink them for tiny catalogs
+    nbits = int(max(1, min(8, np.log2(max(n_rows, 2)))))
+    if spec == "flat":
+        return "Flat"
+    if spec == "ivf":
+        return f"IVF{nlist},Flat"
+    if spec == "hnsw":
+        return "HNSW32,Flat"
+    if spec == "ivfpq":
+        return f"IVF{nlist},PQ{m}x{nbits}"
+    if spec == "opq":
+        # OPQ trains its own 8-bit PQ, so tiny catalogs get plain IVF-PQ
+        prefix = f"OPQ{m}," if nbits == 8 else ""
+        return f"{prefix}IVF{nlist},PQ{m}x{nbits}"
+    return spec
+
+
+def _new_index(desc: str, dim: int):
+    if desc == "Flat":
+        return faiss.IndexFlatIP(dim)  # cosine by normalizing
+    return faiss.index_factory(dim, desc, faiss.METRIC_INNER_PRODUCT)
+
+
+def needs_training(desc: str, dim: int) -> bool:
+    """True if an index of this factory string must be trained (IVF / PQ / OPQ) before adding vectors."""
+    return not _new_index(desc, dim).is_trained
+
+
+def build_faiss_index(embeddings: np.ndarray, spec: str = "flat"):
+    """Create, train (if needed) and fill an index. Returns (index, factory_string)."""
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    n, dim = embeddings.shape
+    desc = factory_string(resolve_spec(spec, n), dim, n)
+    index = _new_index(desc, dim)
+    if not index.is_trained:
+        index.train(embeddings)
+    index.add(embeddings)
+    return index, desc
+
+
+def index_from_embeddings(embeddings, spec: str = "flat", chunk_size: int = 65536,
+                          train_size: int = 100000, seed: int = 0):
+    """
+    Same as build_faiss_index, but reads an embedding_store.Embeddings block by block
+    (float16/int8 and memory-mapped stores never get a full float32 copy).
+    """
+    n, dim = embeddings.shape
+    desc = factory_string(resolve_spec(spec, n), dim, n)
+    index = _new_index(desc, dim)
+    if not index.is_trained:
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(n, size=min(n, train_size), replace=False))
+        index.train(embeddings.rows(sample))
+    for block in embeddings.iter_chunks(chunk_size):
+        index.add(block)
+    return index, desc
+
+
+def load_index(model_dir: str, mmap: bool = True, nprobe: Optional[int] = None,
+               ef_search: Optional[int] = None):
+    """
+    (index, embeddings) for a model store. embeddings is an embedding_store.Embeddings
+    (memory-mapped unless mmap=False) or None when embeddings.npy is absent.
+    """
+    emb_path = os.path.join(model_dir, "embeddings.npy")
+    embeddings = load_embeddings(emb_path, mmap=mmap) if os.path.exists(emb_path) else None
+    index_path = os.path.join(model_dir, "faiss.index")
+    if os.path.exists(index_path):
+        index = faiss.read_index(index_path)
+    elif embeddings is not None:
+        manifest_path = os.path.join(model_dir, "manifest.json")
+        spec = "flat"
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                spec = json.load(f).get("index", "flat")
+        desc = factory_string(resolve_spec(spec, len(embeddings)), embeddings.shape[1], len(embeddings))
+        if needs_training(desc, embeddings.shape[1]):
+            raise ValueError(f"{model_dir} has no faiss.index and its index ({desc}) needs training; "
+                             "rebuild it without --no-index-file")
+        index, _ = index_from_embeddings(embeddings, spec)
+    else:
+        raise FileNotFoundError(f"{model_dir} has neither faiss.index nor embeddings.npy")
+    return configure_search(index, nprobe=nprobe, ef_search=ef_search), embeddings
+
+
+def configure_search(index, nprobe: Optional[int] = None, ef_search: Optional[int] = None):
+    """Apply search-time parameters; ones that don't apply to this index type are ignored."""
+    ps = faiss.ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        if value is None:
+            continue
+        try:
+            ps.set_index_parameter(index, name, int(value))
+        except RuntimeError:
+            pass
+    return index
+
+
+def _selector_params(index, sel):
+    """SearchParameters carrying `sel`, keeping the index's own nprobe / efSearch."""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexPreTransform):
+        params = faiss.SearchParametersPreTransform()
+        params.index_params = _selector_params(index.index, sel)
+        params.sel = sel
+        return params
+    if isinstance(index, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=sel, nprobe=index.nprobe)
+    if isinstance(index, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=sel, efSearch=index.hnsw.efSearch)
+    return faiss.SearchParameters(sel=sel)
+
+
+def search_filtered(index, q_embs: np.ndarray, k: int, allowed_ids: np.ndarray, bitmap: np.ndarray,
+                    embeddings=None, brute_force_max: int = 4096):
+    """
+    Top-k restricted to `allowed_ids`. Small allowed sets are scored exactly against their
+    embeddings (cost ~ allowed set size); larger ones go through the index with an ID selector,
+    so cost never exceeds an unfiltered search and no result slots are lost to post-filtering.
+    Returns (D, I) like index.search, padded with -inf / -1.
+    """
+    b = len(q_embs)
+    D = np.full((b, k), -np.inf, dtype=np.float32)
+    I = np.full((b, k), -1, dtype=np.int64)
+    if allowed_ids.size == 0:
+        return D, I
+    if allowed_ids.size == index.ntotal:
+        return index.search(q_embs, k)
+    if embeddings is not None and allowed_ids.size <= brute_force_max:
+        sims = q_embs @ embeddings.rows(allowed_ids).T
+        kk = min(k, allowed_ids.size)
+        top = np.argpartition(-sims, kk - 1, axis=1)[:, :kk]
+        top_scores = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        D[:, :kk] = np.take_along_axis(top_scores, order, axis=1)
+        I[:, :kk] = allowed_ids[np.take_along_axis(top, order, axis=1)]
+        return D, I
+    sel = faiss.IDSelectorBitmap(index.ntotal, faiss.swig_ptr(bitmap))
+    D, I = index.search(q_embs, k, params=_selector_params(index, sel))
+    return D, I
+
+
+def index_memory_bytes(index) -> int:
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def evaluate_index(index, exact_index, queries: np.ndarray, k: int = 10) -> dict:
+    """recall@k of `index` against exact search, single-query latency percentiles and memory."""
+    queries = np.ascontiguousarray(queries, dtype='float32')
+    _, truth = exact_index.search(queries, k)
+    found = np.empty_like(truth)
+    lat = np.empty(len(queries))
+    for j in range(len(queries)):
+        t0 = time.perf_counter()
+        _, found[j:j + 1] = index.search(queries[j:j + 1], k)
+        lat[j] = time.perf_counter() - t0
+    hits = [len(set(t[t >= 0]) & set(f[f >= 0])) / max(1, (t >= 0).sum()) for t, f in zip(truth, found)]
+    return {
+        "recall_at_k": float(np.mean(hits)),
+        "k": k,
+        "p50_ms": float(np.percentile(lat, 50) * 1000),
+        "p99_ms": float(np.percentile(lat, 99) * 1000),
+        "memory_bytes": index_memory_bytes(index),
+    }
@@ -0,0 +1,155 @@
+"""lexical_index.py
+
+BM25 inverted index over the catalog's assessment_name + description, for the lexical
+fast path and hybrid (BM25 + FAISS) retrieval.
+
+build_index.py writes it next to the index as lexical_index.npz:
+    terms                 sorted vocabulary
+    indptr, docs, weights postings per term (CSR): row ids and their precomputed BM25 weight
+    name_indptr, name_terms  term ids of each row's assessment_name (CSR, sorted)
+so a query is scored by summing a few posting slices; nothing is re-tokenized at load time.
+Name tokens are counted NAME_WEIGHT times, so a keyword in the title outranks one in the text.
+
+confident() decides whether BM25 alone can answer a query: short keyword queries ("Core Java",
+"SQL", "Automata") whose terms all occur in the best hit's name, or a query naming an
+assessment exactly (main.py tops lists shorter than the candidate count up from the best hit's
+neighbor graph, and encodes if that still leaves fewer than k). Everything else goes
+through the encoder, and rrf_fuse() merges the dense and BM25 candidate lists by reciprocal rank.
+"""
+import os
+import re
+from collections import Counter
+from typing import Optional
+import numpy as np
+
+LEXICAL_FILE = "lexical_index.npz"
+NAME_WEIGHT = 2
+RRF_K = 60
+
+TOKEN = re.compile(r"[a-z0-9]+[+#]*")  # keeps c++ / c#
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have i in is it of on or our the their this to we who will with you your"
+    .split())
+
+
+def tokenize(text) -> list:
+    return [t for t in TOKEN.findall(str(text).lower()) if t not in STOPWORDS]
+
+
+class LexicalIndex:
+    """Read-only BM25 index; row ids match the FAISS ids / metadata rows."""
+
+    def __init__(self, terms, indptr, docs, weights, name_indptr, name_terms):
+        self.terms = terms
+        self.indptr = indptr
+        self.docs = docs
+        self.weights = weights
+        self.name_indptr = name_indptr
+        self.name_terms = name_terms
+        self.vocab = {t: i for i, t in enumerate(terms.tolist())}
+
+    @classmethod
+    def build(cls, names, descriptions, k1: float = 1.2, b: float = 0.75) -> "LexicalIndex":
+        name_tokens = [tokenize(n) for n in names]
+        doc_tf = [Counter(nt * NAME_WEIGHT + tokenize(d if isinstance(d, str) else ""))
+                  for nt, d in zip(name_tokens, descriptions)]
+        terms = sorted(set().union(*doc_tf)) if doc_tf else []
+        vocab = {t: i for i, t in enumerate(terms)}
+        lengths = np.array([sum(tf.values()) for tf in doc_tf], dtype=np.float32)
+        avg_len = float(lengths.mean()) if len(lengths) and lengths.mean() > 0 else 1.0
+        postings = [[] for _ in terms]
+        for row, tf in enumerate(doc_tf):
+            for t, f in tf.items():
+                postings[vocab[t]].append((row, f))
+        n_docs = len(doc_tf)
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        indptr[1:] = np.cumsum([len(p) for p in postings])
+        docs = np.empty(indptr[-1], dtype=np.int32)
+        weights = np.empty(indptr[-1], dtype=np.float32)
+        for i, plist in enumerate(postings):
+            rows, tf = np.array(plist, dtype=np.float32).T
+            idf = np.log(1 + (n_docs - len(plist) + 0.5) / (len(plist) + 0.5))
+            norm = k1 * (1 - b + b * lengths[rows.astype(np.intp)] / avg_len)
+            docs[indptr[i]:indptr[i + 1]] = rows
+            weights[indptr[i]:indptr[i + 1]] = idf * tf * (k1 + 1) / (tf + norm)
+        name_ids = [sorted({vocab[t] for t in nt}) for nt in name_tokens]
+        name_indptr = np.zeros(n_docs + 1, dtype=np.int64)
+        name_indptr[1:] = np.cumsum([len(ids) for ids in name_ids])
+        name_terms = np.array([i for ids in name_ids for i in ids], dtype=np.int32)
+        return cls(np.array(terms, dtype=str), indptr, docs, weights, name_indptr, name_terms)
+
+    def save(self, path: str):
+        with open(path, "wb") as f:
+            np.savez(f, terms=self.terms, indptr=self.indptr, docs=self.docs, weights=self.weights,
+                     name_indptr=self.name_indptr, name_terms=self.name_terms)
+
+    @classmethod
+    def load(cls, model_dir: str) -> Optional["LexicalIndex"]:
+        """The index stored in model_dir, or None if the build didn't write one."""
+        path = os.path.join(model_dir, LEXICAL_FILE)
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as z:
+            return cls(z["terms"], z["indptr"], z["docs"], z["weights"], z["name_indptr"], z["name_terms"])
+
+    def __len__(self):
+        return len(self.name_indptr) - 1
+
+    @property
+    def nbytes(self) -> int:
+        return int(sum(a.nbytes for a in (self.terms, self.indptr, self.docs, self.weights,
+                                          self.name_indptr, self.name_terms)))
+
+    def query_terms(self, text) -> list:
+        """Distinct term ids of a query; -1 for terms the catalog never uses."""
+        return [self.vocab.get(t, -1) for t in dict.fromkeys(tokenize(text))]
+
+    def search(self, term_ids, n: int, bitmap: Optional[np.ndarray] = None):
+        """
+        (scores, ids) of the top-n rows by BM25, best first; only rows matching a query term
+        (and allowed by `bitmap`, the packed filter bitmap from FilterIndex.allowed).
+        """
+        scores = np.zeros(len(self), dtype=np.float32)
+        for t in term_ids:
+            if t >= 0:
+                s, e = self.indptr[t], self.indptr[t + 1]
+                scores[self.docs[s:e]] += self.weights[s:e]
+        hits = np.flatnonzero(scores)
+        if bitmap is not None:
+            hits = hits[(bitmap[hits >> 3] >> (hits & 7)) & 1 == 1]
+        if len(hits) > n:
+            hits = hits[np.argpartition(-scores[hits], n - 1)[:n]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return scores[hits], hits.astype(np.int64)
+
+    def name_covers(self, row: int, term_ids) -> bool:
+        name = self.name_terms[self.name_indptr[row]:self.name_indptr[row + 1]]
+        return bool(np.isin(term_ids, name).all())
+
+    def confident(self, term_ids, top_row: int, max_terms: int = 3) -> bool:
+        """
+        True if the BM25 top hit can be served without the encoder: every query term is a catalog
+        term found in the hit's name, and the query is a short keyword query (<= max_terms terms)
+        or spells out the whole name.
+        """
+        if not term_ids or min(term_ids) < 0 or not self.name_covers(top_row, term_ids):
+            return False
+        return len(term_ids) <= max_terms or \
+            len(term_ids) == self.name_indptr[top_row + 1] - self.name_indptr[top_row]
+
+
+def rrf_fuse(ranked_lists, n: int, k: int = RRF_K):
+    """
+    Reciprocal-rank fusion of several best-first id arrays: sum of 1 / (k + rank) per id.
+    Returns (scores, ids) of the top n, with scores scaled so an id ranked first in every
+    list scores 1.0.
+    """
+    fused = {}
+    for ids in ranked_lists:
+        for rank, i in enumerate(ids.tolist()):
+            if i >= 0:
+                fused[i] = fused.get(i, 0.0) + 1.0 / (k + rank + 1)
+    best = sorted(fused.items(), key=lambda kv: -kv[1])[:n]
+    scale = (k + 1) / max(1, len(ranked_lists))
+    ids = np.array([i for i, _ in best], dtype=np.int64)
+    return np.array([s * scale for _, s in best], dtype=np.float32), ids
@@ -0,0 +1,144 @@
+"""long_queries.py
+
+Encoding path for queries longer than the encoder's max sequence length
+(typically whole job descriptions pasted into /recommend).
+
+LongQueryEncoder wraps any encoder from encoders.load_encoder and, per query:
+  1. drops boilerplate (company blurb, benefits, EEO / visa statements, how-to-apply)
+  2. tokenizes it to cut the token sequence into overlapping windows that fit the model
+  3. encodes every window of every query in the same batch
+  4. pools each query's windows (token-weighted mean) into one normalized embedding
+The wrapped encoders take text, so each window goes back as its text span and is tokenized
+a second time inside encode(). Windows start and end on word boundaries, which makes that
+second tokenization yield the same tokens (a span cut inside a word would re-tokenize
+differently and could overflow the model's max length).
+Modes:
+  truncate  one window per query, i.e. what the encoder does on its own (boilerplate still dropped)
+  chunk     all windows
+  budget    windows in order while the tokens the encoder processes (window tokens, overlaps
+            counted again, plus [CLS] / [SEP]) stay within `token_budget`; the first window is
+            always encoded. Caps worst-case latency.
+Short queries (one window) take exactly the plain encoder path. Embeddings are
+always returned normalized (chunk pooling needs unit vectors).
+"""
+import re
+import numpy as np
+
+LONG_QUERY_MODES = ("truncate", "chunk", "budget")
+
+# section headings whose body does not describe the role / skills
+_BOILERPLATE_HEADINGS = re.compile(
+    r"^\s*(about (us|the company|our company)|who we are|our (company|culture|story|values)|benefits|perks|"
+    r"what we offer|why (join|work)|compensation|salary|equal (employment )?opportunit|diversity|"
+    r"how to apply|application process|privacy|disclaimer)\b", re.I)
+# single lines / sentences that are boilerplate wherever they appear
+_BOILERPLATE_LINES = re.compile(
+    r"(equal opportunity employer|visa sponsorship|eligible to work|without sponsorship|benefits package|"
+    r"apply now|click here|cookies?\b|all rights reserved|©|follow us on|hybrid working is available|"
+    r"regardless of (race|gender|age))", re.I)
+_HEADING_MAX_WORDS = 8
+
+
+def _is_heading(line: str) -> bool:
+    words = line.split()
+    return 0 < len(words) <= _HEADING_MAX_WORDS and not line.rstrip().endswith(".")
+
+
+def strip_boilerplate(text: str) -> str:
+    """Remove boilerplate sections and lines; falls back to the input if nothing would be left."""
+    kept, skipping = [], False
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if _is_heading(stripped):
+            skipping = bool(_BOILERPLATE_HEADINGS.match(stripped))
+            if skipping:
+                continue
+        if skipping:
+            continue
+        sentences = [s for s in re.split(r"(?<=[.!?])\s+", stripped) if s and not _BOILERPLATE_LINES.search(s)]
+        if sentences:
+            kept.append(" ".join(sentences))
+    out = "\n".join(kept)
+    return out if out.strip() else text
+
+
+class LongQueryEncoder:
+    """SentenceTransformer-style encode() that chunks long queries instead of truncating them."""
+
+    def __init__(self, encoder, mode: str = "budget", token_budget: int = 512, overlap: int = 32,
+                 drop_boilerplate: bool = True, max_seq_length: int = None):
+        if mode not in LONG_QUERY_MODES:
+            raise ValueError(f"Unknown long-query mode {mode!r}; expected one of {', '.join(LONG_QUERY_MODES)}")
+        self.encoder = encoder
+        self.tokenizer = encoder.tokenizer
+        self.mode = mode
+        self.token_budget = token_budget
+        self.drop_boilerplate = drop_boilerplate
+        # room for [CLS] / [SEP] in every window
+        self.window = (max_seq_length or encoder.max_seq_length) - 2
+        self.overlap = max(0, min(overlap, self.window // 2))
+
+    def __getattr__(self, name):
+        return getattr(self.encoder, name)
+
+    def chunks(self, text: str):
+        """(text, character spans of the windows to encode, tokens per window) for `text`."""
+        if self.drop_boilerplate:
+            text = strip_boilerplate(text)
+        enc = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True, truncation=False)
+        offsets = enc["offset_mapping"]
+        n = len(offsets)
+        if n <= self.window or self.mode == "truncate":
+            return text, [(0, len(text))], [max(1, min(n, self.window))]
+        try:
+            words = enc.word_ids()
+            word_start = [i == 0 or words[i] != words[i - 1] for i in range(n)] + [True]
+        except (ValueError, AttributeError):  # slow tokenizers have no word ids: cut anywhere
+            word_start = [True] * (n + 1)
+        spans, weights, cost = [], [], 0
+        start = 0
+        while True:
+            end = min(start + self.window, n)
+            # back off to the last word start, unless one word fills the whole window
+            cut = end
+            while cut > start + 1 and not word_start[cut]:
+                cut -= 1
+            end = cut if word_start[cut] else end
+            if self.mode == "budget" and spans and cost + end - start + 2 > self.token_budget:
+                break
+            spans.append((offsets[start][0], offsets[end - 1][1]))
+            weights.append(end - start)
+            cost += end - start + 2
+            if end >= n:
+                break
+            nxt = max(start + 1, end - self.overlap)
+            while nxt > start + 1 and not word_start[nxt]:
+                nxt -= 1
+            start = nxt
+        return text, spans, weights
+
+    def encode(self, sentences, batch_size: int = 32, show_progress_bar: bool = False,
+               convert_to_numpy: bool = True, normalize_embeddings: bool = False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        pieces, owners, weights = [], [], []
+        for i, t in enumerate(texts):
+            text, spans, w = self.chunks(t)
+            pieces.extend(text[a:b] for a, b in spans)
+            owners.extend([i] * len(spans))
+            weights.extend(w)
+        # callers that ask for one forward pass over their queries get one over all the windows
+        if batch_size >= len(texts):
+            batch_size = max(batch_size, len(pieces))
+        emb = self.encoder.encode(pieces, batch_size=batch_size, show_progress_bar=show_progress_bar,
+                                  convert_to_numpy=True, normalize_embeddings=True, **kwargs)
+        emb = np.asarray(emb, dtype=np.float32)
+        if len(pieces) == len(texts):
+            out = emb
+        else:
+            out = np.zeros((len(texts), emb.shape[1]), dtype=np.float32)
+            np.add.at(out, np.asarray(owners), emb * np.asarray(weights, dtype=np.float32)[:, None])
+            out /= np.clip(np.linalg.norm(out, axis=1, keepdims=True), 1e-12, None)
+        return out[0] if single else out
@@ -1,13 +1,31 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Header
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, JSONResponse, Response, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 import numpy as np
 import os
-import faiss
+import json
+import time
+import secrets
+import asyncio
+import logging
+import threading
 import pandas as pd
-from sentence_transformers import SentenceTransformer
-from .utils import load_catalog, topk_from_scores, balance_by_type
+from .utils import load_catalog, topk_from_scores, balance_by_type, balance_by_type_idx, mmr_select
+from .batching import MicroBatcher
+from .encoders import LazyEncoder, load_encoder, set_torch_threads, torch_threads
+from .long_queries import LongQueryEncoder
+from .cache import LRUCache, normalize_query, artifact_fingerprint
+from .metadata_store import MetadataStore
+from .index_backends import search_filtered
+from .filters import filters_key
+from .metrics import REGISTRY, stage, set_enabled, cache_lines, catalog_lines
+from .lexical_index import rrf_fuse
+from .query_store import QueryStore, QUERY_STORE_DIR, encoder_key
+from .catalogs import CatalogRegistry, merge_topk
+from .snapshots import load_snapshot, resolve_current, rss_bytes, CURRENT_FILE, MANIFEST_FILE, ARTIFACTS
 
 app = FastAPI(title="SHL Assessment Recommender API")
 
@@ -24,85 +42,812 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-MODEL_STORE = os.path.join(os.path.dirname(__file__), "model_store")
+MODEL_STORE = os.environ.get("RECOMMEND_MODEL_STORE") or os.path.join(os.path.dirname(__file__), "model_store")
 FAISS_PATH = os.path.join(MODEL_STORE, "faiss.index")
 METADATA_PATH = os.path.join(MODEL_STORE, "metadata.csv")
 EMB_PATH = os.path.join(MODEL_STORE, "embeddings.npy")
 
 EMBED_MODEL_NAME = "all-MiniLM-L6-v2"
-EMBEDDER = SentenceTransformer(EMBED_MODEL_NAME)
+# Query encoder backend: torch | torch-int8 | onnx | onnx-int8 (see encoders.py; compare with
+# bench_encoders.py), RECOMMEND_ENCODER_THREADS caps its intra-op threads
+ENCODER_BACKEND = os.environ.get("RECOMMEND_ENCODER_BACKEND", "torch")
+ENCODER_THREADS = int(os.environ["RECOMMEND_ENCODER_THREADS"]) if os.environ.get("RECOMMEND_ENCODER_THREADS") else None
+# Queries longer than the model's max sequence length: truncate (default) | chunk (encode overlapping
+# windows, pool them) | budget (windows up to RECOMMEND_QUERY_TOKEN_BUDGET tokens); see long_queries.py.
+# RECOMMEND_STRIP_BOILERPLATE=1 drops benefits / EEO / company-blurb text from queries first.
+LONG_QUERY_MODE = os.environ.get("RECOMMEND_LONG_QUERY_MODE", "truncate")
+QUERY_TOKEN_BUDGET = int(os.environ.get("RECOMMEND_QUERY_TOKEN_BUDGET", "512"))
+QUERY_CHUNK_OVERLAP = int(os.environ.get("RECOMMEND_QUERY_CHUNK_OVERLAP", "32"))
+STRIP_BOILERPLATE = os.environ.get("RECOMMEND_STRIP_BOILERPLATE", "0") != "0"
+
+def load_query_encoder(model_name, threads=None):
+    model = load_encoder(model_name, backend=ENCODER_BACKEND, threads=threads or ENCODER_THREADS)
+    if LONG_QUERY_MODE != "truncate" or STRIP_BOILERPLATE:
+        model = LongQueryEncoder(model, LONG_QUERY_MODE, token_budget=QUERY_TOKEN_BUDGET,
+                                 overlap=QUERY_CHUNK_OVERLAP, drop_boilerplate=STRIP_BOILERPLATE)
+    return model
+
+# Loaded on first use (or by the startup warm-up), not at import time
+EMBEDDER = LazyEncoder(EMBED_MODEL_NAME, loader=load_query_encoder)
+# Startup warm-up: "sync" loads the model and runs one forward pass + search before serving,
+# "background" does it after startup (/health/ready is 503 until done), "off" loads on first request
+WARMUP_MODE = os.environ.get("RECOMMEND_WARMUP", "sync")
+WARMUP_STATUS = {"done": False, "seconds": None, "error": None}
+# Active model_store snapshot. Requests take one reference and use it throughout, so a
+# reload can swap SNAPSHOT while in-flight requests finish on the old one.
+# INDEX / METADATA / EMBEDDINGS mirror the active snapshot.
+SNAPSHOT = None
 INDEX = None
 METADATA = None
 EMBEDDINGS = None
 
+# Hot reload: POST /admin/reload, or poll model_store/CURRENT + manifest every N seconds (0 = off).
+# The /admin endpoints require X-Admin-Token: RECOMMEND_ADMIN_TOKEN and are disabled while it is unset.
+WATCH_INTERVAL = float(os.environ.get("RECOMMEND_WATCH_INTERVAL", "0"))
+ADMIN_TOKEN = os.environ.get("RECOMMEND_ADMIN_TOKEN", "")
+_reload_lock = threading.Lock()
+RELOAD_STATUS = {}
+
+# Search-time parameters for approximate indexes (ignored by index types they don't apply to)
+INDEX_NPROBE = int(os.environ["RECOMMEND_NPROBE"]) if os.environ.get("RECOMMEND_NPROBE") else None
+INDEX_EF_SEARCH = int(os.environ["RECOMMEND_EF_SEARCH"]) if os.environ.get("RECOMMEND_EF_SEARCH") else None
+# Memory-map embeddings.npy (shared page cache across workers) instead of reading it into RAM
+MMAP_EMBEDDINGS = os.environ.get("RECOMMEND_MMAP", "1") != "0"
+
+# Micro-batching of query encoding + search (set RECOMMEND_BATCHING=0 for the per-request path)
+BATCHING_ENABLED = os.environ.get("RECOMMEND_BATCHING", "1") != "0"
+BATCH_MAX_SIZE = int(os.environ.get("RECOMMEND_BATCH_MAX_SIZE", "32"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("RECOMMEND_BATCH_MAX_WAIT_MS", "2"))
+
+# Two-level cache: normalized query -> embedding, (normalized query, k) -> recommendations.
+# Both are cleared when the model_store artifacts change on disk.
+CACHE_TTL = float(os.environ.get("RECOMMEND_CACHE_TTL", "0")) or None
+CACHE_CHECK_INTERVAL = float(os.environ.get("RECOMMEND_CACHE_CHECK_INTERVAL", "1"))
+CACHE_WARM_CSV = os.environ.get("RECOMMEND_CACHE_WARM_CSV", "")
+EMBEDDING_CACHE = LRUCache(int(os.environ.get("RECOMMEND_EMBEDDING_CACHE_SIZE", "10000")), ttl=CACHE_TTL)
+RESPONSE_CACHE = LRUCache(int(os.environ.get("RECOMMEND_RESPONSE_CACHE_SIZE", "10000")), ttl=CACHE_TTL)
+_cache_state = {"fingerprint": None, "checked_at": 0.0}
+# Precomputed query embeddings (python query_store.py fill ...), consulted after the embedding
+# cache and before the encoder; entries of another encoder configuration are ignored.
+# RECOMMEND_QUERY_STORE=off disables it. Re-read when a fill / compact replaces its manifest.
+QUERY_STORE_PATH = os.environ.get("RECOMMEND_QUERY_STORE") or QUERY_STORE_DIR
+QUERY_STORE = None if QUERY_STORE_PATH == "off" else QueryStore(
+    QUERY_STORE_PATH, encoder_key(EMBED_MODEL_NAME, ENCODER_BACKEND, LONG_QUERY_MODE, QUERY_TOKEN_BUDGET,
+                                  QUERY_CHUNK_OVERLAP, STRIP_BOILERPLATE))
+
+# Filtered searches over at most this many allowed rows are scored exactly from the embeddings;
+# larger allowed sets go through the index with a FAISS ID selector
+FILTER_BRUTE_FORCE_MAX = int(os.environ.get("RECOMMEND_FILTER_BRUTE_FORCE_MAX", "4096"))
+
+# Ranking: fetch k * OVERFETCH candidates before test_type balancing; hits scoring below
+# MIN_SCORE (cosine) are dropped unless none pass (then the plain top-k is kept); not applied to
+# hybrid BM25 / RRF scores (see cosine_scores). Tune with bench_retrieval.py.
+OVERFETCH = int(os.environ.get("RECOMMEND_OVERFETCH", "3"))
+MIN_SCORE = float(os.environ["RECOMMEND_MIN_SCORE"]) if os.environ.get("RECOMMEND_MIN_SCORE") else None
+
+# Re-ranking of the candidates: "balance" round-robins over test_types, "mmr" picks by
+# MMR_LAMBDA * score - (1 - MMR_LAMBDA) * similarity to the results already picked (read from the
+# snapshot's neighbor graph, see neighbor_graph.py), "none" keeps the score order.
+# Requests can override both with "rerank" / "mmr_lambda".
+RERANK_MODES = ("balance", "mmr", "none")
+RERANK = os.environ.get("RECOMMEND_RERANK", "balance")
+MMR_LAMBDA = float(os.environ.get("RECOMMEND_MMR_LAMBDA", "0.7"))
+if RERANK not in RERANK_MODES:
+    raise ValueError(f"RECOMMEND_RERANK must be one of {', '.join(RERANK_MODES)}")
+
+# Retrieval: "dense" searches FAISS only; "hybrid" also scores the query against the snapshot's BM25 index
+# (lexical_index.py) and fuses both candidate lists by reciprocal rank (scores are then the fused 0..1 score).
+# With LEXICAL_FAST_PATH, keyword queries of at most LEXICAL_MAX_TERMS terms that all appear in the best BM25
+# hit's name ("Core Java", "SQL") or that spell out a name are answered from BM25 alone, without encoding;
+# fewer than k BM25 hits are topped up with the best hit's neighbor-graph rows (build_index.py --neighbors).
+# Snapshots built without lexical_index.npz are always searched dense.
+RETRIEVAL_MODES = ("dense", "hybrid")
+RETRIEVAL = os.environ.get("RECOMMEND_RETRIEVAL", "dense")
+LEXICAL_FAST_PATH = os.environ.get("RECOMMEND_LEXICAL_FAST_PATH", "1") != "0"
+LEXICAL_MAX_TERMS = int(os.environ.get("RECOMMEND_LEXICAL_MAX_TERMS", "3"))
+if RETRIEVAL not in RETRIEVAL_MODES:
+    raise ValueError(f"RECOMMEND_RETRIEVAL must be one of {', '.join(RETRIEVAL_MODES)}")
+
+# Instrumentation: per-stage latency histograms and request counters at GET /metrics
+# (RECOMMEND_METRICS=0 turns recording off). Requests slower than RECOMMEND_SLOW_QUERY_MS (0 = off)
+# are logged with their stage breakdown to the "recommend.slow" logger / RECOMMEND_SLOW_QUERY_LOG.
+set_enabled(os.environ.get("RECOMMEND_METRICS", "1") != "0")
+SLOW_QUERY_MS = float(os.environ.get("RECOMMEND_SLOW_QUERY_MS", "0"))
+SLOW_QUERY_LOG = os.environ.get("RECOMMEND_SLOW_QUERY_LOG", "")
+REQUEST_SECONDS = REGISTRY.histogram("recommend_request_seconds", "Handler time per endpoint", ("endpoint",))
+REQUESTS = REGISTRY.counter("recommend_requests_total", "Requests per endpoint", ("endpoint",))
+ERRORS = REGISTRY.counter("recommend_errors_total", "Failed requests per endpoint and status code", ("endpoint", "status"))
+EMPTY_RESULTS = REGISTRY.counter("recommend_empty_results_total", "Queries that produced no recommendations", ("endpoint",))
+BATCH_QUERIES = REGISTRY.counter("recommend_batch_queries_total", "Queries received by /recommend/batch")
+LEXICAL_ONLY = REGISTRY.counter("recommend_lexical_fast_path_total",
+                                "Query searches (per catalog) answered from the lexical index alone, not encoded",
+                                ("endpoint",))
+SLOW_LOG = logging.getLogger("recommend.slow")
+if SLOW_QUERY_LOG:
+    SLOW_LOG.addHandler(logging.FileHandler(SLOW_QUERY_LOG))
+    SLOW_LOG.setLevel(logging.INFO)
+
+# Multi-catalog serving: "catalog": "<name>[@<version>]" in a request searches RECOMMEND_CATALOG_ROOT/<name>
+# (a model_store built by build_index.py) instead of MODEL_STORE; "catalogs": [...] fans the query out and
+# merges the top-k. Catalogs load on first use and stay in an LRU whose estimated resident size is kept under
+# RECOMMEND_CATALOG_MEMORY_MB; all of them share the one query encoder. See catalogs.py, GET /catalogs.
+CATALOG_ROOT = os.environ.get("RECOMMEND_CATALOG_ROOT") or os.path.join(os.path.dirname(__file__), "catalogs")
+CATALOG_MEMORY_MB = float(os.environ.get("RECOMMEND_CATALOG_MEMORY_MB", "1024"))
+MAX_FANOUT = int(os.environ.get("RECOMMEND_MAX_FANOUT", "8"))
+
+# POST /recommend/batch encodes + searches this many queries at a time while streaming
+BATCH_CHUNK_SIZE = int(os.environ.get("RECOMMEND_BATCH_CHUNK_SIZE", "256"))
+
+class RecommendFilters(BaseModel):
+    test_type: Optional[List[str]] = None       # any of these test_type codes, e.g. ["K", "P"]
+    max_duration: Optional[float] = None        # minutes, needs a duration column in the catalog
+    attributes: Optional[Dict[str, List[str]]] = None  # other catalog columns, exact match
+
+    def key(self):
+        return filters_key(self.test_type, self.max_duration, self.attributes)
+
 class RecommendRequest(BaseModel):
     query: str
     k: Optional[int] = 5
+    filters: Optional[RecommendFilters] = None
+    catalog: Optional[str] = None               # catalog id, default: the MODEL_STORE catalog
+    catalogs: Optional[List[str]] = None        # search several catalogs and merge the top-k
+    rerank: Optional[str] = None                # balance | mmr | none, default RECOMMEND_RERANK
+    mmr_lambda: Optional[float] = None          # relevance weight for mmr, 0..1 (1 = plain score order)
 
 class AssessmentOut(BaseModel):
     assessment_name: str
     url: str
     test_type: Optional[str] = ""
     score: float
+    catalog: Optional[str] = None               # set when results were merged from several catalogs
 
 class RecommendResponse(BaseModel):
     query: str
     recommendations: List[AssessmentOut]
 
+class BatchRecommendRequest(BaseModel):
+    queries: List[str]
+    k: Optional[int] = 5
+    filters: Optional[RecommendFilters] = None
+    catalog: Optional[str] = None
+    catalogs: Optional[List[str]] = None
+    rerank: Optional[str] = None
+    mmr_lambda: Optional[float] = None
+
+def activate_snapshot(snap):
+    """Swap in a loaded snapshot (a single reference assignment) and drop caches built on the old one."""
+    global SNAPSHOT, INDEX, METADATA, EMBEDDINGS
+    SNAPSHOT = snap
+    INDEX, METADATA, EMBEDDINGS = snap.index, snap.metadata, snap.embeddings
+    check_cache_fresh(force=True)
+
+def load_snapshot_dir(path):
+    """Load + verify one snapshot folder (the MODEL_STORE one or a catalog's) with the API's settings."""
+    return load_snapshot(path, model_name=EMBED_MODEL_NAME, mmap=MMAP_EMBEDDINGS,
+                         nprobe=INDEX_NPROBE, ef_search=INDEX_EF_SEARCH)
+
+def load_current_snapshot(version=None):
+    path = resolve_current(MODEL_STORE, version)
+    if not os.path.exists(os.path.join(path, "metadata.csv")) or not (
+            os.path.exists(os.path.join(path, "faiss.index")) or os.path.exists(os.path.join(path, "embeddings.npy"))):
+        raise RuntimeError("Model store missing. Run build_index.py first to create model_store (faiss.index + metadata.csv).")
+    # faiss.index is rebuilt from embeddings.npy when the build skipped writing it
+    return load_snapshot_dir(path)
+
+CATALOGS = CatalogRegistry(CATALOG_ROOT, CATALOG_MEMORY_MB * 2**20, loader=load_snapshot_dir)
+
 @app.on_event("startup")
 def startup_load_index():
-    global INDEX, METADATA, EMBEDDINGS
-    if not os.path.exists(FAISS_PATH) or not os.path.exists(METADATA_PATH):
-        raise RuntimeError("Model store missing. Run build_index.py first to create model_store (faiss.index + metadata.csv).")
-    INDEX = faiss.read_index(FAISS_PATH)
-    METADATA = pd.read_csv(METADATA_PATH)
-    if os.path.exists(EMB_PATH):
-        EMBEDDINGS = np.load(EMB_PATH)
-    else:
-        EMBEDDINGS = None
+    if SNAPSHOT is None:  # serve.py loads it once before forking workers
+        activate_snapshot(load_current_snapshot())
     # No return — startup will fail fast if missing
 
+def warmup():
+    """Load the encoder and push one query through encode + search so the first request isn't cold."""
+    t0 = time.perf_counter()
+    try:
+        q_emb = EMBEDDER.encode(["warm-up query"], convert_to_numpy=True, normalize_embeddings=True).astype('float32')
+        SNAPSHOT.index.search(q_emb, 1)
+    except Exception as e:
+        WARMUP_STATUS["error"] = str(e)
+        raise
+    WARMUP_STATUS.update({"done": True, "seconds": time.perf_counter() - t0, "error": None})
+
+@app.on_event("startup")
+def startup_warmup():
+    if WARMUP_STATUS["done"]:
+        return
+    if WARMUP_MODE == "sync":
+        warmup()
+    elif WARMUP_MODE == "background":
+        threading.Thread(target=warmup, name="warmup", daemon=True).start()
+
+# torch / FAISS (OpenMP) thread counts of this process before preload() pinned them to 1
+_PREFORK_THREADS = {}
+
+def preload():
+    """
+    Load the active snapshot and the encoder weights in this process (serve.py, before forking workers).
+    Runs no forward pass or search, with torch and FAISS pinned to one thread: a thread pool started
+    before fork() doesn't exist in the children, whose first multithreaded op then deadlocks.
+    Each worker calls after_fork() and warms up on startup. ONNX Runtime sessions own their thread
+    pool from creation, so with the onnx backends each worker loads its own encoder.
+    """
+    import faiss
+    _PREFORK_THREADS.update({"faiss": faiss.omp_get_max_threads(), "torch": torch_threads()})
+    faiss.omp_set_num_threads(1)
+    set_torch_threads(1)
+    activate_snapshot(load_current_snapshot())
+    if not ENCODER_BACKEND.startswith("onnx"):
+        EMBEDDER.get(threads=1)
+
+def after_fork():
+    """Restore the thread counts preload() pinned (RECOMMEND_ENCODER_THREADS for the encoder) in a worker."""
+    import faiss
+    faiss.omp_set_num_threads(_PREFORK_THREADS["faiss"])
+    set_torch_threads(ENCODER_THREADS or _PREFORK_THREADS["torch"])
+
+def is_ready():
+    return SNAPSHOT is not None and EMBEDDER.loaded and (WARMUP_STATUS["done"] or WARMUP_MODE == "off")
+
+def reload_snapshot(version=None):
+    """
+    Load the requested (default: CURRENT) snapshot next to the active one, verify it and swap it in.
+    Records timing and the resident-memory overlap of holding both snapshots in RELOAD_STATUS.
+    """
+    if not _reload_lock.acquire(blocking=False):
+        raise RuntimeError("A reload is already in progress")
+    try:
+        previous = SNAPSHOT.version if SNAPSHOT else None
+        rss_before = rss_bytes()
+        t0 = time.perf_counter()
+        try:
+            snap = load_current_snapshot(version)
+        except Exception as e:
+            RELOAD_STATUS.update({"ok": False, "error": str(e), "failed_at": time.time()})
+            raise
+        rss_both = rss_bytes()
+        activate_snapshot(snap)
+        RELOAD_STATUS.clear()
+        RELOAD_STATUS.update({
+            "ok": True,
+            "version": snap.version,
+            "previous_version": previous,
+            "reload_seconds": time.perf_counter() - t0,
+            "rss_before_bytes": rss_before,
+            "rss_with_both_bytes": rss_both,
+            "overlap_bytes": max(0, rss_both - rss_before),
+            "reloaded_at": time.time(),
+        })
+        return dict(RELOAD_STATUS)
+    finally:
+        _reload_lock.release()
+
+def _watch_fingerprint():
+    pointer = os.path.join(MODEL_STORE, CURRENT_FILE)
+    try:
+        manifest = os.path.join(resolve_current(MODEL_STORE), MANIFEST_FILE)
+    except FileNotFoundError:
+        manifest = None
+    return artifact_fingerprint([p for p in (pointer, manifest) if p])
+
+def _watch_model_store():
+    last = _watch_fingerprint()
+    while True:
+        time.sleep(WATCH_INTERVAL)
+        fp = _watch_fingerprint()
+        if fp == last:
+            continue
+        last = fp
+        try:
+            reload_snapshot()
+            print(f"Reloaded model_store snapshot {SNAPSHOT.version}")
+        except Exception as e:
+            print("Model store reload failed, still serving", SNAPSHOT.version, "-", e)
+
+@app.on_event("startup")
+def startup_watcher():
+    if WATCH_INTERVAL > 0:
+        threading.Thread(target=_watch_model_store, name="model-store-watcher", daemon=True).start()
+
+def check_cache_fresh(force=False):
+    """Drop both cache levels if the active snapshot's files changed (checked at most every CACHE_CHECK_INTERVAL s)."""
+    now = time.monotonic()
+    if not force and now - _cache_state["checked_at"] < CACHE_CHECK_INTERVAL:
+        return
+    _cache_state["checked_at"] = now
+    if QUERY_STORE is not None:
+        QUERY_STORE.refresh()
+    path = SNAPSHOT.path if SNAPSHOT else MODEL_STORE
+    fp = (path, artifact_fingerprint([os.path.join(path, name) for name in ARTIFACTS + (MANIFEST_FILE,)]))
+    if fp != _cache_state["fingerprint"]:
+        EMBEDDING_CACHE.clear()
+        RESPONSE_CACHE.clear()
+        _cache_state["fingerprint"] = fp
+
+def embed_queries(queries, timings=None):
+    """
+    Embeddings for a list of queries; only misses of the embedding cache and the query store
+    go through the encoder (in one batch).
+    """
+    keys = [normalize_query(q) for q in queries]
+    embs = [EMBEDDING_CACHE.get(key) for key in keys]
+    missing = list(dict.fromkeys(key for key, e in zip(keys, embs) if e is None))
+    if missing:
+        fresh = {}
+        if QUERY_STORE is not None:
+            stored, found = QUERY_STORE.lookup(missing)
+            fresh = {key: e for key, e, hit in zip(missing, stored, found) if hit} if stored is not None else {}
+            missing = [key for key in missing if key not in fresh]
+        if missing:
+            with stage("encode", timings):
+                new = EMBEDDER.encode(missing, batch_size=len(missing), convert_to_numpy=True,
+                                      normalize_embeddings=True).astype('float32')
+            fresh.update(zip(missing, new))
+        for key, e in fresh.items():
+            EMBEDDING_CACHE.put(key, e)
+        embs = [e if e is not None else fresh[key] for key, e in zip(keys, embs)]
+    return np.stack(embs)
+
+def encode_and_search(items):
+    """
+    Encode a batch of queries in one forward pass and run one FAISS search per distinct
+    (catalog, filter) pair (a single search when no catalogs or filters are used).
+    items: list of (query, n_candidates, filter_key or None[, catalog snapshot or None]);
+    a missing / None snapshot means the active MODEL_STORE snapshot. Returns a list of
+    (scores, ids, snapshot, stage timings) per item; ids refer to that snapshot's metadata,
+    the timings dict (seconds per stage) is shared by the whole batch.
+    """
+    default = SNAPSHOT
+    timings = {}
+    q_embs = embed_queries([item[0] for item in items], timings)
+    groups = {}
+    for j, item in enumerate(items):
+        snap = item[3] if len(item) > 3 and item[3] is not None else default
+        groups.setdefault((id(snap), item[2]), (snap, []))[1].append(j)
+    out = [None] * len(items)
+    for (_, filt), (snap, rows) in groups.items():
+        n = max(items[j][1] for j in rows)
+        with stage("search", timings):
+            if filt is None:
+                D, I = snap.index.search(q_embs[rows], n)
+            else:
+                allowed_ids, bitmap = snap.metadata.filters.allowed(filt)
+                D, I = search_filtered(snap.index, q_embs[rows], n, allowed_ids, bitmap,
+                                       embeddings=snap.embeddings, brute_force_max=FILTER_BRUTE_FORCE_MAX)
+        for r, j in enumerate(rows):
+            nc = items[j][1]
+            out[j] = (D[r, :nc], I[r, :nc], snap, timings)
+    return out
+
+def lexical_search(q, n, filt, snap):
+    """
+    (BM25 scores, ids, confident) for one query on a snapshot with a lexical index; n is the
+    candidate count, k * OVERFETCH. When BM25 is confident (can answer alone) but matched fewer
+    than n rows, the list is filled up from the top hit's neighbor graph (fill_from_neighbors).
+    confident also needs at least k rows after that: shorter lists go through dense retrieval +
+    fusion (with the plain BM25 candidates), so the fast path never returns fewer hits than it would.
+    """
+    lex = snap.lexical
+    terms = lex.query_terms(q)
+    allowed = snap.metadata.filters.allowed(filt) if filt is not None else None
+    scores, ids = lex.search(terms, n, allowed[1] if allowed is not None else None)
+    if not len(ids) or not lex.confident(terms, ids[0], LEXICAL_MAX_TERMS):
+        return scores, ids, False
+    k = max(1, n // OVERFETCH)
+    if len(ids) < n and snap.neighbors is not None:
+        filled = fill_from_neighbors(scores, ids, n, snap.neighbors, allowed[0] if allowed is not None else None)
+        if len(filled[1]) >= k:
+            return filled + (True,)
+    return scores, ids, len(ids) >= k
+
+def fill_from_neighbors(scores, ids, n, neighbors, allowed_ids=None):
+    """
+    Extend a confident BM25 list (scores, ids) to n rows with the top hit's graph neighbors
+    (most similar first, skipping rows already listed or outside allowed_ids), scored below
+    the last BM25 hit: its score x the neighbor's cosine similarity to the top hit.
+    """
+    nbr, sims = neighbors.neighbors(int(ids[0]))
+    keep = ~np.isin(nbr, ids) & (sims > 0)
+    if allowed_ids is not None:
+        keep &= np.isin(nbr, allowed_ids)
+    nbr, sims = nbr[keep][:n - len(ids)], sims[keep][:n - len(ids)]
+    return (np.concatenate([scores, scores[-1] * sims]).astype(np.float32),
+            np.concatenate([ids, nbr]).astype(np.int64))
+
+def lexical_hits(items):
+    """
+    Hybrid retrieval, first step (no encoding): the BM25 candidates of every encode_and_search item,
+    and the hits the lexical index answers alone (BM25 scores scaled to best = 1.0), None where the
+    query needs the encoder. Returns (hits, bm25 candidates); all None in dense mode.
+    """
+    hits, lexical = [None] * len(items), [None] * len(items)
+    if RETRIEVAL != "hybrid":
+        return hits, lexical
+    for j, item in enumerate(items):
+        snap = item[3] if len(item) > 3 and item[3] is not None else SNAPSHOT
+        if snap.lexical is None:
+            continue
+        timings = {}
+        with stage("lexical", timings):
+            scores, ids, confident = lexical_search(item[0], item[1], item[2], snap)
+        lexical[j] = ids
+        if confident and LEXICAL_FAST_PATH:
+            hits[j] = (scores / scores[0], ids, snap, timings)
+    return hits, lexical
+
+def fuse_hits(items, hits, lexical):
+    """Hybrid retrieval, second step: RRF-fuse each dense encode_and_search hit with its BM25 candidates."""
+    out = []
+    for item, hit, lex_ids in zip(items, hits, lexical):
+        if lex_ids is None:
+            out.append(hit)
+            continue
+        with stage("lexical", hit[3]):
+            scores, ids = rrf_fuse([hit[1], lex_ids], item[1])
+        out.append((scores, ids) + hit[2:])
+    return out
+
+def retrieve(items, endpoint=None):
+    """
+    encode_and_search with hybrid retrieval applied: lexical fast-path items skip the encoder,
+    the rest are encoded in one batch and fused with their BM25 candidates (plain
+    encode_and_search in dense mode). Used by /recommend/batch and the offline benchmarks.
+    """
+    hits, lexical = lexical_hits(items)
+    todo = [j for j, hit in enumerate(hits) if hit is None]
+    if todo:
+        dense = encode_and_search([items[j] for j in todo])
+        for j, hit in zip(todo, fuse_hits([items[j] for j in todo], dense, [lexical[j] for j in todo])):
+            hits[j] = hit
+    if endpoint and len(todo) < len(items):
+        LEXICAL_ONLY.inc((endpoint,), amount=len(items) - len(todo))
+    return hits
+
+def resolve_filters(filters, shards=None):
+    """Canonical filter key (None if unfiltered); 400 for filters a searched catalog can't answer."""
+    filt = filters.key() if filters is not None else None
+    if filt is not None:
+        try:
+            for snap in [s for _, s in shards] if shards else [SNAPSHOT]:
+                snap.metadata.filters.allowed(filt)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return filt
+
+def resolve_rerank(rerank=None, mmr_lambda=None):
+    """(mode, lambda) a request overrides the re-ranking with, None for the defaults; 400 if invalid."""
+    if rerank is None and mmr_lambda is None:
+        return None
+    mode = rerank or RERANK
+    if mode not in RERANK_MODES:
+        raise HTTPException(status_code=400, detail=f"rerank must be one of {', '.join(RERANK_MODES)}")
+    lam = MMR_LAMBDA if mmr_lambda is None else mmr_lambda
+    if not 0 <= lam <= 1:
+        raise HTTPException(status_code=400, detail="mmr_lambda must be between 0 and 1")
+    return mode, lam
+
+def catalog_ids(catalog=None, catalogs=None):
+    """Catalog ids a request searches: [None] for the default snapshot, one id, or several to fan out over."""
+    ids = list(dict.fromkeys(catalogs)) if catalogs else [catalog]
+    if len(ids) > MAX_FANOUT:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_FANOUT} catalogs per request")
+    return ids
+
+def resolve_catalogs(ids, load=True):
+    """
+    [(catalog id, snapshot)] for catalog_ids(); None stands for the active MODEL_STORE snapshot.
+    404 for unknown catalogs, 400 for malformed ids or catalogs built with another model.
+    With load=False returns None if any catalog still has to be loaded.
+    """
+    shards = []
+    for cid in ids:
+        if cid is None:
+            shards.append((None, SNAPSHOT))
+            continue
+        try:
+            snap = CATALOGS.get(cid, load=load)
+        except FileNotFoundError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if snap is None:
+            return None
+        shards.append((cid, snap))
+    return shards
+
+def shards_key(shards):
+    """Response-cache key part for the searched catalogs (None for the default snapshot)."""
+    if len(shards) == 1 and shards[0][0] is None:
+        return None
+    return tuple((cid, snap.version) for cid, snap in shards)
+
+def cosine_scores(snap):
+    """
+    True if hits on snap carry cosine similarities. Hybrid retrieval on a snapshot with a lexical
+    index scores by BM25 (fast path, best = 1.0) or RRF rank fusion instead: MIN_SCORE doesn't
+    apply to those, and catalogs fanned out over are then merged by rank rather than by score.
+    """
+    return RETRIEVAL != "hybrid" or snap.lexical is None
+
+def search_shards(k, shards, hits, timings=None, rerank=None):
+    """Recommendations from per-shard encode_and_search hits, merged across catalogs when fanning out."""
+    return merge_topk([(cid, build_recommendations(scores, idxs, k, snap, timings, rerank))
+                       for (cid, _), (scores, idxs, snap, _) in zip(shards, hits)], k,
+                      by_rank=not all(cosine_scores(snap) for _, snap in shards))
+
+def cacheable(shards, hits):
+    """Don't cache results searched on a default snapshot that was swapped out meanwhile."""
+    return all(cid is not None or hit[2] is SNAPSHOT for (cid, _), hit in zip(shards, hits))
+
+def mmr_similarity(snap, ids):
+    """Similarity lookup for MMR over candidate ids: the neighbor graph, else the embeddings (None if neither)."""
+    if snap.neighbors is not None:
+        return snap.neighbors.pool_similarity(ids)
+    if snap.embeddings is not None:
+        vecs, everyone = snap.embeddings.rows(ids), np.arange(len(ids))
+        return lambda j: (everyone, vecs @ vecs[j])
+    return None
+
+def build_recommendations(scores, idxs, k, snap, timings=None, rerank=None):
+    """Turn raw FAISS hits into the re-ranked (default: balanced) top-k recommendation list (empty if no hits)."""
+    mode, lam = rerank or (RERANK, MMR_LAMBDA)
+    metadata = snap.metadata
+    valid = idxs >= 0
+    if MIN_SCORE is not None and cosine_scores(snap) and (valid & (scores >= MIN_SCORE)).any():
+        valid &= scores >= MIN_SCORE
+    ids, scores = idxs[valid], scores[valid]
+    if not ids.size:
+        return []
+    with stage("balance", timings):
+        similarity = mmr_similarity(snap, ids) if mode == "mmr" else None
+        if similarity is not None:
+            sel = mmr_select(similarity, scores, k, lam)
+        elif mode != "none" and metadata.has_test_type:
+            # try to balance by test_type (simple heuristic) while keeping score ordering
+            sel = balance_by_type_idx(metadata.test_type_codes[ids], scores, k)
+        else:
+            sel = np.arange(min(k, ids.size))
+        # if balancing returns fewer, fall back to straight top-k by score
+        if len(sel) < k:
+            sel = np.argsort(-scores, kind='stable')[:k]
+    with stage("metadata", timings):
+        return metadata.records(ids[sel], scores[sel])
+
+@app.on_event("startup")
+def startup_warm_cache():
+    """Optionally pre-warm both cache levels from a CSV of known queries (RECOMMEND_CACHE_WARM_CSV)."""
+    if not CACHE_WARM_CSV:
+        return
+    df = pd.read_csv(CACHE_WARM_CSV)
+    if 'Query' not in df.columns:
+        raise ValueError("Cache warm CSV must have a 'Query' column")
+    queries = list(dict.fromkeys(q.strip() for q in df['Query'].dropna().astype(str) if q.strip()))
+    k = 5
+    for start in range(0, len(queries), 256):
+        chunk = queries[start:start + 256]
+        # same retrieval as /recommend (hybrid included), so warmed entries are what it would serve
+        for q, (scores, idxs, snap, _) in zip(chunk, retrieve([(q, k*OVERFETCH, None) for q in chunk])):
+            recs = build_recommendations(scores, idxs, k, snap)
+            if recs:
+                RESPONSE_CACHE.put((normalize_query(q), k, None, None, None), recs)
+    print(f"Warmed cache with {len(queries)} queries from {CACHE_WARM_CSV}")
+
+BATCHER = MicroBatcher(encode_and_search, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS)
+
+@app.on_event("startup")
+async def startup_batcher():
+    if BATCHING_ENABLED:
+        await BATCHER.start()
+
+@app.on_event("shutdown")
+async def shutdown_batcher():
+    await BATCHER.stop()
+
 @app.get("/health")
 def health():
+    """Liveness (the process is serving HTTP); readiness is reported separately."""
+    return {"status": "ok", "ready": is_ready()}
+
+@app.get("/health/live")
+def health_live():
     return {"status": "ok"}
 
+@app.get("/health/ready")
+def health_ready():
+    """200 once the snapshot is loaded and the encoder is warm, 503 before."""
+    body = {
+        "ready": is_ready(),
+        "snapshot": SNAPSHOT.version if SNAPSHOT else None,
+        "encoder_loaded": EMBEDDER.loaded,
+        "encoder_backend": ENCODER_BACKEND,
+        "warmup": WARMUP_STATUS,
+        "query_store_rows": len(QUERY_STORE) if QUERY_STORE is not None else None,
+    }
+    if not body["ready"]:
+        return JSONResponse(status_code=503, content=body)
+    return body
+
+def _check_admin(token):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set RECOMMEND_ADMIN_TOKEN")
+    if not secrets.compare_digest(token or "", ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+@app.post("/admin/reload")
+async def admin_reload(version: Optional[str] = None, x_admin_token: Optional[str] = Header(None)):
+    """Load a snapshot (default: the one model_store/CURRENT points at) in the background and swap it in."""
+    _check_admin(x_admin_token)
+    try:
+        return await run_in_threadpool(reload_snapshot, version)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except (FileNotFoundError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Snapshot rejected, still serving {SNAPSHOT.version}: {e}")
+
+@app.get("/admin/snapshot")
+def admin_snapshot(x_admin_token: Optional[str] = Header(None)):
+    _check_admin(x_admin_token)
+    return {
+        "version": SNAPSHOT.version,
+        "path": SNAPSHOT.path,
+        "model_name": SNAPSHOT.manifest.get("model_name", EMBED_MODEL_NAME),
+        "rows": len(SNAPSHOT.metadata),
+        "load_seconds": SNAPSHOT.load_seconds,
+        "loaded_at": SNAPSHOT.loaded_at,
+        "rss_bytes": rss_bytes(),
+        "last_reload": RELOAD_STATUS,
+    }
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus text exposition: stage/request latency histograms, request/error/empty-result counters, caches."""
+    caches = {"embeddings": EMBEDDING_CACHE.stats(), "responses": RESPONSE_CACHE.stats()}
+    extra = list(cache_lines(caches)) + list(catalog_lines(CATALOGS.stats()["catalogs"]))
+    return PlainTextResponse(REGISTRY.render(extra), media_type="text/plain; version=0.0.4")
+
+@app.get("/catalogs")
+def catalogs():
+    """Catalogs under RECOMMEND_CATALOG_ROOT and, per catalog used so far: loads, hits, evictions,
+    load latency, estimated resident size and the RSS growth measured while loading."""
+    return dict(CATALOGS.stats(), available=CATALOGS.available())
+
+@app.post("/admin/catalogs/{catalog_id}/evict")
+def admin_evict_catalog(catalog_id: str, x_admin_token: Optional[str] = Header(None)):
+    """Drop a loaded catalog so its next request reloads it (e.g. after rebuilding it)."""
+    _check_admin(x_admin_token)
+    return {"catalog": catalog_id, "evicted": CATALOGS.evict(catalog_id)}
+
+@app.get("/cache/stats")
+def cache_stats():
+    return {"embeddings": EMBEDDING_CACHE.stats(), "responses": RESPONSE_CACHE.stats()}
+
+def log_slow_query(endpoint, q, k, filt, elapsed, timings, cached):
+    """Log requests over SLOW_QUERY_MS with their stage breakdown (query length only, not the text)."""
+    if not SLOW_QUERY_MS or elapsed * 1000 < SLOW_QUERY_MS:
+        return
+    SLOW_LOG.warning(json.dumps({
+        "endpoint": endpoint,
+        "total_ms": round(elapsed * 1000, 3),
+        "stages_ms": {name: round(t * 1000, 3) for name, t in timings.items()},
+        "query_chars": len(q),
+        "query_words": len(q.split()),
+        "k": k,
+        "filtered": filt is not None,
+        "cached": cached,
+        "snapshot": SNAPSHOT.version if SNAPSHOT else None,
+    }))
+
+async def _recommend(q, k, filters, timings, ids=(None,), rerank=None):
+    """(recommendations, filter key, served from cache) for one query (possibly empty); raises HTTPException on bad input."""
+    if not q:
+        raise HTTPException(status_code=400, detail="Query must be non-empty")
+    check_cache_fresh()
+    # catalogs that still have to be loaded are loaded off the event loop
+    shards = resolve_catalogs(ids, load=False) or await run_in_threadpool(resolve_catalogs, ids)
+    filt = resolve_filters(filters, shards)
+    key = (normalize_query(q), k, filt, shards_key(shards), rerank)
+    recs = RESPONSE_CACHE.get(key)
+    if recs is not None:
+        return recs, filt, True
+    # embed query + search (request more to allow balancing); fanned-out items share one encode
+    items = [(q, k*OVERFETCH, filt, snap) for _, snap in shards]
+    # hybrid retrieval: keyword queries the lexical index answers alone skip the encoder
+    hits, lexical = lexical_hits(items)
+    todo = [j for j, hit in enumerate(hits) if hit is None]
+    if len(todo) < len(items):
+        LEXICAL_ONLY.inc(("recommend",), amount=len(items) - len(todo))
+    if todo:
+        pending = [items[j] for j in todo]
+        if BATCHER.running:
+            dense = [await BATCHER.submit(pending[0])] if len(pending) == 1 else \
+                await asyncio.gather(*(BATCHER.submit(item) for item in pending))
+        else:
+            dense = encode_and_search(pending)
+        for j, hit in zip(todo, fuse_hits(pending, dense, [lexical[j] for j in todo])):
+            hits[j] = hit
+    for hit in hits:
+        timings.update(hit[3])
+    recs = search_shards(k, shards, hits, timings, rerank)
+    if not recs:
+        # e.g. a filter no row matches: a valid request whose answer is empty, not an error
+        EMPTY_RESULTS.inc(("recommend",))
+    if cacheable(shards, hits):
+        RESPONSE_CACHE.put(key, recs)
+    return recs, filt, False
+
 @app.post("/recommend", response_model=RecommendResponse)
 async def recommend(req: RecommendRequest):
+    t0 = time.perf_counter()
+    REQUESTS.inc(("recommend",))
     q = req.query.strip()
     k = max(1, min(10, req.k or 5))
-    if not q:
-        raise HTTPException(status_code=400, detail="Query must be non-empty")
-    # embed query
-    q_emb = EMBEDDER.encode(q, convert_to_numpy=True, normalize_embeddings=True).astype('float32')
-    # search
-    D, I = INDEX.search(np.expand_dims(q_emb, axis=0), k*3)  # request more to allow balancing
-    idxs = I[0]
-    scores = D[0]
-    # prepare results dataframe
-    results = []
-    for i, sc in zip(idxs, scores):
-        if i < 0:
-            continue
-        row = METADATA.iloc[i].to_dict()
-        row['score'] = float(sc)
-        results.append(row)
-    if not results:
-        raise HTTPException(status_code=500, detail="No results found")
-    df_res = pd.DataFrame(results)
-    # try to balance by test_type (simple heuristic) while keeping score ordering
-    df_balanced = balance_by_type(df_res, k=k)
-    # if balancing returns fewer, fall back to straight top-k by score
-    if len(df_balanced) < k:
-        df_res_sorted = df_res.sort_values('score', ascending=False).head(k)
-    else:
-        df_res_sorted = df_balanced
-    # build response
-    recs = []
-    for _, r in df_res_sorted.iterrows():
-        recs.append({
-            "assessment_name": str(r.get("assessment_name","")),
-            "url": str(r.get("url","")),
-            "test_type": str(r.get("test_type","")),
-            "score": float(r.get("score",0.0))
-        })
-    return {"query": q, "recommendations": recs}
+    timings = {}
+    try:
+        recs, filt, cached = await _recommend(q, k, req.filters, timings, catalog_ids(req.catalog, req.catalogs),
+                                              resolve_rerank(req.rerank, req.mmr_lambda))
+    except HTTPException as e:
+        ERRORS.inc(("recommend", str(e.status_code)))
+        raise
+    except Exception:
+        ERRORS.inc(("recommend", "500"))
+        raise
+    with stage("serialize", timings):
+        body = json.dumps({"query": q, "recommendations": recs})
+    elapsed = time.perf_counter() - t0
+    REQUEST_SECONDS.observe(elapsed, ("recommend",))
+    log_slow_query("recommend", q, k, filt, elapsed, timings, cached)
+    return Response(content=body, media_type="application/json")
+
+def iter_batch_recommendations(queries, k, filt=None, shards=None, rerank=None):
+    """
+    Yield one NDJSON line per input query (in input order). Queries are processed
+    BATCH_CHUNK_SIZE at a time: one encode + one FAISS search per chunk (and catalog).
+    """
+    t0 = time.perf_counter()
+    BATCH_QUERIES.inc(amount=len(queries))
+    shards = shards or [(None, SNAPSHOT)]
+    skey = shards_key(shards)
+    for start in range(0, len(queries), BATCH_CHUNK_SIZE):
+        chunk = [q.strip() for q in queries[start:start + BATCH_CHUNK_SIZE]]
+        keys = [(normalize_query(q), k, filt, skey, rerank) for q in chunk]
+        out = [RESPONSE_CACHE.get(key) if q else [] for q, key in zip(chunk, keys)]
+        todo = [j for j, (q, recs) in enumerate(zip(chunk, out)) if q and recs is None]
+        if todo:
+            hits = retrieve([(chunk[j], k*OVERFETCH, filt, snap) for j in todo for _, snap in shards],
+                            endpoint="recommend_batch")
+            for n, j in enumerate(todo):
+                query_hits = hits[n * len(shards):(n + 1) * len(shards)]
+                out[j] = search_shards(k, shards, query_hits, rerank=rerank)
+                if cacheable(shards, query_hits):
+                    RESPONSE_CACHE.put(keys[j], out[j])
+        for q, recs in zip(chunk, out):
+            line = {"query": q, "recommendations": recs}
+            if not q:
+                line["error"] = "Query must be non-empty"
+            elif not recs:
+                EMPTY_RESULTS.inc(("recommend_batch",))
+            with stage("serialize"):
+                line = json.dumps(line) + "\n"
+            yield line
+    REQUEST_SECONDS.observe(time.perf_counter() - t0, ("recommend_batch",))
+
+@app.post("/recommend/batch")
+def recommend_batch(req: BatchRecommendRequest):
+    """Recommendations for many queries, streamed back as NDJSON (one line per query, in order)."""
+    REQUESTS.inc(("recommend_batch",))
+    k = max(1, min(10, req.k or 5))
+    if not req.queries:
+        ERRORS.inc(("recommend_batch", "400"))
+        raise HTTPException(status_code=400, detail="queries must be non-empty")
+    check_cache_fresh()
+    try:
+        shards = resolve_catalogs(catalog_ids(req.catalog, req.catalogs))
+        filt = resolve_filters(req.filters, shards)
+        rerank = resolve_rerank(req.rerank, req.mmr_lambda)
+    except HTTPException as e:
+        ERRORS.inc(("recommend_batch", str(e.status_code)))
+        raise
+    return StreamingResponse(iter_batch_recommendations(req.queries, k, filt, shards, rerank),
+                             media_type="application/x-ndjson")
@@ -0,0 +1,59 @@
+"""metadata_store.py
+
+Columnar, read-only view of model_store/metadata.csv for the request hot path.
+
+The CSV is parsed once; the output columns are kept as object arrays of
+ready-to-serialize strings (so result assembly is a fancy-index, not a pandas
+row lookup) and test_type is additionally encoded as sorted integer codes for
+balance_by_type_idx. `filters` holds the attribute bitmaps used for filtered search.
+"""
+import numpy as np
+import pandas as pd
+from typing import List
+
+try:
+    from .filters import FilterIndex
+except ImportError:  # imported from a script run inside backend/app
+    from filters import FilterIndex
+
+
+class MetadataStore:
+    """Row-aligned with the FAISS ids: row i describes vector i."""
+
+    def __init__(self, df: pd.DataFrame):
+        self.size = len(df)
+        self.assessment_name = self._strings(df, "assessment_name")
+        self.url = self._strings(df, "url")
+        self.test_type = self._strings(df, "test_type")
+        self.has_test_type = "test_type" in df.columns
+        if self.has_test_type:
+            # sorted codes match the key order of df.groupby('test_type'); NaN -> -1
+            codes, self.test_type_values = pd.factorize(df["test_type"], sort=True)
+            self.test_type_codes = codes.astype(np.int32)
+        else:
+            self.test_type_values = pd.Index([])
+            self.test_type_codes = np.full(self.size, -1, dtype=np.int32)
+        # bitmaps for filter pushdown (test_type, duration, other attributes)
+        self.filters = FilterIndex(df)
+
+    @classmethod
+    def from_csv(cls, path: str) -> "MetadataStore":
+        return cls(pd.read_csv(path))
+
+    @staticmethod
+    def _strings(df: pd.DataFrame, col: str) -> np.ndarray:
+        # str() per value, exactly as the response used to be built from row dicts
+        values = df[col].tolist() if col in df.columns else [""] * len(df)
+        arr = np.empty(len(values), dtype=object)
+        arr[:] = [str(v) for v in values]
+        return arr
+
+    def __len__(self):
+        return self.size
+
+    def records(self, ids: np.ndarray, scores: np.ndarray) -> List[dict]:
+        """Response dicts for the given row ids (in order)."""
+        return [
+            {"assessment_name": n, "url": u, "test_type": t, "score": float(s)}
+            for n, u, t, s in zip(self.assessment_name[ids], self.url[ids], self.test_type[ids], scores)
+        ]
@@ -0,0 +1,209 @@
+"""metrics.py
+
+In-process latency histograms and counters, rendered in the Prometheus text
+exposition format (GET /metrics in main.py, or a textfile for offline runs).
+
+Stages of the recommendation path are timed with `stage()`:
+    with stage("encode", timings):
+        ...
+which observes into recommend_stage_seconds{stage="encode"} and, if a dict is
+passed, adds the duration to it (per-request breakdown for the slow-query log).
+Recording is a perf_counter pair, a bisect and a short locked update
+(see bench_metrics.py for the per-call cost); set_enabled(False) turns it off.
+"""
+import time
+import bisect
+import threading
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+# seconds; spans cache hits (~10us) up to a cold encoder forward pass on long text
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_enabled = True
+
+
+def set_enabled(enabled: bool):
+    global _enabled
+    _enabled = bool(enabled)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    return repr(float(value)) if value != float("inf") else "+Inf"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Tuple = (), amount: float = 1.0):
+        if not _enabled:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, labels: Tuple = ()) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_labels(self.labelnames, labels)} {_fmt(value)}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, list] = {}  # labels -> [per-bucket counts (+overflow), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: Tuple = ()):
+        if not _enabled:
+            return
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self) -> Dict[Tuple, Tuple[list, float, int]]:
+        with self._lock:
+            return {labels: (list(counts), total, n) for labels, (counts, total, n) in self._series.items()}
+
+    def quantile(self, q: float, labels: Tuple = ()) -> Optional[float]:
+        """Estimated quantile, interpolated linearly inside the bucket (like histogram_quantile)."""
+        series = self.snapshot().get(labels)
+        if not series or not series[2]:
+            return None
+        counts, _, n = series
+        rank, seen = q * n, 0
+        for i, c in enumerate(counts):
+            if c and seen + c >= rank:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / c
+            seen += c
+        return self.buckets[-1]
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for labels, (counts, total, n) in sorted(self.snapshot().items()):
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                le = 'le="%s"' % _fmt(bound)
+                yield f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.labelnames, labels)} {_fmt(total)}"
+            yield f"{self.name}_count{_labels(self.labelnames, labels)} {n}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self, extra: Iterable[str] = ()) -> str:
+        lines = [line for metric in self._metrics for line in metric.render()]
+        lines.extend(extra)
+        return "\n".join(lines) + "\n"
+
+    def write(self, path: str):
+        """Write the exposition to a file (e.g. for node_exporter's textfile collector)."""
+        with open(path, "w") as f:
+            f.write(self.render())
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram(
+    "recommend_stage_seconds", "Time spent per stage of the recommendation path", ("stage",))
+
+
+class stage:
+    """Context manager timing one stage into STAGE_SECONDS (and optionally a per-request dict)."""
+    __slots__ = ("name", "timings", "t0")
+
+    def __init__(self, name: str, timings: Optional[dict] = None):
+        self.name = name
+        self.timings = timings
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.t0
+        STAGE_SECONDS.observe(elapsed, (self.name,))
+        if self.timings is not None:
+            self.timings[self.name] = self.timings.get(self.name, 0.0) + elapsed
+        return False
+
+
+def stage_summary(histogram: Histogram = STAGE_SECONDS) -> str:
+    """Human-readable per-stage count / mean / p50 / p95 / p99 (ms), for CLI runs."""
+    lines = []
+    for labels, (_, total, n) in sorted(histogram.snapshot().items()):
+        if not n:
+            continue
+        p = [histogram.quantile(q, labels) * 1000 for q in (0.5, 0.95, 0.99)]
+        lines.append(f"  {labels[0] if labels else '':<12} n={n:<7} mean={total / n * 1000:8.3f}ms  "
+                     f"p50~{p[0]:8.3f}ms  p95~{p[1]:8.3f}ms  p99~{p[2]:8.3f}ms")
+    return "\n".join(lines)
+
+
+def cache_lines(stats_by_cache: Dict[str, dict]) -> Iterable[str]:
+    """Counters/gauges for cache.LRUCache.stats() dicts, keyed by cache name."""
+    for stat, kind in (("hits", "counter"), ("misses", "counter"), ("evictions", "counter"), ("size", "gauge")):
+        name = f"recommend_cache_{stat}" + ("_total" if kind == "counter" else "")
+        yield f"# HELP {name} Cache {stat} per cache level"
+        yield f"# TYPE {name} {kind}"
+        for cache, stats in sorted(stats_by_cache.items()):
+            if stat in stats:
+                yield f'{name}{{cache="{_escape(cache)}"}} {_fmt(stats[stat])}'
+
+
+def catalog_lines(stats_by_catalog: Dict[str, dict]) -> Iterable[str]:
+    """Counters/gauges for catalogs.CatalogRegistry.stats()["catalogs"], keyed by catalog id."""
+    for stat, name, kind, help in (
+            ("loads", "recommend_catalog_loads_total", "counter", "Catalog loads (first use or after eviction)"),
+            ("hits", "recommend_catalog_hits_total", "counter", "Requests served by an already loaded catalog"),
+            ("evictions", "recommend_catalog_evictions_total", "counter", "Catalogs dropped from memory"),
+            ("total_load_seconds", "recommend_catalog_load_seconds_total", "counter", "Time spent loading catalogs"),
+            ("last_load_seconds", "recommend_catalog_last_load_seconds", "gauge", "Duration of the latest load"),
+            ("resident_bytes", "recommend_catalog_resident_bytes", "gauge", "Estimated memory of a loaded catalog")):
+        yield f"# HELP {name} {help}"
+        yield f"# TYPE {name} {kind}"
+        for catalog, stats in sorted(stats_by_catalog.items()):
+            if stats.get(stat) is not None:
+                yield f'{name}{{catalog="{_escape(catalog)}"}} {_fmt(stats[stat])}'
@@ -0,0 +1,94 @@
+"""neighbor_graph.py
+
+Sparse top-M item similarity graph over the catalog embeddings, used for MMR re-ranking.
+
+build_index.py --neighbors M writes it next to the index:
+    neighbors.npy       int32   [rows, M]  ids of each row's M most similar rows (-1 = none)
+    neighbor_sims.npy   float16 [rows, M]  their cosine similarities
+Both are memory-mapped on load. NeighborGraph.pool_similarity(ids) gives MMR (utils.mmr_select)
+the candidates similar to a picked one by looking its M neighbors up in the sorted pool:
+O(M log n) per pick, no embedding reads and no n x n matrix, so the cost barely grows with
+the pool size. Candidates outside a row's top-M count as 0 (not redundant);
+near-duplicates, the ones MMR is there to push down, rank first in it.
+"""
+import os
+import numpy as np
+from typing import Optional
+
+NEIGHBORS_FILE = "neighbors.npy"
+NEIGHBOR_SIMS_FILE = "neighbor_sims.npy"
+
+
+def build_neighbor_graph(index, embeddings: np.ndarray, m: int = 32, chunk_size: int = 4096):
+    """
+    (ids, sims) of the top-m neighbors of every row, excluding the row itself, found by
+    searching `index` with the rows (exact for a flat index).
+    """
+    n = len(embeddings)
+    m = max(0, min(m, n - 1))
+    ids = np.full((n, m), -1, dtype=np.int32)
+    sims = np.zeros((n, m), dtype=np.float16)
+    if m == 0:
+        return ids, sims
+    for start in range(0, n, chunk_size):
+        block = np.ascontiguousarray(embeddings[start:start + chunk_size], dtype=np.float32)
+        D, I = index.search(block, m + 1)
+        rows = np.arange(start, start + len(block))
+        keep = (I != rows[:, None]) & (I >= 0)
+        # first m hits per row that aren't the row itself, in rank order
+        order = np.argsort(~keep, axis=1, kind="stable")[:, :m]
+        valid = np.take_along_axis(keep, order, axis=1)
+        ids[start:start + len(block)] = np.where(valid, np.take_along_axis(I, order, axis=1), -1)
+        sims[start:start + len(block)] = np.where(valid, np.take_along_axis(D, order, axis=1), 0)
+    return ids, sims
+
+
+class NeighborGraph:
+    """Read-only top-M neighbor lists, row-aligned with the FAISS ids."""
+
+    def __init__(self, ids: np.ndarray, sims: np.ndarray):
+        self.ids = ids
+        self.sims = sims
+
+    @classmethod
+    def load(cls, model_dir: str, mmap: bool = True) -> Optional["NeighborGraph"]:
+        """The graph stored in model_dir, or None if the build didn't write one."""
+        ids_path = os.path.join(model_dir, NEIGHBORS_FILE)
+        sims_path = os.path.join(model_dir, NEIGHBOR_SIMS_FILE)
+        if not (os.path.exists(ids_path) and os.path.exists(sims_path)):
+            return None
+        mode = "r" if mmap else None
+        return cls(np.load(ids_path, mmap_mode=mode), np.load(sims_path, mmap_mode=mode))
+
+    def __len__(self):
+        return self.ids.shape[0]
+
+    @property
+    def m(self) -> int:
+        return self.ids.shape[1]
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.ids.nbytes + self.sims.nbytes)
+
+    def neighbors(self, row: int):
+        """(ids, cosine similarities) of row's neighbors, most similar first."""
+        ids = np.asarray(self.ids[row])
+        keep = ids >= 0
+        return ids[keep].astype(np.int64), np.asarray(self.sims[row])[keep].astype(np.float32)
+
+    def pool_similarity(self, cand: np.ndarray):
+        """
+        fn(position) -> (positions, similarities) of the candidates in cand[position]'s
+        neighbor list, for utils.mmr_select.
+        """
+        order = np.argsort(cand)
+        # sentinel: neighbor ids past the largest candidate land on it and never match
+        sorted_ids = np.append(cand[order], -2)
+
+        def similar(j):
+            nbr = self.ids[cand[j]]
+            pos = np.searchsorted(sorted_ids[:-1], nbr)
+            hit = sorted_ids[pos] == nbr
+            return order[pos[hit]], self.sims[cand[j]][hit].astype(np.float32)
+        return similar
@@ -0,0 +1,147 @@
+"""prediction_stream.py
+
+Streaming, resumable building blocks for generate_predictions.py and
+generate_predictions_local.py.
+
+- read_query_chunks() reads the input CSV `chunk_size` rows at a time (only the Query column)
+- prefetch() runs an iterator on a background thread with a bounded queue, so CSV parsing
+  (or HTTP round trips) overlap with encoding / search of the previous chunk
+- PredictionWriter appends Query,Assessment_url rows to the output as each chunk finishes and
+  then records a checkpoint (<output>.ckpt: input rows done + output size). With resume=True an
+  interrupted run truncates the output back to the last checkpoint and skips the rows already done.
+Memory is bounded by chunk_size x (prefetch depth + 1) whatever the input size.
+"""
+import os
+import csv
+import json
+import queue
+import threading
+import pandas as pd
+
+CHECKPOINT_SUFFIX = ".ckpt"
+OUTPUT_COLUMNS = ["Query", "Assessment_url"]
+
+
+def input_fingerprint(path: str) -> dict:
+    st = os.stat(path)
+    return {"path": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def read_query_chunks(input_csv: str, chunk_size: int = 10000, skip_rows: int = 0):
+    """Yield lists of query strings, `chunk_size` input rows at a time, after skipping `skip_rows` rows."""
+    header = pd.read_csv(input_csv, nrows=0).columns
+    if 'Query' not in header:
+        raise ValueError("Input CSV must have a 'Query' column")
+    reader = pd.read_csv(input_csv, usecols=['Query'], chunksize=chunk_size,
+                         skiprows=range(1, skip_rows + 1) if skip_rows else None)
+    for chunk in reader:
+        yield chunk['Query'].astype(str).tolist()
+
+
+def prefetch(iterable, depth: int = 2):
+    """Iterate `iterable` on a background thread, at most `depth` items ahead (depth 0 = inline)."""
+    if depth <= 0:
+        yield from iterable
+        return
+    q = queue.Queue(maxsize=depth)
+    done = object()
+    stop = threading.Event()
+
+    def produce():
+        try:
+            for item in iterable:
+                while not stop.is_set():
+                    try:
+                        q.put((item, None), timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            q.put((done, None))
+        except BaseException as e:  # re-raised in the consumer
+            q.put((done, e))
+
+    thread = threading.Thread(target=produce, name="prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, error = q.get()
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+class PredictionWriter:
+    """Appends prediction rows chunk by chunk and checkpoints after each one."""
+
+    def __init__(self, output_csv: str, input_csv: str, resume: bool = False):
+        self.output_csv = output_csv
+        self.checkpoint_path = output_csv + CHECKPOINT_SUFFIX
+        self.fingerprint = input_fingerprint(input_csv)
+        self.rows_done = 0
+        self.rows_written = 0
+        state = self._load_checkpoint() if resume else None
+        if state is not None:
+            if state["input"] != self.fingerprint:
+                raise ValueError(f"{input_csv} changed since the checkpoint in {self.checkpoint_path}; "
+                                 "rerun without --resume")
+            self.rows_done = state["input_rows_done"]
+            self.rows_written = state["output_rows"]
+            # drop anything written after the last checkpoint (an interrupted chunk)
+            self._file = open(output_csv, "r+", newline="", encoding="utf-8")
+            self._file.truncate(state["output_bytes"])
+            self._file.seek(state["output_bytes"])
+        else:
+            self._file = open(output_csv, "w", newline="", encoding="utf-8")
+        self._csv = csv.writer(self._file, lineterminator="\n")
+        if state is None:
+            self._csv.writerow(OUTPUT_COLUMNS)
+            self._checkpoint()
+
+    @property
+    def resumed(self) -> bool:
+        return self.rows_done > 0
+
+    def _load_checkpoint(self):
+        if not (os.path.exists(self.checkpoint_path) and os.path.exists(self.output_csv)):
+            return None
+        with open(self.checkpoint_path) as f:
+            return json.load(f)
+
+    def _checkpoint(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        state = {"input": self.fingerprint, "input_rows_done": self.rows_done,
+                 "output_rows": self.rows_written, "output_bytes": self._file.tell()}
+        tmp = self.checkpoint_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.checkpoint_path)
+
+    def write_chunk(self, rows, input_rows: int):
+        """Append (query, url) rows produced from the next `input_rows` input rows, then checkpoint."""
+        n = 0
+        for row in rows:
+            self._csv.writerow(row)
+            n += 1
+        self.rows_done += input_rows
+        self.rows_written += n
+        self._checkpoint()
+
+    def close(self, complete: bool = True):
+        """Close the output; a complete run removes its checkpoint."""
+        self._file.close()
+        if complete and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close(complete=exc_type is None)
+        return False
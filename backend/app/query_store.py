@@ -0,0 +1,337 @@
+"""query_store.py
+
+Persistent, memory-mapped store of precomputed query embeddings for known workloads
+(train / test query files replayed by evaluation and reporting jobs).
+
+Entries are keyed on a 64-bit hash of (encoder key, normalized query): the encoder key is
+the model name plus any backend / long-query setting that changes the vectors (see
+encoder_key). Layout:
+    query_store/
+      manifest.json                    encoder key, dim, live segments
+      segments/<id>.keys.npy           sorted uint64 keys
+      segments/<id>.npy                float32 normalized embeddings, row-aligned with the keys
+Each fill appends one segment (files first, manifest replaced atomically last, so readers
+never see a partial one); lookups binary-search every live segment through mmap. compact()
+merges the segments into one and deletes unreferenced files. A store built for another
+encoder key is stale: lookups ignore it, and the next fill starts over and deletes the
+old entries.
+
+search_index.py, generate_predictions_local.py and the API (hence bench_retrieval.py and
+the other train checks) read it before falling back to the encoder; with every query
+stored, the encoder isn't even loaded.
+
+Usage (from backend/app):
+    python query_store.py fill ../../data/train.csv ../../data/test.csv
+    python query_store.py fill ../../data/test.csv --encoder-backend onnx --long-query-mode budget
+    python query_store.py compact --keep ../../data/train.csv ../../data/test.csv
+    python query_store.py stats
+"""
+import os
+import json
+import time
+import uuid
+import hashlib
+import argparse
+import numpy as np
+from typing import Optional
+
+try:
+    from .cache import normalize_query
+except ImportError:  # imported from a script run inside backend/app
+    from cache import normalize_query
+
+QUERY_STORE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "query_store")
+MANIFEST_FILE = "manifest.json"
+SEGMENT_DIR = "segments"
+MAX_SEGMENTS = 8  # fills compact once there are more
+MODEL_NAME = "all-MiniLM-L6-v2"  # must match build_index.py
+
+
+def encoder_key(model_name: str, backend: str = "torch", long_query_mode: str = "truncate",
+                token_budget: int = 512, overlap: int = 32, strip_boilerplate: bool = False) -> str:
+    """Identity of the vectors an encoder configuration produces (same backend naming as build_index.py)."""
+    key = model_name if backend == "torch" else f"{model_name}@{backend}"
+    if long_query_mode != "truncate" or strip_boilerplate:
+        key += f"|{long_query_mode}:{token_budget}:{overlap}" + (":strip" if strip_boilerplate else "")
+    return key
+
+
+def query_keys(model_key: str, queries) -> np.ndarray:
+    return np.array([int.from_bytes(hashlib.blake2b(f"{model_key}\x1f{normalize_query(q)}".encode("utf-8"),
+                                                    digest_size=8).digest(), "little") for q in queries],
+                    dtype=np.uint64)
+
+
+def _save_npy(path, arr):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, arr)
+    os.replace(tmp, path)
+
+
+class QueryStore:
+    """
+    Args:
+        path: store folder (created on first fill).
+        model_key: encoder_key() of the encoder the caller would otherwise run.
+    """
+
+    def __init__(self, path: str, model_key: str):
+        self.path = path
+        self.model_key = model_key
+        self._fingerprint = None
+        self.manifest = {}
+        self.segments = []  # [(keys, embeddings)] of the live segments, memory-mapped
+        self.refresh()
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.path, MANIFEST_FILE)
+
+    def refresh(self) -> bool:
+        """Re-open the store if a fill / compact replaced its manifest; True if it changed."""
+        try:
+            st = os.stat(self.manifest_path)
+            fp = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            fp = None
+        if fp == self._fingerprint:
+            return False
+        self._fingerprint = fp
+        self.manifest, self.segments = {}, []
+        if fp is not None:
+            with open(self.manifest_path) as f:
+                self.manifest = json.load(f)
+            if not self.stale:
+                seg_dir = os.path.join(self.path, SEGMENT_DIR)
+                self.segments = [(np.load(os.path.join(seg_dir, f"{s['id']}.keys.npy"), mmap_mode="r"),
+                                  np.load(os.path.join(seg_dir, f"{s['id']}.npy"), mmap_mode="r"))
+                                 for s in self.manifest.get("segments", [])]
+        return True
+
+    @property
+    def stale(self) -> bool:
+        """True if the store holds vectors of another encoder configuration."""
+        return bool(self.manifest) and self.manifest.get("model") != self.model_key
+
+    def __len__(self):
+        return sum(len(keys) for keys, _ in self.segments)
+
+    def lookup(self, queries):
+        """(float32 [n, dim] embeddings or None if nothing was found, bool [n] found mask)."""
+        found = np.zeros(len(queries), dtype=bool)
+        if not self.segments or not len(queries):
+            return None, found
+        keys = query_keys(self.model_key, queries)
+        out = None
+        for seg_keys, seg_embs in self.segments:
+            pos = np.searchsorted(seg_keys, keys).clip(max=len(seg_keys) - 1)
+            hit = (seg_keys[pos] == keys) & ~found
+            if hit.any():
+                if out is None:
+                    out = np.zeros((len(queries), seg_embs.shape[1]), dtype=np.float32)
+                out[hit] = seg_embs[pos[hit]]
+                found |= hit
+        return out, found
+
+    def add(self, queries, embeddings: np.ndarray) -> int:
+        """Store embeddings for queries not stored yet (as one new segment); returns how many were added."""
+        self.refresh()
+        keys = query_keys(self.model_key, queries)
+        _, found = self.lookup(queries)
+        keys, idx = np.unique(keys[~found], return_index=True)
+        if not len(keys):
+            return 0
+        embs = np.ascontiguousarray(np.asarray(embeddings, dtype=np.float32)[~found][idx])
+        segments = [] if self.stale else list(self.manifest.get("segments", []))
+        if segments and self.manifest.get("dim") != embs.shape[1]:
+            raise ValueError(f"Query store {self.path} holds {self.manifest.get('dim')}-dim vectors, got {embs.shape[1]}")
+        segments.append(self._write_segment(keys, embs))
+        self._write_manifest(segments, embs.shape[1])
+        if len(segments) > MAX_SEGMENTS:
+            self.compact()
+        else:
+            # also drops every segment of the previous encoder if the store was stale
+            self._remove_unreferenced()
+        return len(keys)
+
+    def compact(self, keep_queries=None) -> dict:
+        """
+        Merge the live segments into one (dropping duplicates, and with keep_queries every entry
+        not among them) and delete unreferenced files: merged segments, leftovers of interrupted writes.
+        """
+        self.refresh()
+        before = len(self)
+        if self.segments:
+            keys = np.concatenate([k for k, _ in self.segments])
+            embs = np.concatenate([e for _, e in self.segments])
+            keys, idx = np.unique(keys, return_index=True)
+            embs = embs[idx]
+            if keep_queries is not None:
+                keep = np.isin(keys, query_keys(self.model_key, keep_queries))
+                keys, embs = keys[keep], embs[keep]
+            segments = [self._write_segment(keys, embs)] if len(keys) else []
+            self._write_manifest(segments, embs.shape[1])
+        elif self.stale:  # another encoder's entries: left to the next fill, which replaces them
+            return {"rows_before": 0, "rows_after": 0}
+        self._remove_unreferenced()
+        return {"rows_before": before, "rows_after": len(self)}
+
+    def _write_segment(self, keys, embs) -> dict:
+        seg_dir = os.path.join(self.path, SEGMENT_DIR)
+        os.makedirs(seg_dir, exist_ok=True)
+        seg_id = time.strftime("%Y%m%dT%H%M%S", time.gmtime()) + "-" + uuid.uuid4().hex[:8]
+        _save_npy(os.path.join(seg_dir, f"{seg_id}.npy"), embs)
+        _save_npy(os.path.join(seg_dir, f"{seg_id}.keys.npy"), keys)
+        return {"id": seg_id, "rows": int(len(keys))}
+
+    def _write_manifest(self, segments, dim):
+        manifest = {"model": self.model_key, "dim": int(dim) if dim else None, "segments": segments,
+                    "rows": int(sum(s["rows"] for s in segments)),
+                    "updated_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp, self.manifest_path)
+        self._fingerprint = None
+        self.refresh()
+
+    def _remove_unreferenced(self):
+        """Delete segment files the manifest no longer lists (readers keep their mmaps of them)."""
+        seg_dir = os.path.join(self.path, SEGMENT_DIR)
+        if not os.path.isdir(seg_dir):
+            return
+        live = {s["id"] for s in self.manifest.get("segments", [])}
+        for name in os.listdir(seg_dir):
+            if name.split(".")[0] not in live:
+                os.remove(os.path.join(seg_dir, name))
+
+    def stats(self) -> dict:
+        seg_dir = os.path.join(self.path, SEGMENT_DIR)
+        on_disk = sum(os.path.getsize(os.path.join(seg_dir, n)) for n in os.listdir(seg_dir)) \
+            if os.path.isdir(seg_dir) else 0
+        return {"path": self.path, "model": self.manifest.get("model"), "stale": self.stale,
+                "dim": self.manifest.get("dim"), "rows": len(self), "segments": len(self.segments),
+                "bytes": on_disk, "updated_at": self.manifest.get("updated_at")}
+
+
+class StoredQueryEncoder:
+    """
+    SentenceTransformer-style encode() that serves stored queries from a QueryStore and
+    builds the real encoder (loader()) only when some query is missing. The store holds
+    normalized embeddings, so normalize_embeddings=False bypasses it.
+    """
+
+    def __init__(self, store: QueryStore, loader):
+        self.store = store
+        self._loader = loader
+        self._encoder = None
+
+    @property
+    def encoder(self):
+        if self._encoder is None:
+            self._encoder = self._loader()
+        return self._encoder
+
+    def __getattr__(self, name):
+        return getattr(self.encoder, name)
+
+    def encode(self, sentences, batch_size: int = 32, show_progress_bar: bool = False,
+               convert_to_numpy: bool = True, normalize_embeddings: bool = False, **kwargs):
+        stored, found = self.store.lookup(sentences) if normalize_embeddings else (None, None)
+        if stored is not None and found.all():
+            return stored
+        todo = list(sentences) if stored is None else [s for s, f in zip(sentences, found) if not f]
+        new = np.asarray(self.encoder.encode(todo, batch_size=batch_size, show_progress_bar=show_progress_bar,
+                                             convert_to_numpy=True, normalize_embeddings=normalize_embeddings,
+                                             **kwargs), dtype=np.float32)
+        if stored is None:
+            return new
+        stored[~found] = new
+        return stored
+
+
+def stored_encoder(model_name: str = MODEL_NAME, backend: str = "torch", threads: Optional[int] = None,
+                   store_dir: Optional[str] = QUERY_STORE_DIR, long_query_mode: str = "truncate",
+                   token_budget: int = 512, overlap: int = 32, strip_boilerplate: bool = False):
+    """
+    Query encoder for the offline scripts: QueryStore hits first (store_dir=None disables it),
+    the encoder from encoders.load_encoder (+ LongQueryEncoder) loaded on the first miss.
+    """
+    def load():
+        try:
+            from .encoders import load_encoder
+            from .long_queries import LongQueryEncoder
+        except ImportError:
+            from encoders import load_encoder
+            from long_queries import LongQueryEncoder
+        model = load_encoder(model_name, backend=backend, threads=threads)
+        if long_query_mode != "truncate" or strip_boilerplate:
+            model = LongQueryEncoder(model, long_query_mode, token_budget=token_budget, overlap=overlap,
+                                     drop_boilerplate=strip_boilerplate)
+        return model
+    if not store_dir:
+        return load()
+    key = encoder_key(model_name, backend, long_query_mode, token_budget, overlap, strip_boilerplate)
+    return StoredQueryEncoder(QueryStore(store_dir, key), load)
+
+
+def read_queries(paths):
+    import pandas as pd
+    queries = []
+    for path in paths:
+        queries.extend(pd.read_csv(path, usecols=["Query"])["Query"].dropna().astype(str))
+    return queries
+
+
+def fill(store: QueryStore, queries, encoder, batch_size: int = 64) -> dict:
+    """Encode the distinct queries the store doesn't have yet (first spelling of each) and add them."""
+    t0 = time.perf_counter()
+    by_key = dict(zip(query_keys(store.model_key, queries).tolist(), queries))
+    distinct = list(by_key.values())
+    _, found = store.lookup(distinct)
+    todo = [q for q, f in zip(distinct, found) if not f]
+    added = 0
+    if todo:
+        embs = encoder.encode(todo, batch_size=batch_size, show_progress_bar=len(todo) > batch_size,
+                              convert_to_numpy=True, normalize_embeddings=True)
+        added = store.add(todo, embs)
+    return {"queries": len(queries), "distinct": len(distinct), "stored": int(found.sum()), "encoded": added,
+            "seconds": time.perf_counter() - t0}
+
+
+if __name__ == "__main__":
+    from long_queries import LONG_QUERY_MODES
+    from encoders import ENCODER_BACKENDS
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=("fill", "compact", "stats"))
+    parser.add_argument("files", nargs="*", help="CSVs with a Query column (fill)")
+    parser.add_argument("--store", type=str, default=QUERY_STORE_DIR, help="query store folder")
+    parser.add_argument("--keep", type=str, nargs="+", help="compact: keep only queries from these CSVs")
+    parser.add_argument("--batch-size", type=int, default=64, help="encoder batch size")
+    parser.add_argument("--encoder-backend", type=str, default="torch", choices=ENCODER_BACKENDS)
+    parser.add_argument("--encoder-threads", type=int, help="intra-op threads for the encoder")
+    parser.add_argument("--long-query-mode", type=str, default="truncate", choices=LONG_QUERY_MODES)
+    parser.add_argument("--token-budget", type=int, default=512)
+    parser.add_argument("--chunk-overlap", type=int, default=32)
+    parser.add_argument("--strip-boilerplate", action="store_true")
+    args = parser.parse_args()
+
+    key = encoder_key(MODEL_NAME, args.encoder_backend, args.long_query_mode, args.token_budget,
+                      args.chunk_overlap, args.strip_boilerplate)
+    store = QueryStore(args.store, key)
+    if args.command == "fill":
+        if not args.files:
+            parser.error("fill needs at least one query CSV")
+        if store.stale:
+            print(f"Store was built for {store.manifest.get('model')!r}; replacing it with {key!r} entries")
+        # loads the encoder only if some query is missing
+        encoder = stored_encoder(MODEL_NAME, args.encoder_backend, args.encoder_threads, args.store,
+                                 args.long_query_mode, args.token_budget, args.chunk_overlap, args.strip_boilerplate)
+        res = fill(store, read_queries(args.files), encoder, batch_size=args.batch_size)
+        print(f"{res['queries']} queries ({res['distinct']} distinct): {res['stored']} already stored, "
+              f"encoded {res['encoded']} in {res['seconds']:.1f}s")
+    elif args.command == "compact":
+        res = store.compact(read_queries(args.keep) if args.keep else None)
+        print(f"Compacted {args.store}: {res['rows_before']} -> {res['rows_after']} rows")
+    print(json.dumps(store.stats(), indent=2))
@@ -0,0 +1,139 @@
+"""recommend_client.py
+
+Async, high-concurrency client for POST /recommend, used by generate_predictions.py --async.
+
+- `concurrency` workers, each with its own keep-alive connection, pulling queries from a
+  shared queue (one big httpx pool rescans every connection for every queued request,
+  which costs more CPU than the requests themselves beyond ~16 connections)
+- retries with jittered exponential backoff on transient failures only: timeouts, connection
+  errors and 429 / 502 / 503 / 504 (honoring Retry-After); other statuses, 500 included, are
+  deterministic answers and fail at once
+- fetch(queries) returns one result per query in input order, however requests complete
+- latency / retry / failure counters for a run summary
+The event loop runs on a background thread, so fetch() can be called from plain
+synchronous code (the streaming loop in generate_predictions.py).
+
+Usage:
+    client = RecommendClient("http://localhost:8000", concurrency=32)   # a running uvicorn
+    client = RecommendClient(app=main.app, concurrency=32)              # in-process, like TestClient
+    recs = client.fetch(queries, k=5)   # list of recommendation lists, same order as queries
+    print(client.summary())
+    client.close()
+"""
+import time
+import random
+import asyncio
+import threading
+import numpy as np
+import httpx
+
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+
+class RecommendClient:
+    def __init__(self, base_url: str = "http://localhost:8000", concurrency: int = 16, retries: int = 3,
+                 backoff: float = 0.25, timeout: float = 30.0, app=None):
+        self.concurrency = max(1, concurrency)
+        self.retries = max(0, retries)
+        self.backoff = backoff
+        self.latencies = []
+        self.retried = self.failed = 0
+        self.elapsed = 0.0
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="recommend-client", daemon=True)
+        self._thread.start()
+        self._run(self._open(base_url, timeout, app))
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def _open(self, base_url, timeout, app):
+        self._lifespan = None
+        transport = None
+        if app is not None:
+            # in-process: run the app's startup hooks on this loop (what TestClient does), then talk ASGI directly
+            self._lifespan = app.router.lifespan_context(app)
+            await self._lifespan.__aenter__()
+            transport = httpx.ASGITransport(app=app)
+            base_url = "http://testserver"
+        limits = httpx.Limits(max_connections=1, max_keepalive_connections=1)
+        self._clients = [httpx.AsyncClient(base_url=base_url, transport=transport, timeout=timeout, limits=limits)
+                         for _ in range(self.concurrency)]
+
+    async def _close(self):
+        for client in self._clients:
+            await client.aclose()
+        if self._lifespan is not None:
+            await self._lifespan.__aexit__(None, None, None)
+
+    def close(self):
+        try:
+            self._run(self._close())
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join()
+            self.loop.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    async def _recommend(self, client, query, k):
+        t0 = time.perf_counter()
+        for attempt in range(self.retries + 1):
+            delay = random.uniform(0, self.backoff * 2 ** attempt)
+            try:
+                r = await client.post("/recommend", json={"query": query, "k": k})
+                if r.status_code not in RETRY_STATUSES:
+                    break
+                error = f"{r.status_code} {r.text[:200]}"
+                retry_after = r.headers.get("Retry-After", "")
+                if retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+            except httpx.TransportError as e:  # timeouts, refused / reset connections
+                error = repr(e)
+            if attempt < self.retries:
+                self.retried += 1
+                await asyncio.sleep(delay)
+        else:
+            self.failed += 1
+            print("Warning: request failed for query:", query, error)
+            return []
+        if r.status_code != 200:
+            # 4xx / 500: the same request would fail the same way, retrying will not help
+            self.failed += 1
+            print("Warning: request failed for query:", query, r.status_code, r.text)
+            return []
+        self.latencies.append(time.perf_counter() - t0)
+        return r.json().get("recommendations", [])
+
+    async def _fetch(self, queries, k):
+        results = [[] for _ in queries]
+        todo = iter(enumerate(queries))  # shared by the workers: each query is taken by exactly one
+
+        async def worker(client):
+            for i, q in todo:
+                results[i] = await self._recommend(client, q, k)
+
+        await asyncio.gather(*(worker(client) for client in self._clients[:len(queries)]))
+        return results
+
+    def fetch(self, queries, k=5):
+        """Recommendations for each query, in the order of `queries` (failed queries give [])."""
+        t0 = time.perf_counter()
+        try:
+            return self._run(self._fetch(list(queries), k))
+        finally:
+            self.elapsed += time.perf_counter() - t0
+
+    def summary(self) -> str:
+        done = len(self.latencies)
+        line = (f"{done} queries in {self.elapsed:.2f}s -> {done / max(self.elapsed, 1e-9):.1f} queries/s "
+                f"(concurrency={self.concurrency}, retries={self.retried}, failed={self.failed})")
+        if done:
+            p50, p95, p99 = np.percentile(np.asarray(self.latencies) * 1000, [50, 95, 99])
+            line += f"\nlatency ms: p50={p50:.1f} p95={p95:.1f} p99={p99:.1f} max={max(self.latencies) * 1000:.1f}"
+        return line
@@ -9,14 +9,20 @@ Usage (from backend/app directory):
     python search_index.py                     # run with default test queries
     python search_index.py --test ../data/test.csv  # use queries from test.csv
     python search_index.py --query "your query here" # run a single query
+    python search_index.py --test ../data/test.csv --timings --metrics-out search.prom  # stage latencies
+    python search_index.py --test ../data/test.csv --no-query-store  # always run the encoder
+
+Queries precomputed in the query store (query_store.py fill) skip the encoder.
 """
 import os
 import argparse
-import numpy as np
 import pandas as pd
-import faiss
-from sentence_transformers import SentenceTransformer
+from encoders import ENCODER_BACKENDS
 from utils import load_queries_from_dataset, topk_from_scores, balance_by_type
+from index_backends import load_index as load_vectors
+from snapshots import resolve_current
+from metrics import REGISTRY, stage, stage_summary
+from query_store import QUERY_STORE_DIR, stored_encoder
 
 MODEL_NAME = "all-MiniLM-L6-v2"  # must match build_index.py
 DEFAULT_QUERIES = [
@@ -25,10 +31,10 @@ DEFAULT_QUERIES = [
     "Technical assessment for Python and SQL, one hour max",
 ]
 
-def load_index(model_dir="model_store"):
-    """Load the FAISS index, embeddings, and metadata."""
-    index = faiss.read_index(os.path.join(model_dir, "faiss.index"))
-    embeddings = np.load(os.path.join(model_dir, "embeddings.npy"))
+def load_index(model_dir="model_store", nprobe=None, ef_search=None, mmap=True):
+    """Load the FAISS index, embeddings (memory-mapped), and metadata (of the CURRENT snapshot, if versioned)."""
+    model_dir = resolve_current(model_dir)
+    index, embeddings = load_vectors(model_dir, mmap=mmap, nprobe=nprobe, ef_search=ef_search)
     metadata = pd.read_csv(os.path.join(model_dir, "metadata.csv"))
     return index, embeddings, metadata
 
@@ -41,18 +47,21 @@ def search(query, index, metadata, model, k=5, min_score=0.2):
         min_score: minimum cosine similarity score (0-1) to include in results
     """
     # encode query same way as docs (normalize since index uses dot product)
-    q_emb = model.encode([query], show_progress_bar=False, normalize_embeddings=True)[0]
+    with stage("encode"):
+        q_emb = model.encode([query], show_progress_bar=False, normalize_embeddings=True)[0]
     
     # get top k matches (scores are dot products ~ cosine sim since normalized)
-    D, I = index.search(q_emb.reshape(1, -1).astype('float32'), k=k*2)  # get more candidates
+    with stage("search"):
+        D, I = index.search(q_emb.reshape(1, -1).astype('float32'), k=k*2)  # get more candidates
     
     # gather metadata for matches
-    results = metadata.iloc[I[0]].copy()
-    results['score'] = D[0]
+    with stage("metadata"):
+        results = metadata.iloc[I[0]].copy()
+        results['score'] = D[0]
     
-    # Filter by minimum score and sort
-    results = results[results['score'] >= min_score]
-    results = results.sort_values('score', ascending=False)
+        # Filter by minimum score and sort
+        results = results[results['score'] >= min_score]
+        results = results.sort_values('score', ascending=False)
     
     return results.head(k)
     
@@ -66,11 +75,21 @@ def main():
     parser.add_argument("--model-dir", type=str, default="model_store",
                        help="directory with faiss.index, embeddings.npy, metadata.csv")
     parser.add_argument("-k", type=int, default=5, help="number of results per query")
+    parser.add_argument("--nprobe", type=int, help="IVF lists to visit (IVF/PQ indexes)")
+    parser.add_argument("--ef-search", type=int, help="HNSW search depth (HNSW indexes)")
+    parser.add_argument("--timings", action="store_true", help="print per-stage latency (encode/search/metadata)")
+    parser.add_argument("--metrics-out", type=str, help="write stage histograms in Prometheus text format")
+    parser.add_argument("--encoder-backend", type=str, default="torch", choices=ENCODER_BACKENDS,
+                        help="query encoder backend (see encoders.py)")
+    parser.add_argument("--encoder-threads", type=int, help="intra-op threads for the encoder")
+    parser.add_argument("--query-store", type=str, default=QUERY_STORE_DIR, help="precomputed query embeddings")
+    parser.add_argument("--no-query-store", action="store_true", help="encode every query")
     args = parser.parse_args()
 
     # load index and model
-    index, embeddings, metadata = load_index(args.model_dir)
-    model = SentenceTransformer(MODEL_NAME)
+    index, embeddings, metadata = load_index(args.model_dir, nprobe=args.nprobe, ef_search=args.ef_search)
+    model = stored_encoder(MODEL_NAME, backend=args.encoder_backend, threads=args.encoder_threads,
+                           store_dir=None if args.no_query_store else args.query_store)
     
     # get queries to run
     queries = []
@@ -93,5 +112,10 @@ def main():
             print(f"    {r['url']}")
         print("\n" + "-"*80 + "\n")
 
+    if args.timings:
+        print("Stage latency:\n" + stage_summary())
+    if args.metrics_out:
+        REGISTRY.write(args.metrics_out)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
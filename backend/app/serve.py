@@ -0,0 +1,119 @@
+"""serve.py
+
+Preforking launcher for the API. `uvicorn main:app --workers N` starts N fresh
+interpreters, each loading its own encoder, FAISS index, embeddings and
+metadata, so memory grows linearly with the worker count. This script loads
+the active model_store snapshot and the query encoder weights once, freezes
+the heap (gc.freeze) and then forks N uvicorn workers that accept on one
+shared socket. The read-only artifacts (model weights, index, embeddings,
+metadata arrays) stay shared copy-on-write; each worker only adds its own
+interpreter state, caches and request buffers.
+
+A worker that dies is replaced by a fresh fork of the preloaded parent.
+Hot reloads (/admin/reload, RECOMMEND_WATCH_INTERVAL) still work but happen per
+worker, so a reloaded snapshot is no longer shared until the server restarts
+(mmapped embeddings.npy stays shared through the page cache either way).
+
+The parent runs no forward pass or search and keeps torch / FAISS on one
+thread (OpenMP pools don't survive fork and would deadlock a worker's first
+request); each worker applies RECOMMEND_ENCODER_THREADS and runs the warm-up
+itself. Set RECOMMEND_ENCODER_THREADS so that workers x threads <= cores.
+
+Usage (from backend/):
+    python app/serve.py --workers 4 --port 8000
+Memory / throughput vs worker count: python app/bench_workers.py
+"""
+import os
+import sys
+import gc
+import time
+import signal
+import socket
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock, log_level):
+    import uvicorn
+    from app import main
+    main.after_fork()
+    # the parent's signal handlers must not leak into the worker; uvicorn installs its own
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    config = uvicorn.Config(app, log_level=log_level, timeout_keep_alive=30)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def spawn(app, sock, log_level) -> int:
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(app, sock, log_level)
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def serve(host="0.0.0.0", port=8000, workers=2, log_level="info"):
+    from app import main
+    t0 = time.perf_counter()
+    main.preload()
+    print(f"Preloaded snapshot {main.SNAPSHOT.version} and encoder weights in {time.perf_counter() - t0:.1f}s; "
+          f"forking {workers} workers on {host}:{port}", flush=True)
+    sock = bind_socket(host, port)
+    # objects created so far are never freed: keep the collector from touching (and un-sharing) their pages
+    gc.collect()
+    gc.freeze()
+
+    children = {spawn(main.app, sock, log_level) for _ in range(workers)}
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            print(f"Worker {pid} exited ({status}), starting a replacement", flush=True)
+            time.sleep(1)  # don't spin if workers crash on startup
+            children.add(spawn(main.app, sock, log_level))
+    sock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--log-level", type=str, default="info")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.workers, args.log_level)
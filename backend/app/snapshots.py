@@ -0,0 +1,227 @@
+"""snapshots.py
+
+Versioned model_store snapshots for zero-downtime reloads.
+
+Layout written by `build_index.py --snapshot`:
+    model_store/
+      snapshots/<version>/{faiss.index, embeddings.npy, metadata.csv, neighbors.npy, neighbor_sims.npy,
+                           lexical_index.npz, manifest.json}
+      CURRENT            <- name of the active snapshot (replaced atomically)
+A model_store without CURRENT is served as a single unversioned snapshot.
+
+manifest.json carries the embedding model name and, per artifact, its size, mtime and sha256
+(all computed at build time). load_snapshot() checks the model name and each artifact's
+size / mtime before the API swaps the snapshot in, so a reload or a catalog's first use
+doesn't read whole files just to hash them (and memory-mapped embeddings stay cold).
+The sha256 checksums are verified explicitly, e.g. after copying snapshots between hosts.
+
+Usage (from backend/app):
+    python snapshots.py model_store                 # verify the checksums of the CURRENT snapshot
+    python snapshots.py model_store --all           # ... of every snapshot
+    python snapshots.py catalogs/eu --version <v>
+"""
+import os
+import json
+import time
+import hashlib
+import secrets
+import argparse
+from dataclasses import dataclass, field
+from typing import Optional
+
+try:
+    from .index_backends import load_index
+    from .metadata_store import MetadataStore
+    from .neighbor_graph import NEIGHBORS_FILE, NEIGHBOR_SIMS_FILE, NeighborGraph
+    from .lexical_index import LEXICAL_FILE, LexicalIndex
+except ImportError:  # imported from a script run inside backend/app
+    from index_backends import load_index
+    from metadata_store import MetadataStore
+    from neighbor_graph import NEIGHBORS_FILE, NEIGHBOR_SIMS_FILE, NeighborGraph
+    from lexical_index import LEXICAL_FILE, LexicalIndex
+
+SNAPSHOT_DIR = "snapshots"
+CURRENT_FILE = "CURRENT"
+MANIFEST_FILE = "manifest.json"
+ARTIFACTS = ("faiss.index", "embeddings.npy", "embeddings_scale.npy", "metadata.csv",
+             NEIGHBORS_FILE, NEIGHBOR_SIMS_FILE, LEXICAL_FILE)
+
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def artifact_checksums(snapshot_dir: str) -> dict:
+    return {name: file_sha256(os.path.join(snapshot_dir, name))
+            for name in ARTIFACTS if os.path.exists(os.path.join(snapshot_dir, name))}
+
+
+def artifact_stats(snapshot_dir: str) -> dict:
+    """{artifact: {"size", "mtime_ns"}}: what load_snapshot compares instead of hashing."""
+    stats = {}
+    for name in ARTIFACTS:
+        path = os.path.join(snapshot_dir, name)
+        if os.path.exists(path):
+            st = os.stat(path)
+            stats[name] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    return stats
+
+
+def new_version() -> str:
+    """Sortable, unique per build: UTC time to the microsecond plus a random suffix."""
+    now = time.time()
+    return time.strftime("%Y%m%dT%H%M%S", time.gmtime(now)) + f"-{int(now % 1 * 1e6):06d}-{secrets.token_hex(3)}"
+
+
+def resolve_current(model_store: str, version: Optional[str] = None) -> str:
+    """Folder of the requested (or active) snapshot; the model_store itself when unversioned."""
+    if version is None:
+        pointer = os.path.join(model_store, CURRENT_FILE)
+        if not os.path.exists(pointer):
+            return model_store
+        with open(pointer) as f:
+            version = f.read().strip()
+    # one folder name under snapshots/, never ".." or an absolute / nested path
+    if not version or version.startswith(".") or os.path.basename(version) != version:
+        raise ValueError(f"Invalid snapshot version: {version!r}")
+    path = os.path.join(model_store, SNAPSHOT_DIR, version)
+    if not os.path.isdir(path):
+        raise FileNotFoundError(f"Snapshot {version!r} not found")
+    return path
+
+
+def set_current(model_store: str, version: str):
+    pointer = os.path.join(model_store, CURRENT_FILE)
+    tmp = pointer + ".tmp"
+    with open(tmp, "w") as f:
+        f.write(version + "\n")
+    os.replace(tmp, pointer)
+
+
+def read_manifest(snapshot_dir: str) -> dict:
+    path = os.path.join(snapshot_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _check_model(snapshot_dir: str, manifest: dict, model_name: Optional[str]):
+    if model_name and manifest.get("model_name") and manifest["model_name"] != model_name:
+        raise ValueError(f"Snapshot {snapshot_dir} was built with {manifest['model_name']!r}, "
+                         f"the API encodes queries with {model_name!r}")
+
+
+def check_snapshot(snapshot_dir: str, model_name: Optional[str] = None) -> dict:
+    """
+    Cheap load-time check: embedding model, and every artifact the manifest lists exists with
+    the recorded size and mtime (no file contents are read). A file whose size matches but
+    whose mtime doesn't (copied without preserving times) is hashed against its checksum
+    instead. Returns the manifest.
+    """
+    manifest = read_manifest(snapshot_dir)
+    _check_model(snapshot_dir, manifest, model_name)
+    recorded = manifest.get("artifacts", {})
+    checksums = manifest.get("checksums", {})
+    for name in set(recorded) | set(checksums):
+        path = os.path.join(snapshot_dir, name)
+        if not os.path.exists(path):
+            raise ValueError(f"Snapshot {snapshot_dir} is missing {name}")
+        if name not in recorded:
+            continue
+        st = os.stat(path)
+        if st.st_size == recorded[name]["size"] and st.st_mtime_ns == recorded[name]["mtime_ns"]:
+            continue
+        if st.st_size != recorded[name]["size"] or name not in checksums or file_sha256(path) != checksums[name]:
+            raise ValueError(f"{name} in {snapshot_dir} changed after the build")
+    return manifest
+
+
+def verify_snapshot(snapshot_dir: str, model_name: Optional[str] = None) -> dict:
+    """Full check: embedding model and the sha256 of every artifact (reads every file); returns the manifest."""
+    manifest = read_manifest(snapshot_dir)
+    _check_model(snapshot_dir, manifest, model_name)
+    for name, expected in manifest.get("checksums", {}).items():
+        path = os.path.join(snapshot_dir, name)
+        if not os.path.exists(path):
+            raise ValueError(f"Snapshot {snapshot_dir} is missing {name}")
+        if file_sha256(path) != expected:
+            raise ValueError(f"Checksum mismatch for {name} in {snapshot_dir}")
+    return manifest
+
+
+def rss_bytes() -> int:
+    """Current resident set size of this process (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+@dataclass
+class ModelSnapshot:
+    """Everything a request needs from one model_store version; immutable once loaded."""
+    version: str
+    path: str
+    index: object
+    metadata: MetadataStore
+    embeddings: object
+    manifest: dict = field(default_factory=dict)
+    load_seconds: float = 0.0
+    loaded_at: float = 0.0
+    neighbors: Optional[NeighborGraph] = None  # MMR similarity graph, if the build wrote one
+    lexical: Optional[LexicalIndex] = None  # BM25 index for lexical / hybrid retrieval, if the build wrote one
+
+
+def load_snapshot(snapshot_dir: str, model_name: Optional[str] = None, mmap: bool = True,
+                  nprobe: Optional[int] = None, ef_search: Optional[int] = None, verify: bool = True,
+                  checksums: bool = False) -> ModelSnapshot:
+    """verify: check_snapshot before loading; checksums: verify_snapshot instead (hashes every artifact)."""
+    t0 = time.perf_counter()
+    if checksums:
+        manifest = verify_snapshot(snapshot_dir, model_name)
+    else:
+        manifest = check_snapshot(snapshot_dir, model_name) if verify else read_manifest(snapshot_dir)
+    index, embeddings = load_index(snapshot_dir, mmap=mmap, nprobe=nprobe, ef_search=ef_search)
+    metadata = MetadataStore.from_csv(os.path.join(snapshot_dir, "metadata.csv"))
+    if index.ntotal != len(metadata):
+        raise ValueError(f"Snapshot {snapshot_dir}: index has {index.ntotal} vectors but metadata has {len(metadata)} rows")
+    neighbors = NeighborGraph.load(snapshot_dir, mmap=mmap)
+    if neighbors is not None and len(neighbors) != index.ntotal:
+        raise ValueError(f"Snapshot {snapshot_dir}: neighbor graph has {len(neighbors)} rows, index has {index.ntotal}")
+    lexical = LexicalIndex.load(snapshot_dir)
+    if lexical is not None and len(lexical) != index.ntotal:
+        raise ValueError(f"Snapshot {snapshot_dir}: lexical index has {len(lexical)} rows, index has {index.ntotal}")
+    version = manifest.get("version") or os.path.basename(os.path.normpath(snapshot_dir))
+    return ModelSnapshot(version, snapshot_dir, index, metadata, embeddings, manifest,
+                         load_seconds=time.perf_counter() - t0, loaded_at=time.time(), neighbors=neighbors,
+                         lexical=lexical)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("model_store", help="model_store (or catalog) folder")
+    parser.add_argument("--version", type=str, help="snapshot to verify (default: CURRENT)")
+    parser.add_argument("--all", action="store_true", help="verify every snapshot under snapshots/")
+    parser.add_argument("--model-name", type=str, help="also require this embedding model")
+    args = parser.parse_args()
+    if args.all:
+        root = os.path.join(args.model_store, SNAPSHOT_DIR)
+        dirs = [os.path.join(root, v) for v in sorted(os.listdir(root)) if os.path.isdir(os.path.join(root, v))]
+    else:
+        dirs = [resolve_current(args.model_store, args.version)]
+    failed = 0
+    for path in dirs:
+        try:
+            manifest = verify_snapshot(path, args.model_name)
+            print(f"OK    {path} ({len(manifest.get('checksums', {}))} checksums)")
+        except ValueError as e:
+            failed += 1
+            print(f"FAIL  {path}: {e}")
+    raise SystemExit(1 if failed else 0)
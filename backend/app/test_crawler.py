@@ -0,0 +1,138 @@
+"""test_crawler.py
+
+Crawls a local stand-in for the SHL product catalog (fixtures/catalog_site, served with
+http.server) through build_index.crawl_shl_catalog, twice:
+- first run: every page is downloaded (one detail page answers 503 once, so it only
+  succeeds through the crawler's retry / backoff)
+- second run: every page is revalidated from the page cache and answered with 304,
+  and the written catalog CSV is identical
+once with ETag validators and once with Last-Modified only. It also checks that the
+pooled session reuses keep-alive connections instead of opening one per page.
+
+Usage (from backend/app):
+    python test_crawler.py
+    python -m pytest test_crawler.py
+"""
+import os
+import sys
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from build_index import crawl_shl_catalog  # noqa: E402
+
+FIXTURE_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "catalog_site")
+CATALOG_PATH = "/solutions/products/product-catalog/"
+FLAKY_PATH = CATALOG_PATH + "view/sql-server/"
+
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    """Static files with ETag / Last-Modified validators and 304s; logs every response."""
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse is observable
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, directory=FIXTURE_ROOT, **kwargs)
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def send_response(self, code, message=None):
+        with self.server.lock:
+            self.server.responses.append((self.path, code))
+        super().send_response(code, message)
+
+    def send_head(self):
+        with self.server.lock:
+            fail = self.path in self.server.fail_once
+            self.server.fail_once.discard(self.path)
+        if fail:
+            self.send_error(503, "Temporarily unavailable")
+            return None
+        self._etag = None
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            path = os.path.join(path, "index.html")
+        if self.server.etags and os.path.isfile(path):
+            with open(path, "rb") as f:
+                self._etag = '"' + hashlib.sha256(f.read()).hexdigest()[:16] + '"'
+            if self.headers.get("If-None-Match") == self._etag:
+                self.send_response(304)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return None
+        # without If-None-Match, SimpleHTTPRequestHandler answers If-Modified-Since with 304 itself
+        return super().send_head()
+
+    def end_headers(self):
+        if getattr(self, "_etag", None):
+            self.send_header("ETag", self._etag)
+        super().end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve_fixture(etags: bool = True, fail_once=()):
+    """Base catalog URL of the fixture site served on a free localhost port."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    server.daemon_threads = True
+    server.etags = etags
+    server.fail_once = set(fail_once)
+    server.responses = []
+    server.connections = 0
+    server.lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server, f"http://127.0.0.1:{server.server_address[1]}{CATALOG_PATH}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def crawl_twice(etags: bool):
+    with tempfile.TemporaryDirectory() as tmp, serve_fixture(etags=etags, fail_once=[FLAKY_PATH]) as (server, url):
+        cache_dir = os.path.join(tmp, "page_cache")
+        first_csv, second_csv = os.path.join(tmp, "first.csv"), os.path.join(tmp, "second.csv")
+
+        crawl_shl_catalog(first_csv, base_url=url, cache_dir=cache_dir, max_workers=2)
+        first = list(server.responses)
+        connections = server.connections
+        server.responses.clear()
+        crawl_shl_catalog(second_csv, base_url=url, cache_dir=cache_dir, max_workers=2)
+        second = list(server.responses)
+
+        # 1 catalog page + 3 product pages; the flaky one is retried after its 503
+        assert (FLAKY_PATH, 503) in first
+        assert sorted(p for p, code in first if code == 200) == sorted(
+            [CATALOG_PATH, CATALOG_PATH + "view/core-java/", FLAKY_PATH, CATALOG_PATH + "view/verify-numerical/"])
+        assert len(first) == 5
+        # keep-alive pool: far fewer connections than requests (<= 1 for the catalog + one per worker)
+        assert connections <= 3, connections
+        # second run: nothing downloaded again
+        assert len(second) == 4 and all(code == 304 for _, code in second), second
+        with open(first_csv, "rb") as a, open(second_csv, "rb") as b:
+            first_rows, second_rows = a.read(), b.read()
+        assert first_rows == second_rows
+        assert first_rows.count(b"\n") == 4  # header + 3 products
+        assert b"Core Java (Entry Level)" in first_rows
+
+
+def test_crawl_revalidates_with_etag():
+    crawl_twice(etags=True)
+
+
+def test_crawl_revalidates_with_last_modified():
+    crawl_twice(etags=False)
+
+
+if __name__ == "__main__":
+    test_crawl_revalidates_with_etag()
+    test_crawl_revalidates_with_last_modified()
+    print("crawler tests passed")
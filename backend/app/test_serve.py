@@ -0,0 +1,122 @@
+"""test_serve.py
+
+Preforking with multithreaded torch and FAISS (RECOMMEND_ENCODER_THREADS=2,
+OMP_NUM_THREADS=2). A thread pool started in the parent before fork() deadlocks
+the worker's first encode / search, so
+- fork check: main.preload() must leave the parent single-threaded; a forked
+  child then restores 2 threads (main.after_fork), runs the warm-up plus a
+  matmul and a batched FAISS search large enough to start both thread pools
+  whatever the model size, and answers one /recommend through TestClient
+- serve.py: the launcher's worker becomes ready and answers /recommend
+Both fail with a timeout rather than hang if the fork deadlocks.
+
+Needs the model_store and the encoder (runs in the current directory with the
+current RECOMMEND_* environment, like the API).
+
+Usage (from backend/app):
+    python test_serve.py
+    python -m pytest test_serve.py
+"""
+import os
+import sys
+import time
+import subprocess
+import httpx
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_workers import HERE, BACKEND, free_port  # noqa: E402
+
+READY_TIMEOUT = 300
+REQUEST_TIMEOUT = 60
+THREADED_ENV = {"RECOMMEND_ENCODER_THREADS": "2", "OMP_NUM_THREADS": "2"}
+
+
+def fork_check():
+    """Runs in its own interpreter (see test_worker_runs_after_fork); exit code 0 = pass."""
+    import faiss
+    import torch
+    from fastapi.testclient import TestClient
+    from app import main
+
+    main.preload()
+    assert torch.get_num_threads() == 1 and faiss.omp_get_max_threads() == 1, "parent must stay single-threaded"
+    assert main.EMBEDDER.loaded and main.SNAPSHOT is not None
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            main.after_fork()
+            assert torch.get_num_threads() == 2 and faiss.omp_get_max_threads() == 2
+            main.warmup()
+            a = torch.randn(300, 300)
+            a @ a
+            q = np.random.rand(256, main.SNAPSHOT.index.d).astype("float32")
+            main.SNAPSHOT.index.search(q, 5)
+            r = TestClient(main.app).post("/recommend", json={"query": "SQL and data analysis", "k": 5})
+            assert r.status_code == 200 and r.json()["recommendations"], r.text
+            code = 0
+        finally:
+            os._exit(code)
+    deadline = time.perf_counter() + REQUEST_TIMEOUT
+    while time.perf_counter() < deadline:
+        done, status = os.waitpid(pid, os.WNOHANG)
+        if done:
+            sys.exit(os.waitstatus_to_exitcode(status))
+        time.sleep(0.1)
+    os.kill(pid, 9)
+    sys.exit("forked worker hung")
+
+
+def test_worker_runs_after_fork():
+    env = dict(os.environ, **THREADED_ENV, RECOMMEND_QUERY_STORE="off",
+               PYTHONPATH=BACKEND + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    r = subprocess.run([sys.executable, os.path.abspath(__file__), "fork-check"], env=env,
+                       capture_output=True, text=True, timeout=READY_TIMEOUT)
+    assert r.returncode == 0, r.stderr[-2000:]
+
+
+def start_server(port, workers=1):
+    env = dict(os.environ, **THREADED_ENV, RECOMMEND_WARMUP="sync",
+               RECOMMEND_RESPONSE_CACHE_SIZE="0", RECOMMEND_EMBEDDING_CACHE_SIZE="0", RECOMMEND_QUERY_STORE="off",
+               PYTHONPATH=BACKEND + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    cmd = [sys.executable, os.path.join(HERE, "serve.py"), "--workers", str(workers), "--port", str(port),
+           "--host", "127.0.0.1", "--log-level", "warning"]
+    return subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def test_worker_serves_after_multithreaded_preload():
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    proc = start_server(port)
+    try:
+        t0 = time.perf_counter()
+        while True:
+            assert proc.poll() is None, "server exited during startup"
+            assert time.perf_counter() - t0 < READY_TIMEOUT, "worker never became ready"
+            try:
+                if httpx.get(base + "/health/ready", timeout=2).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        # the warm-up already ran in the worker; these encode + search on its 2-thread pools
+        for query in ("Java developer who collaborates with business teams", "SQL and data analysis"):
+            r = httpx.post(base + "/recommend", json={"query": query, "k": 5}, timeout=REQUEST_TIMEOUT)
+            assert r.status_code == 200, r.text
+            assert r.json()["recommendations"]
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["fork-check"]:
+        fork_check()
+        sys.exit(0)
+    test_worker_runs_after_fork()
+    test_worker_serves_after_multithreaded_preload()
+    print("serve tests passed")
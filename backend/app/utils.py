@@ -72,3 +72,59 @@ def balance_by_type(df_results: pd.DataFrame, k:int):
                 break
         i += 1
     return pd.DataFrame(out)[:k]
+
+def balance_by_type_idx(type_codes: np.ndarray, scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Index-array equivalent of balance_by_type (same round-robin, same output order).
+    type_codes: int code per candidate, ordered like the sorted test_type values;
+    -1 marks a missing type (dropped, like NaN keys in groupby).
+    Returns positions into the candidate arrays.
+    """
+    pos = np.flatnonzero(type_codes >= 0)
+    if pos.size == 0:
+        return pos
+    # group by type code, best score first within each group
+    order = pos[np.lexsort((-scores[pos], type_codes[pos]))]
+    _, starts, counts = np.unique(type_codes[order], return_index=True, return_counts=True)
+    taken = np.zeros(len(starts), dtype=np.intp)
+    type_keys = list(range(len(starts)))
+    out = []
+    i = 0
+    while len(out) < k:
+        if not type_keys:
+            break
+        t = type_keys[i % len(type_keys)]
+        if taken[t] < counts[t]:
+            out.append(order[starts[t] + taken[t]])
+            taken[t] += 1
+        else:
+            # remove exhausted type
+            type_keys.remove(t)
+            if not type_keys:
+                break
+        i += 1
+    return np.asarray(out, dtype=np.intp)
+
+def mmr_select(similar, scores: np.ndarray, k: int, lam: float = 0.7) -> np.ndarray:
+    """
+    Maximal marginal relevance: repeatedly pick the candidate maximizing
+    lam * score - (1 - lam) * (max similarity to the candidates already picked).
+    similar: fn(position) -> (positions, similarities) of the candidates similar to that one
+    (sparse, e.g. NeighborGraph.pool_similarity; unlisted pairs count as 0), only called for
+    the k picked ones. lam=1 is plain top-k by score, lower values trade relevance for diversity.
+    Returns positions into the candidate arrays, in pick order.
+    """
+    k = min(k, len(scores))
+    gain = lam * np.asarray(scores, dtype=np.float32)
+    redundancy = np.zeros(len(gain), dtype=np.float32)
+    picked = np.empty(k, dtype=np.intp)
+    for i in range(k):
+        j = int(np.argmax(gain))
+        picked[i] = j
+        gain[j] = -np.inf
+        # only the picked candidate's neighbors get more redundant
+        pos, sim = similar(j)
+        grown = np.maximum(sim - redundancy[pos], 0)
+        redundancy[pos] += grown
+        gain[pos] -= (1 - lam) * grown
+    return picked